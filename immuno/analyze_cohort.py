@@ -33,10 +33,11 @@ Example usage:
 
 import argparse
 import logging
-from os import listdir
+from os import listdir, getpid, rename
 from os.path import join, split, splitext, isfile, abspath
 import traceback
 from collections import OrderedDict
+from itertools import izip
 
 import pandas as pd
 import numpy as np
@@ -44,7 +45,8 @@ import numpy as np
 from common import (init_logging, splitext_permissive, find_paths)
 from immunogenicity import ImmunogenicityPredictor
 from load_file import (
-    load_file, maf_to_vcf, expand_transcripts, load_variants
+    load_file, maf_to_vcf, expand_transcripts, load_variants,
+    load_transcript_whitelist, preload_reference_data
 )
 from maf import load_maf, get_patient_id, is_valid_tcga
 from mhc_common import normalize_hla_allele_name
@@ -52,6 +54,7 @@ from hla_file import read_hla_file
 from mhc_netmhcpan import PanBindingPredictor
 from mhc_netmhccons import ConsensusBindingPredictor
 from mutation_report import print_mutation_report
+from worker_pool import PreloadedWorkerPool
 
 parser = argparse.ArgumentParser()
 group = parser.add_mutually_exclusive_group(required=True)
@@ -113,6 +116,23 @@ parser.add_argument("--netmhc-cons",
     action="store_true",
     help="Use local NetMHCcons binding predictor (otherwise use NetMHCpan)")
 
+parser.add_argument("--canonical-transcripts",
+    default=False,
+    action="store_true",
+    help="Only apply variants to the canonical transcript of each gene")
+
+parser.add_argument("--transcript-whitelist",
+    type=str,
+    default=None,
+    help=("File with one Ensembl transcript ID per line, "
+          "only apply variants to these transcripts"))
+
+parser.add_argument("--workers",
+    type=int,
+    default=1,
+    help=("Number of patients to process in parallel, in worker processes "
+          "which share the reference data loaded before they're forked"))
+
 parser.add_argument("--resume",
     default=False,
     action="store_true",
@@ -216,13 +236,154 @@ def read_gene_exp_file(path, permissive_parsing):
     gene_exp_df = gene_exp_df[gene_exp_df[count_col] > 0]
     return set(gene_exp_df[gene_col].tolist())
 
+def count_patient_mutations(
+        patient_id,
+        vcf_df,
+        hla_allele_names,
+        max_peptide_length=31,
+        canonical_only=False,
+        transcript_whitelist=None,
+        scored_epitopes_path="scored_epitopes.csv",
+        patient_number=1,
+        n_patients=1,
+        binding_threshold=500,
+        netmhc_cons=False,
+        debug_scored_epitopes_csv=None,
+        quiet=False):
+    """
+    Returns the tuple of six counts described in generate_mutation_counts
+    for a single patient.
+    """
+    logging.info(
+        "Processing %s (#%d/%d) with HLA alleles %s",
+        patient_id, patient_number, n_patients, hla_allele_names)
+
+    if not quiet:
+        print vcf_df
+
+    try:
+        transcripts_df, raw_genomic_mutation_df, variant_report = (
+            expand_transcripts(
+                vcf_df,
+                patient_id,
+                max_peptide_length=max_peptide_length,
+                canonical_only=canonical_only,
+                transcript_whitelist=transcript_whitelist))
+    except KeyboardInterrupt:
+        raise
+    except:
+        logging.warning("Failed to apply mutations for %s", patient_id)
+        raise
+
+    # print each genetic mutation applied to each possible transcript
+    # and either why it failed or what protein mutation resulted
+    if not quiet:
+        print_mutation_report(
+            patient_id,
+            variant_report,
+            raw_genomic_mutation_df,
+            transcripts_df)
+        logging.info(
+            "Calling MHC binding predictor for %s (#%d/%d)",
+            patient_id, patient_number, n_patients)
+
+    def make_mhc_predictor():
+        if netmhc_cons:
+            return ConsensusBindingPredictor(hla_allele_names)
+        else:
+            return PanBindingPredictor(hla_allele_names)
+
+    # If we want to read scored_epitopes from a CSV file, do that.
+    if debug_scored_epitopes_csv:
+        csv_file = debug_scored_epitopes_csv
+        if isfile(csv_file):
+            scored_epitopes = pd.read_csv(csv_file)
+        else:
+            mhc = make_mhc_predictor()
+            scored_epitopes = mhc.predict(transcripts_df,
+                    mutation_window_size=9)
+            scored_epitopes.to_csv(csv_file)
+    else:
+        mhc = make_mhc_predictor()
+        scored_epitopes = mhc.predict(transcripts_df,
+                mutation_window_size=9)
+
+    if not quiet:
+        print scored_epitopes
+
+    imm = ImmunogenicityPredictor(
+        alleles=hla_allele_names,
+        binding_threshold=binding_threshold)
+    scored_epitopes = imm.predict(scored_epitopes)
+    # each process writes its own temporary file, so that patients handled
+    # at the same time by worker processes never read each other's
+    # epitopes, and then replaces scored_epitopes_path with it
+    tmp_path = "%s.%d.tmp" % (scored_epitopes_path, getpid())
+    scored_epitopes.to_csv(tmp_path)
+    scored_epitopes = pd.read_csv(tmp_path)
+    rename(tmp_path, scored_epitopes_path)
+
+    grouped = scored_epitopes.groupby(["Gene", "GeneMutationInfo"])
+    n_coding_mutations = len(grouped)
+    n_epitopes = 0
+    n_ligand_mutations = 0
+    n_ligands = 0
+    n_immunogenic_mutations = 0
+    n_immunogenic_epitopes = 0
+    for (gene, mut), group in grouped:
+        start_mask = group.EpitopeStart < group.MutationEnd
+        stop_mask = group.EpitopeEnd > group.MutationStart
+        mutated_subset = group[start_mask & stop_mask]
+        # we might have duplicate epitopes from multiple transcripts, so
+        # drop them
+        n_curr_epitopes = len(mutated_subset.groupby(['Epitope']))
+        n_epitopes += n_curr_epitopes
+        below_threshold_mask = \
+            mutated_subset.MHC_IC50 <= binding_threshold
+        ligands = mutated_subset[below_threshold_mask]
+        n_curr_ligands = len(ligands.groupby(['Epitope']))
+        n_ligands += n_curr_ligands
+        n_ligand_mutations += (n_curr_ligands) > 0
+        thymic_deletion_mask = \
+            np.array(ligands.ThymicDeletion).astype(bool)
+        immunogenic_epitopes = ligands[~thymic_deletion_mask]
+        curr_immunogenic_epitopes = immunogenic_epitopes.groupby(['Epitope']).first()
+        n_immunogenic_epitopes += len(curr_immunogenic_epitopes)
+        n_immunogenic_mutations += len(curr_immunogenic_epitopes) > 0
+        logging.info(("%s %s: epitopes %s, ligands %d, imm %d"),
+                     gene,
+                     mut,
+                     n_curr_epitopes,
+                     n_curr_ligands,
+                     len(curr_immunogenic_epitopes),
+                    )
+    result_tuple = (
+        n_coding_mutations,
+        n_epitopes,
+        n_ligand_mutations,
+        n_ligands,
+        n_immunogenic_mutations,
+        n_immunogenic_epitopes,
+    )
+    return result_tuple
+
+def _count_patient_mutations_in_worker(kwargs):
+    return count_patient_mutations(**kwargs)
+
 def generate_mutation_counts(
         mutation_files,
         hla_types,
         genes_expressed,
         max_peptide_length=31,
         skip_identifiers = {},
-        output_file=None):
+        output_file=None,
+        canonical_only=False,
+        transcript_whitelist=None,
+        worker_pool=None,
+        binding_threshold=500,
+        netmhc_cons=False,
+        debug_scored_epitopes_csv=None,
+        quiet=False):
     """
     Returns dictionary that maps each patient ID to a tuple with six fields:
         - total number of mutated epitopes across all transcripts
@@ -234,118 +395,43 @@ def generate_mutation_counts(
           epitope
         - number of mutated epitopes which are predicted to be immunogenic
           (MHC binder + non-self)
+
+    If a worker_pool is given then patients are processed in its worker
+    processes.
     """
-    mutation_counts = OrderedDict()
+    jobs = []
     n = len(mutation_files)
     for i, (patient_id, vcf_df) in enumerate(mutation_files.iteritems()):
         if patient_id in skip_identifiers:
             logging.info("Skipping patient ID %s", patient_id)
             continue
-        hla_allele_names = hla_types[patient_id]
-        logging.info(
-            "Processing %s (#%d/%d) with HLA alleles %s",
-            patient_id, i + 1, n, hla_allele_names)
-
-        if not args.quiet:
-            print vcf_df
-
-        try:
-            transcripts_df, raw_genomic_mutation_df, variant_report = (
-                expand_transcripts(
-                    vcf_df,
-                    patient_id,
-                    max_peptide_length=max_peptide_length))
-        except KeyboardInterrupt:
-            raise
-        except:
-            logging.warning("Failed to apply mutations for %s", patient_id)
-            raise
-
-        # print each genetic mutation applied to each possible transcript
-        # and either why it failed or what protein mutation resulted
-        if not args.quiet:
-            print_mutation_report(
-                patient_id,
-                variant_report,
-                raw_genomic_mutation_df,
-                transcripts_df)
-            logging.info(
-                "Calling MHC binding predictor for %s (#%d/%d)",
-                patient_id, i + 1, n)
-
-        def make_mhc_predictor():
-            if args.netmhc_cons:
-                return ConsensusBindingPredictor(hla_allele_names)
-            else:
-                return PanBindingPredictor(hla_allele_names)
-
-        # If we want to read scored_epitopes from a CSV file, do that.
-        if args.debug_scored_epitopes_csv:
-            csv_file = args.debug_scored_epitopes_csv
-            if isfile(csv_file):
-                scored_epitopes = pd.read_csv(csv_file)
-            else:
-                mhc = make_mhc_predictor()
-                scored_epitopes = mhc.predict(transcripts_df,
-                        mutation_window_size=9)
-                scored_epitopes.to_csv(csv_file)
-        else:
-            mhc = make_mhc_predictor()
-            scored_epitopes = mhc.predict(transcripts_df,
-                    mutation_window_size=9)
+        job = dict(
+            patient_id=patient_id,
+            vcf_df=vcf_df,
+            hla_allele_names=hla_types[patient_id],
+            patient_number=i + 1,
+            n_patients=n,
+            max_peptide_length=max_peptide_length,
+            canonical_only=canonical_only,
+            transcript_whitelist=transcript_whitelist,
+            binding_threshold=binding_threshold,
+            netmhc_cons=netmhc_cons,
+            debug_scored_epitopes_csv=debug_scored_epitopes_csv,
+            quiet=quiet)
+        jobs.append(job)
+
+    if worker_pool is None:
+        results = (count_patient_mutations(**job) for job in jobs)
+    else:
+        results = worker_pool.imap(_count_patient_mutations_in_worker, jobs)
 
-        if not args.quiet:
-            print scored_epitopes
-
-        imm = ImmunogenicityPredictor(
-            alleles=hla_allele_names,
-            binding_threshold=args.binding_threshold)
-        scored_epitopes = imm.predict(scored_epitopes)
-        scored_epitopes.to_csv("scored_epitopes.csv")
-        scored_epitopes = pd.read_csv("scored_epitopes.csv")
-
-        grouped = scored_epitopes.groupby(["Gene", "GeneMutationInfo"])
-        n_coding_mutations = len(grouped)
-        n_epitopes = 0
-        n_ligand_mutations = 0
-        n_ligands = 0
-        n_immunogenic_mutations = 0
-        n_immunogenic_epitopes = 0
-        for (gene, mut), group in grouped:
-            start_mask = group.EpitopeStart < group.MutationEnd
-            stop_mask = group.EpitopeEnd > group.MutationStart
-            mutated_subset = group[start_mask & stop_mask]
-            # we might have duplicate epitopes from multiple transcripts, so
-            # drop them
-            n_curr_epitopes = len(mutated_subset.groupby(['Epitope']))
-            n_epitopes += n_curr_epitopes
-            below_threshold_mask = \
-                mutated_subset.MHC_IC50 <= args.binding_threshold
-            ligands = mutated_subset[below_threshold_mask]
-            n_curr_ligands = len(ligands.groupby(['Epitope']))
-            n_ligands += n_curr_ligands
-            n_ligand_mutations += (n_curr_ligands) > 0
-            thymic_deletion_mask = \
-                np.array(ligands.ThymicDeletion).astype(bool)
-            immunogenic_epitopes = ligands[~thymic_deletion_mask]
-            curr_immunogenic_epitopes = immunogenic_epitopes.groupby(['Epitope']).first()
-            n_immunogenic_epitopes += len(curr_immunogenic_epitopes)
-            n_immunogenic_mutations += len(curr_immunogenic_epitopes) > 0
-            logging.info(("%s %s: epitopes %s, ligands %d, imm %d"),
-                         gene,
-                         mut,
-                         n_curr_epitopes,
-                         n_curr_ligands,
-                         len(curr_immunogenic_epitopes),
-                        )
-        result_tuple = (
-            n_coding_mutations,
-            n_epitopes,
-            n_ligand_mutations,
-            n_ligands,
-            n_immunogenic_mutations,
-            n_immunogenic_epitopes,
-        )
+    mutation_counts = OrderedDict()
+    # izip so that each patient's row gets written as soon as it's done,
+    # which --resume relies on after a crash
+    for job, result_tuple in izip(jobs, results):
+        patient_id = job['patient_id']
+        logging.info(
+            "Finished %s (#%d/%d)", patient_id, job['patient_number'], n)
         if output_file:
             data_string = ",".join(str(d) for d in result_tuple)
             output_file.write("%s,%s\n" % (patient_id, data_string))
@@ -398,6 +484,26 @@ if __name__ == "__main__":
     for patient_id in missing:
         del mutation_files[patient_id]
 
+    if args.transcript_whitelist:
+        transcript_whitelist = load_transcript_whitelist(
+            args.transcript_whitelist)
+    else:
+        transcript_whitelist = None
+
+    if args.workers > 1:
+        all_alleles = set([])
+        for alleles in hla_types.itervalues():
+            all_alleles.update(alleles)
+
+        def preload():
+            preload_reference_data()
+            # loads the thymic peptide sets of every allele
+            ImmunogenicityPredictor(alleles=all_alleles)
+
+        worker_pool = PreloadedWorkerPool(args.workers, preload = preload)
+    else:
+        worker_pool = None
+
     if args.resume:
         with open(args.output, 'r') as f:
             lines = [l for l in f.read().split("\n") if len(l) > 0]
@@ -422,7 +528,17 @@ if __name__ == "__main__":
         hla_types,
         genes_expressed,
         skip_identifiers = finished_identifiers,
-        output_file=output_file)
+        output_file=output_file,
+        canonical_only=args.canonical_transcripts,
+        transcript_whitelist=transcript_whitelist,
+        worker_pool=worker_pool,
+        binding_threshold=args.binding_threshold,
+        netmhc_cons=args.netmhc_cons,
+        debug_scored_epitopes_csv=args.debug_scored_epitopes_csv,
+        quiet=args.quiet)
+
+    if worker_pool is not None:
+        worker_pool.close()
 
     output_file.close()
 
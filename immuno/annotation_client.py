@@ -0,0 +1,113 @@
+# Copyright (c) 2014. Mount Sinai School of Medicine
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Client side of the annotation server (see annotation_server.py), which
+keeps the Ensembl annotation tables and reference sequences loaded in a
+long-lived process and expands variants on behalf of short-lived ones.
+
+Messages are pickled Python objects, each preceded by its length as an
+8 byte unsigned integer.
+"""
+
+import cPickle as pickle
+import logging
+from os import environ
+import socket
+import struct
+
+# if this environment variable holds the path of a server's Unix socket,
+# expand_transcripts sends its work there instead of loading the reference
+# data into the calling process
+ANNOTATION_SERVER_ENV = "IMMUNO_ANNOTATION_SERVER"
+
+_HEADER = struct.Struct("!Q")
+
+class AnnotationServerError(Exception):
+    """
+    Raised in the client when the server fails to handle a request
+    """
+    pass
+
+def _recv_exactly(sock, n_bytes):
+    chunks = []
+    while n_bytes > 0:
+        chunk = sock.recv(min(n_bytes, 2 ** 20))
+        if not chunk:
+            raise EOFError("Connection closed with %d bytes unread" % n_bytes)
+        chunks.append(chunk)
+        n_bytes -= len(chunk)
+    return "".join(chunks)
+
+def send_message(sock, obj):
+    data = pickle.dumps(obj, pickle.HIGHEST_PROTOCOL)
+    sock.sendall(_HEADER.pack(len(data)) + data)
+
+def recv_message(sock):
+    (n_bytes,) = _HEADER.unpack(_recv_exactly(sock, _HEADER.size))
+    return pickle.loads(_recv_exactly(sock, n_bytes))
+
+def default_server_path():
+    """
+    Socket path of the annotation server from the environment, or None
+    """
+    return environ.get(ANNOTATION_SERVER_ENV) or None
+
+class AnnotationClient(object):
+    """
+    Sends requests to an annotation server listening on a Unix socket,
+    opening a new connection for each request.
+    """
+
+    def __init__(self, socket_path):
+        self.socket_path = socket_path
+
+    def _connect(self):
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            sock.connect(self.socket_path)
+        except:
+            sock.close()
+            raise
+        return sock
+
+    def is_available(self):
+        try:
+            self._connect().close()
+            return True
+        except socket.error:
+            return False
+
+    def call(self, command, *args, **kwargs):
+        """
+        Run `command` on the server and return its result. Raises
+        socket.error if the server can't be reached and AnnotationServerError
+        if the command fails on the server.
+        """
+        sock = self._connect()
+        try:
+            send_message(sock, (command, args, kwargs))
+            status, result = recv_message(sock)
+        finally:
+            sock.close()
+        if status != "ok":
+            raise AnnotationServerError(
+                "Annotation server failed on %s:\n%s" % (command, result))
+        return result
+
+    def expand_transcripts(self, vcf_df, patient_id, **kwargs):
+        logging.info(
+            "Sending %d variants for %s to annotation server at %s",
+            len(vcf_df), patient_id, self.socket_path)
+        return self.call("expand_transcripts", vcf_df, patient_id, **kwargs)
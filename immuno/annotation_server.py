@@ -0,0 +1,113 @@
+#!/usr/bin/env python2
+
+# Copyright (c) 2014. Mount Sinai School of Medicine
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Resident process which loads the Ensembl exon tables, transcript indices and
+reference sequence databases once and then expands variants into mutated
+transcripts for other processes over a Unix socket. Short jobs which set
+IMMUNO_ANNOTATION_SERVER to the socket path skip loading all of that
+themselves.
+
+Requests are handled one at a time. Messages are pickled, so the socket is
+only made accessible to the user running the server.
+
+Example usage:
+  python annotation_server.py --socket /tmp/immuno.sock &
+  IMMUNO_ANNOTATION_SERVER=/tmp/immuno.sock python mutation_report.py ...
+"""
+
+import argparse
+import logging
+import os
+from os.path import exists
+import SocketServer
+import time
+import traceback
+
+from annotation_client import send_message, recv_message
+from common import init_logging
+from load_file import expand_transcripts, preload_reference_data
+
+def _expand_transcripts(vcf_df, patient_id, **kwargs):
+    # never forward the request to another server
+    kwargs['annotation_server'] = False
+    return expand_transcripts(vcf_df, patient_id, **kwargs)
+
+COMMANDS = {
+    'ping' : lambda: 'pong',
+    'expand_transcripts' : _expand_transcripts,
+}
+
+class AnnotationRequestHandler(SocketServer.BaseRequestHandler):
+    def handle(self):
+        try:
+            command, args, kwargs = recv_message(self.request)
+        except EOFError:
+            # clients checking whether the server is up connect without
+            # sending anything
+            return
+        start_time = time.time()
+        try:
+            response = ("ok", COMMANDS[command](*args, **kwargs))
+        except Exception:
+            logging.exception("Failed to handle %s", command)
+            response = ("error", traceback.format_exc())
+        logging.info(
+            "Handled %s in %0.4f seconds", command, time.time() - start_time)
+        send_message(self.request, response)
+
+class AnnotationServer(SocketServer.UnixStreamServer):
+    def server_bind(self):
+        # remove a socket left behind by a server which didn't shut down
+        if exists(self.server_address):
+            os.unlink(self.server_address)
+        # create the socket without any permissions for other users, since
+        # changing them after bind would leave it open until then
+        umask = os.umask(0077)
+        try:
+            SocketServer.UnixStreamServer.server_bind(self)
+        finally:
+            os.umask(umask)
+
+    def server_close(self):
+        SocketServer.UnixStreamServer.server_close(self)
+        if exists(self.server_address):
+            os.unlink(self.server_address)
+
+def serve(socket_path):
+    preload_reference_data()
+    server = AnnotationServer(socket_path, AnnotationRequestHandler)
+    logging.info("Annotation server listening on %s", socket_path)
+    try:
+        server.serve_forever()
+    finally:
+        server.server_close()
+
+parser = argparse.ArgumentParser()
+
+parser.add_argument("--socket",
+    required=True,
+    help="Path of the Unix socket to listen on")
+
+parser.add_argument("--quiet",
+    default=False,
+    action="store_true",
+    help="Suppress INFO log messages")
+
+if __name__ == '__main__':
+    args = parser.parse_args()
+    init_logging(args.quiet)
+    serve(args.socket)
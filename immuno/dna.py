@@ -0,0 +1,117 @@
+# Copyright (c) 2014. Mount Sinai School of Medicine
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Reverse complements and translations of DNA strings without creating a
+BioPython Seq for every call.
+
+Bases are encoded as uint8 codes (A=0, C=1, G=2, T=3 and 4 for anything
+else), so that long sequences can be translated all at once by looking up
+each codon's packed value (16 * first + 4 * second + third) in a table of
+64 amino acids. Short sequences are faster to translate one codon at a time
+from a dictionary, and sequences with ambiguous bases are left to
+BioPython, so every translation matches BioPython's.
+"""
+
+from Bio.Data import CodonTable, IUPACData
+from Bio.Seq import Seq
+import numpy as np
+
+BASES = "ACGT"
+
+# code of every other character
+UNKNOWN_BASE = len(BASES)
+
+_BASE_CODES = np.empty(256, dtype=np.uint8)
+_BASE_CODES[:] = UNKNOWN_BASE
+for (_code, _base) in enumerate(BASES):
+    _BASE_CODES[ord(_base)] = _code
+
+# complement of every IUPAC character in either case, for str.translate
+_complements = [chr(i) for i in xrange(256)]
+for (_base, _complement) in IUPACData.ambiguous_dna_complement.items():
+    _complements[ord(_base)] = _complement
+    _complements[ord(_base.lower())] = _complement.lower()
+_COMPLEMENT_TABLE = "".join(_complements)
+
+# amino acid (or '*' for stop) of each unambiguous codon of the standard code
+_STANDARD_TABLE = CodonTable.unambiguous_dna_by_id[1]
+CODON_TABLE = dict(_STANDARD_TABLE.forward_table)
+for _codon in _STANDARD_TABLE.stop_codons:
+    CODON_TABLE[_codon] = '*'
+
+def _packed_codon(codon):
+    return 16 * BASES.index(codon[0]) + \
+        4 * BASES.index(codon[1]) + \
+        BASES.index(codon[2])
+
+# amino acid of each packed codon value
+_PACKED_CODON_TABLE = np.zeros(64, dtype=np.uint8)
+for (_codon, _amino_acid) in CODON_TABLE.items():
+    _PACKED_CODON_TABLE[_packed_codon(_codon)] = ord(_amino_acid)
+
+# sequences with fewer codons are translated with CODON_TABLE, since
+# setting up the NumPy arrays costs about as much as that many lookups
+MIN_ARRAY_CODONS = 100
+
+def encode(dna):
+    """
+    Array of uint8 codes for the bases of a DNA string
+    """
+    return _BASE_CODES[np.frombuffer(str(dna), dtype=np.uint8)]
+
+def reverse_complement(dna):
+    """
+    Reverse complement of a DNA string, which may have IUPAC ambiguity codes
+    """
+    return str(dna).translate(_COMPLEMENT_TABLE)[::-1]
+
+def translate_codes(codes):
+    """
+    Translate an array of base codes, which must all be known and whose
+    length must be a multiple of three
+    """
+    packed = (codes[0::3] << 4) | (codes[1::3] << 2) | codes[2::3]
+    return _PACKED_CODON_TABLE[packed].tostring()
+
+def translate_codons(dna):
+    """
+    Translate a DNA string whose length is a multiple of three, or return
+    None if it has a codon which isn't in CODON_TABLE (e.g. with an N)
+    """
+    try:
+        return "".join([
+            CODON_TABLE[dna[i:i+3]] for i in xrange(0, len(dna), 3)
+        ])
+    except KeyError:
+        return None
+
+def translate(dna):
+    """
+    Translate all the complete codons of a DNA string
+    """
+    dna = str(dna)
+    n_codons = len(dna) // 3
+    dna = dna[:3 * n_codons]
+    protein = None
+    if n_codons < MIN_ARRAY_CODONS:
+        protein = translate_codons(dna)
+    else:
+        codes = encode(dna)
+        if codes.max() < UNKNOWN_BASE:
+            protein = translate_codes(codes)
+    if protein is None:
+        # let BioPython deal with ambiguous bases
+        protein = str(Seq(dna).translate())
+    return protein
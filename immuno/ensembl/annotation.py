@@ -13,14 +13,16 @@
 # limitations under the License.
 
 import logging
-from Bio.Seq import Seq
 
-from annotation_data import EnsemblAnnotationData
+import numpy as np
+import pandas as pd
 
-data = EnsemblAnnotationData()
+from immuno.dna import reverse_complement
+from immuno.lru_cache import LRUCache
+from immuno.ensembl.annotation_data import EnsemblAnnotationData
+from immuno.ensembl.transcript_model import TranscriptModel
 
-def reverse_complement(sequence):
-    return str(Seq(sequence).reverse_complement())
+data = EnsemblAnnotationData()
 
 def get_exons_from_transcript(transcript_id):
     """
@@ -32,15 +34,9 @@ def get_exons_from_transcript(transcript_id):
 
     returns Pandas dataframe containing only those exons
     """
-    assert transcript_id in data.transcript_exons_dict, (
-            "Unknown transcript %s in a dict of size %s, "
-            "with initial elements %s") % (
-                    transcript_id,
-                    len(data.transcript_exons_dict),
-                    data.transcript_exons_dict.items()[:5])
-    exons = data.transcript_exons_dict[transcript_id]
-    assert len(exons) > 0, \
-        "Couldn't find exons for transcript %s" % transcript_id
+    assert transcript_id in data.transcript_exons, \
+        "Couldn't find exons for transcript %s in an index of %d transcripts" % (
+            transcript_id, len(data.transcript_exons))
     fields = [
         'exon_id',
         'seq_start',
@@ -51,7 +47,7 @@ def get_exons_from_transcript(transcript_id):
         'seq_region_start_exon',
         'seq_region_end_exon'
     ]
-    return exons[fields]
+    return data.transcript_exons.to_dataframe(transcript_id, fields)
 
 
 def get_idx_from_interval(pos, intervals):
@@ -76,15 +72,12 @@ def get_strand(transcript_id):
     Return strand : int, +1 for forward strand else -1
     """
     try:
-        exons = data.transcript_exons_dict[transcript_id]
+        strands = data.transcript_exons.get(
+            transcript_id, 'seq_region_strand_gene')
     except KeyError:
-        exons = []
-
-    if len(exons) == 0:
         logging.warn("Transcript %s has no sequence information", transcript_id)
         return 1
-    strand = exons['seq_region_strand_gene'].iget(0)
-    return strand
+    return strands[0]
 
 def is_forward_strand(transcript_id):
     return get_strand(transcript_id) > 0
@@ -103,13 +96,15 @@ def is_incomplete_cds(transcript_id):
         return False
 
 def get_start_exon(transcript_id):
-    start_exons = data.start_exons_dataframe
-    mask = start_exons['stable_id_transcript'] == transcript_id
-    start_exon = start_exons[mask]
-    if start_exon.empty:
-        return None
-    else:
-        return start_exon.to_dict(outtype = 'records')[0]
+    """
+    Returns a dictionary describing the first translated exon of the
+    transcript (see EnsemblAnnotationData.start_exons_dict), or None if
+    the transcript isn't translated.
+
+    transcript_id :
+        Transcript id, of the from EST#####
+    """
+    return data.start_exons_dict.get(transcript_id)
 
 def get_cds_start_phase(transcript_id):
     """
@@ -124,6 +119,150 @@ def get_cds_start_phase(transcript_id):
     else:
         return None
 
+# how many transcripts' models to keep around between calls
+TRANSCRIPT_MODEL_CACHE_SIZE = 50000
+
+_transcript_models = LRUCache(TRANSCRIPT_MODEL_CACHE_SIZE)
+
+def clear_transcript_model_cache():
+    """
+    Forget every TranscriptModel built so far, e.g. after `data` changes
+    """
+    _transcript_models.clear()
+
+def get_transcript_model(transcript_id):
+    """
+    Returns a TranscriptModel for the given transcript, building it if it
+    isn't among the recently used ones.
+
+    Parameters
+    ----------
+    transcript_id :
+        Transcript id, of the from EST#####
+    """
+    model = _transcript_models.get(transcript_id)
+    if model is None:
+        exons = get_exons_from_transcript(transcript_id)
+        model = TranscriptModel.from_exons(
+            transcript_id,
+            exons,
+            forward = is_forward_strand(transcript_id),
+            cds_start_phase = get_cds_start_phase(transcript_id) or 0)
+        _transcript_models[transcript_id] = model
+    return model
+
+# Error codes from get_transcript_indices_from_positions
+TRANSCRIPT_INDEX_OK = 0
+TRANSCRIPT_INDEX_NOT_IN_EXON = 1
+TRANSCRIPT_INDEX_IN_UTR = 2
+TRANSCRIPT_INDEX_NO_CDS = 3
+
+# larger than any chromosome, used to sort exons of many transcripts
+# into a single array of (transcript, position) keys
+_POSITION_LIMIT = 2 ** 32
+
+def _transcript_indices(
+        positions,
+        transcript_ids,
+        skip_untranslated_region = True):
+    """
+    Vectorized core of get_transcript_indices_from_positions, returns
+    arrays of transcript indices (-1 for errors), strands and error codes.
+    """
+    positions = np.asarray(positions, dtype=np.int64)
+    n = len(positions)
+    if n == 0:
+        return (
+            np.zeros(0, dtype=np.int64),
+            np.zeros(0, dtype=bool),
+            np.zeros(0, dtype=np.int8))
+
+    unique_ids, transcript_numbers = np.unique(
+        np.asarray(transcript_ids), return_inverse=True)
+    models = [get_transcript_model(transcript_id)
+              for transcript_id in unique_ids]
+
+    # concatenate the exons of all the transcripts, which are already
+    # sorted by start position within each transcript
+    exon_counts = [len(model.exon_starts) for model in models]
+    exon_transcripts = np.repeat(np.arange(len(models)), exon_counts)
+    exon_starts = np.concatenate(
+        [model.exon_starts for model in models]).astype(np.int64)
+    exon_ends = np.concatenate(
+        [model.exon_ends for model in models]).astype(np.int64)
+    exon_offsets = np.concatenate(
+        [model.exon_offsets for model in models]).astype(np.int64)
+    lengths = np.array([model.length for model in models], dtype=np.int64)
+    strands = np.array([model.forward for model in models], dtype=bool)
+    utr_lengths = np.array(
+        [-1 if model.five_prime_utr_length is None
+         else model.five_prime_utr_length
+         for model in models],
+        dtype=np.int64)
+    phases = np.array(
+        [model.cds_start_phase for model in models], dtype=np.int64)
+
+    exon_keys = exon_transcripts * _POSITION_LIMIT + exon_starts
+    position_keys = transcript_numbers * _POSITION_LIMIT + positions
+    exons = np.searchsorted(exon_keys, position_keys, side='right') - 1
+    in_exon = exons >= 0
+    exons = exons.clip(0)
+    in_exon &= exon_transcripts[exons] == transcript_numbers
+    in_exon &= positions <= exon_ends[exons]
+
+    forward = strands[transcript_numbers]
+    indices = exon_offsets[exons] + positions - exon_starts[exons]
+    indices = np.where(
+        forward, indices, lengths[transcript_numbers] - indices - 1)
+
+    errors = np.zeros(n, dtype=np.int8)
+    errors[~in_exon] = TRANSCRIPT_INDEX_NOT_IN_EXON
+
+    if skip_untranslated_region:
+        prefix_utr_lengths = utr_lengths[transcript_numbers]
+        no_cds = in_exon & (prefix_utr_lengths < 0)
+        in_utr = in_exon & ~no_cds & (indices < prefix_utr_lengths)
+        errors[no_cds] = TRANSCRIPT_INDEX_NO_CDS
+        errors[in_utr] = TRANSCRIPT_INDEX_IN_UTR
+        indices = indices - prefix_utr_lengths
+
+    indices = indices + phases[transcript_numbers]
+    indices[errors != TRANSCRIPT_INDEX_OK] = -1
+    return indices, forward, errors
+
+def get_transcript_indices_from_positions(
+        transcripts_df,
+        skip_untranslated_region = True):
+    """
+    Vectorized version of get_transcript_index_from_pos for every row of
+    a DataFrame of variants annotated with transcripts.
+
+    Parameters
+    ----------
+    transcripts_df : Pandas DataFrame with 'pos' and 'stable_id_transcript'
+        columns, such as the result of annotate_vcf_transcripts
+
+    skip_untranslated_region : bool, optional
+        If True (default), then give position in the CDS (coding sequence),
+        otherwise give position in the longer full cDNA sequence.
+
+    Return DataFrame with the same index as `transcripts_df` and columns:
+        - 'transcript_index' : index into the transcript, -1 for errors
+        - 'forward' : is the transcript on the forward strand?
+        - 'error' : one of the TRANSCRIPT_INDEX_* codes
+    """
+    indices, forward, errors = _transcript_indices(
+        transcripts_df['pos'],
+        transcripts_df['stable_id_transcript'],
+        skip_untranslated_region = skip_untranslated_region)
+    return pd.DataFrame({
+            'transcript_index' : indices,
+            'forward' : forward,
+            'error' : errors,
+        },
+        index = transcripts_df.index,
+        columns = ['transcript_index', 'forward', 'error'])
+
 def get_transcript_index_from_pos(
         pos,
         transcript_id,
@@ -146,48 +285,34 @@ def get_transcript_index_from_pos(
         If True (default), then give position in the CDS (coding sequence),
         otherwise give position in the longer full cDNA sequence.
     """
-    exons = get_exons_from_transcript(transcript_id)
-    exons = exons.sort(columns=['seq_region_start_exon', 'seq_region_end_exon'])
-    exons['exon_length'] = \
-        exons['seq_region_end_exon'] - exons['seq_region_start_exon'] + 1
-    starts = exons['seq_region_start_exon']
-    stops = exons['seq_region_end_exon']
-    intervals = zip(starts, stops)
-
-    transcript_length = exons['exon_length'].sum()
-    transcript_idx = get_idx_from_interval(pos, intervals)
-
-    if transcript_idx is None:
+    indices, _, errors = _transcript_indices(
+        [pos],
+        [transcript_id],
+        skip_untranslated_region = skip_untranslated_region)
+    error = errors[0]
+
+    if error == TRANSCRIPT_INDEX_NOT_IN_EXON:
         logging.warning("Couldn't find position %d in transcript %s",
             pos, transcript_id)
-    else:
-        # Reverse array index if on reverse strand
-        forward = is_forward_strand(transcript_id)
-        transcript_idx = transcript_idx if forward else \
-            transcript_length - transcript_idx - 1
-        if skip_untranslated_region:
-            # Adjust for translations (CDS) start region
-            prefix_utr_length = get_five_prime_utr_length(exons, forward)
-            if transcript_idx < prefix_utr_length:
-                logging.warn(
-                    "UTR mutation at cDNA position %d, transcript %s",
-                    transcript_idx, transcript_id)
-                return None
-            else:
-                transcript_idx -= prefix_utr_length
-
-        # Adjust for CDS start phase if first exon is out of phase
-        transcript_phase = get_cds_start_phase(transcript_id)
-        transcript_idx += transcript_phase
-        if transcript_phase > 0:
-            logging.warn("Transcript %s is incomplete", transcript_id)
-
-        # TODO: check that index is within the mRNA transcript
-        # need to get the length of the coding region from the transcript_id
-        #suffix_utr_length = get_three_prime_utr_length(exons, forward)
-        #assert transcript_idx <= transcript_length + suffix_utr_length
-
-    return transcript_idx
+        return None
+    elif error == TRANSCRIPT_INDEX_NO_CDS:
+        logging.warn("No coding sequence for transcript %s", transcript_id)
+        return None
+    elif error == TRANSCRIPT_INDEX_IN_UTR:
+        logging.warn(
+            "UTR mutation at genomic position %d, transcript %s",
+            pos, transcript_id)
+        return None
+
+    if get_transcript_model(transcript_id).cds_start_phase > 0:
+        logging.warn("Transcript %s is incomplete", transcript_id)
+
+    # TODO: check that index is within the mRNA transcript
+    # need to get the length of the coding region from the transcript_id
+    #suffix_utr_length = get_three_prime_utr_length(exons, forward)
+    #assert transcript_idx <= transcript_length + suffix_utr_length
+
+    return int(indices[0])
 
 def get_five_prime_utr_length(exons_df, forward = True):
     """
@@ -249,7 +374,38 @@ def get_three_prime_utr_length(exons_df, forward = True):
             utr_length += exon_length
     return None
 
-def annotate_vcf_transcripts(vcf_df):
+# Ensembl transcript biotypes which are translated into protein
+PROTEIN_CODING_BIOTYPES = frozenset([
+    'protein_coding',
+    'polymorphic_pseudogene',
+    'IG_C_gene',
+    'IG_D_gene',
+    'IG_J_gene',
+    'IG_V_gene',
+    'TR_C_gene',
+    'TR_D_gene',
+    'TR_J_gene',
+    'TR_V_gene',
+])
+
+def variants_in_coding_regions(vcf_df):
+    """
+    Boolean mask of the variants whose position falls within the coding
+    sequence of some transcript. Any other variant can't change a protein,
+    and annotating it would only end with an error for every transcript
+    it overlaps.
+
+    Parameters
+    ----------
+    vcf_df : Pandas DataFrame with chr and pos columns
+    """
+    return data.coding_regions.contains(vcf_df['chr'], vcf_df['pos'])
+
+def annotate_vcf_transcripts(
+        vcf_df,
+        canonical_only = False,
+        transcript_whitelist = None,
+        biotypes = PROTEIN_CODING_BIOTYPES):
     """
     Expand each variant in a DataFrame into multiple entries for
     all transcript_ids that could contain the mutated position
@@ -257,6 +413,17 @@ def annotate_vcf_transcripts(vcf_df):
     ----------
     vcf_df : Pandas DataFrame with chr, pos, ref, alt columns
 
+    canonical_only : bool
+        Only use the canonical transcript of each gene
+
+    transcript_whitelist : collection of str, optional
+        If given, only use transcripts with these Ensembl IDs
+
+    biotypes : collection of str, optional
+        Only use transcripts with these biotypes, by default the ones which
+        code for proteins. Pass None to keep pseudogenes, nonsense mediated
+        decay and other non-coding transcripts.
+
     Return DataFrame with extra columns:
         - 'name'
         - 'stable_id_gene'
@@ -266,18 +433,42 @@ def annotate_vcf_transcripts(vcf_df):
         - 'stable_id_transcript'
         - 'seq_region_start_transcript'
         - 'seq_region_end_transcript'
+        - 'biotype'
+        - 'is_canonical'
     """
 
-    genome_annotation_data_df = data.transcripts_dataframe
-
-    # combine each variant entry from `vcf_df` with all possible gene
-    # annotations  on the same chromosome from `genome_annotation_data_df`
-    all_possible_transcripts = vcf_df.merge(
-        genome_annotation_data_df, left_on='chr', right_on='name', how='left')
-    variant_position = all_possible_transcripts['pos']
-    transcript_start = all_possible_transcripts['seq_region_start_transcript']
-    transcript_stop = all_possible_transcripts['seq_region_end_transcript']
-    mask = (variant_position > transcript_start) & \
-        (variant_position < transcript_stop)
-    annotated = all_possible_transcripts[mask]
+    transcripts_df = data.transcripts_dataframe
+    index = data.transcript_interval_index
+
+    # look up the transcripts overlapping each variant, rather than combining
+    # every variant with every transcript on its chromosome and filtering
+    # afterward
+    variant_rows = []
+    transcript_rows = []
+    for i, (chromosome, pos) in enumerate(zip(vcf_df['chr'], vcf_df['pos'])):
+        hits = index.find(chromosome, pos)
+        variant_rows.extend([i] * len(hits))
+        transcript_rows.extend(hits)
+
+    variant_rows = np.array(variant_rows, dtype=np.int64)
+    transcript_rows = np.array(transcript_rows, dtype=np.int64)
+    keep = np.ones(len(transcript_rows), dtype=bool)
+    if canonical_only:
+        keep &= transcripts_df['is_canonical'].values[transcript_rows]
+    if biotypes is not None:
+        transcript_biotypes = transcripts_df['biotype'].values
+        keep &= np.in1d(
+            transcript_biotypes[transcript_rows].astype(str),
+            np.array(list(biotypes), dtype=str))
+    if transcript_whitelist is not None:
+        transcript_ids = transcripts_df['stable_id_transcript'].values
+        keep &= np.in1d(
+            transcript_ids[transcript_rows].astype(str),
+            np.array(list(transcript_whitelist), dtype=str))
+    variant_rows = variant_rows[keep]
+    transcript_rows = transcript_rows[keep]
+
+    variants = vcf_df.take(variant_rows).reset_index(drop=True)
+    transcripts = transcripts_df.take(transcript_rows).reset_index(drop=True)
+    annotated = pd.concat([variants, transcripts], axis=1)
     return annotated.drop_duplicates()
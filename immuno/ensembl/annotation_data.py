@@ -12,10 +12,71 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-
+import numpy as np
 import pandas as pd
 
-from transcript_metadata import download_transcript_metadata
+from columnar import ColumnStore
+from exon_index import TranscriptExonIndex
+from interval_index import MergedIntervals, TranscriptIntervalIndex
+from transcript_metadata import (
+    download_transcript_metadata,
+    transcript_metadata_columns_path,
+)
+
+# columns kept for looking up the exons of a transcript
+TRANSCRIPT_EXON_COLUMNS = [
+    'exon_id',
+    'seq_start',
+    'start_exon_id',
+    'seq_end',
+    'end_exon_id',
+    'stable_id_exon',
+    'seq_region_start_exon',
+    'seq_region_end_exon',
+    'seq_region_strand_gene',
+]
+
+def coding_exon_intervals(columns):
+    """
+    Genomic intervals of the coding part of every exon in the transcript
+    metadata table, from the first base of its transcript's start codon
+    through the last base of the stop codon. Returns arrays of chromosome
+    names, first positions and last positions.
+
+    Parameters
+    ----------
+    columns : ColumnStore of the transcript metadata table
+    """
+    transcripts = np.asarray(columns.codes('stable_id_transcript'))
+    exon_ids = np.asarray(columns['exon_id'])
+    starts = np.asarray(columns['seq_region_start_exon'], dtype=np.int64)
+    ends = np.asarray(columns['seq_region_end_exon'], dtype=np.int64)
+    forward = np.asarray(columns['seq_region_strand_gene']) > 0
+    n_transcripts = transcripts.max() + 1 if len(transcripts) > 0 else 0
+
+    def coding_boundary(boundary_exon_column, offset_column):
+        """
+        Genomic position of the base `offset_column` (1-based, in transcript
+        order) of the exon `boundary_exon_column` of each transcript,
+        or -1 if the exon is missing
+        """
+        boundary = -np.ones(n_transcripts, dtype=np.int64)
+        offsets = np.asarray(columns[offset_column], dtype=np.int64)
+        positions = np.where(
+            forward, starts + offsets - 1, ends - offsets + 1)
+        mask = (exon_ids == np.asarray(columns[boundary_exon_column])) & \
+            (transcripts >= 0)
+        boundary[transcripts[mask]] = positions[mask]
+        return boundary[transcripts]
+
+    first = coding_boundary('start_exon_id', 'seq_start')
+    last = coding_boundary('end_exon_id', 'seq_end')
+    coding_starts = np.maximum(starts, np.minimum(first, last))
+    coding_ends = np.minimum(ends, np.maximum(first, last))
+    mask = (transcripts >= 0) & (first >= 0) & (last >= 0) & \
+        (coding_starts <= coding_ends)
+    names = np.asarray(columns['name']).astype(str)
+    return names[mask], coding_starts[mask], coding_ends[mask]
 
 def cached_property(fn):
     """
@@ -42,6 +103,13 @@ class EnsemblAnnotationData(object):
     def transcript_metadata_path(self):
         return download_transcript_metadata()
 
+    @cached_property
+    def transcript_metadata_columns(self):
+        """
+        Lazily loaded binary columns of the transcript metadata table
+        """
+        path = transcript_metadata_columns_path(self.transcript_metadata_path)
+        return ColumnStore(path)
 
     @cached_property
     def exons_dataframe(self):
@@ -62,49 +130,59 @@ class EnsemblAnnotationData(object):
             - stable_id_exon
             - exon_id
             - rank
+
+        This decodes every column of the table, so annotating variants
+        only uses the columns it needs instead.
         """
-        path = self.transcript_metadata_path
-        return pd.read_csv(path, sep='\t', low_memory = False)
+        return self.transcript_metadata_columns.to_dataframe()
 
     @cached_property
-    def transcript_exons_dict(self):
-        """
-        Mapping from stable_id_transcript to DataFrame of that
-        transcript's exons
-        """
-        class DelayedDict(object):
-            def __init__(self, exons_df):
-                self.exons_df = exons_df
-                self.groupby_object = exons_df.groupby(['stable_id_transcript'])
-                self.group_indices = self.groupby_object.groups
-                self._d = {}
-
-            def __getitem__(self, transcript_id):
-                # have we retrieved this transcript_id before?
-                if transcript_id in self._d:
-                    return self._d[transcript_id]
-                # is this transcript in the original exons DataFrame?
-                if transcript_id not in self.group_indices:
-                    raise KeyError(transcript_id)
-                # which rows had the given transcript id?
-                indices = self.group_indices[transcript_id]
-                subset = self.exons_df.ix[indices]
-                self._d[transcript_id] = subset
-                return subset
-
-            def __contains__(self, transcript_id):
-                return transcript_id in self.group_indices
-
-        return DelayedDict(self.exons_dataframe)
+    def transcript_exons(self):
+        """
+        Index of each transcript's exons (see TranscriptExonIndex), with
+        the columns in TRANSCRIPT_EXON_COLUMNS
+        """
+        columns = self.transcript_metadata_columns
+        return TranscriptExonIndex(
+            columns.codes('stable_id_transcript'),
+            columns.categories('stable_id_transcript'),
+            dict((column, columns[column])
+                for column in TRANSCRIPT_EXON_COLUMNS))
 
     @cached_property
-    def start_exons_dataframe(self):
+    def start_exons_dict(self):
         """
-        Subset of the exon table but only for first exon in each gene
+        Mapping from stable_id_transcript to a dictionary describing the
+        transcript's first translated exon, with keys:
+            - exon_id
+            - stable_id_exon
+            - phase
+            - seq_start
+            - start_exon_id
+            - seq_end
+            - end_exon_id
+            - seq_region_start_exon
+            - seq_region_end_exon
         """
-        all_exons = self.exons_dataframe
-        mask = all_exons['exon_id'] == all_exons['start_exon_id']
-        return all_exons[mask]
+        columns = self.transcript_metadata_columns
+        mask = np.asarray(columns['exon_id']) == \
+            np.asarray(columns['start_exon_id'])
+        fields = [
+            'exon_id',
+            'stable_id_exon',
+            'phase',
+            'seq_start',
+            'start_exon_id',
+            'seq_end',
+            'end_exon_id',
+            'seq_region_start_exon',
+            'seq_region_end_exon',
+        ]
+        values = [columns.take(field, mask) for field in fields]
+        transcript_ids = columns.take('stable_id_transcript', mask)
+        return dict(
+            (transcript_id, dict(zip(fields, row)))
+            for (transcript_id, row) in zip(transcript_ids, zip(*values)))
 
     @cached_property
     def transcripts_dataframe(self):
@@ -120,9 +198,39 @@ class EnsemblAnnotationData(object):
             'seq_region_strand_gene',
             'stable_id_transcript',
             'seq_region_start_transcript',
-            'seq_region_end_transcript'
+            'seq_region_end_transcript',
+            'biotype',
+            'is_canonical',
         ]
-        return self.exons_dataframe[transcript_cols].drop_duplicates()
+        # only decode the columns used here, never the whole table
+        columns = self.transcript_metadata_columns
+        df = pd.DataFrame(
+            dict((column, columns[column]) for column in transcript_cols),
+            columns = transcript_cols)
+        # booleans are stored as integers in the column store
+        df['is_canonical'] = df['is_canonical'].astype(bool)
+        return df.drop_duplicates()
+
+    @cached_property
+    def transcript_interval_index(self):
+        """
+        Per-chromosome binary search index over the rows of
+        transcripts_dataframe
+        """
+        transcripts = self.transcripts_dataframe
+        return TranscriptIntervalIndex(
+            transcripts['name'],
+            transcripts['seq_region_start_transcript'],
+            transcripts['seq_region_end_transcript'])
+
+    @cached_property
+    def coding_regions(self):
+        """
+        Merged intervals of every transcript's coding sequence on each
+        chromosome
+        """
+        return MergedIntervals(
+            *coding_exon_intervals(self.transcript_metadata_columns))
 
     @cached_property
     def gene_dataframe(self):
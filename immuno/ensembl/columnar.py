@@ -0,0 +1,179 @@
+# Copyright (c) 2014. Mount Sinai School of Medicine
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Typed binary copy of a DataFrame stored as one NumPy file per column, so
+that loading a table doesn't require parsing a large text file and columns
+which aren't used are never read.
+
+Integer columns are stored as int32, other numeric columns as float64, and
+string columns as int32 codes into a sorted array of distinct values.
+"""
+
+import json
+import logging
+from os import makedirs, rename
+from os.path import join, exists
+import shutil
+
+import numpy as np
+import pandas as pd
+
+MANIFEST_FILENAME = "columns.json"
+
+INTEGER_KIND = "int"
+FLOAT_KIND = "float"
+CATEGORY_KIND = "category"
+
+def _column_path(directory, column):
+    return join(directory, "%s.npy" % column)
+
+def _categories_path(directory, column):
+    return join(directory, "%s.categories.npy" % column)
+
+def write_columns(df, directory):
+    """
+    Write each column of `df` into `directory` as a NumPy file. The directory
+    is first written under a temporary name and then renamed, so a crashed
+    build never leaves a partial copy behind.
+    """
+    write_column_arrays(
+        ((column, df[column].values) for column in df.columns),
+        len(df),
+        directory)
+
+def write_column_arrays(columns, length, directory):
+    """
+    Like write_columns, but takes an iterable of (name, array) pairs which
+    all have the given length, so that a table never has to be held in
+    memory all at once.
+    """
+    tmp_directory = directory + ".tmp"
+    if exists(tmp_directory):
+        shutil.rmtree(tmp_directory)
+    makedirs(tmp_directory)
+
+    kinds = []
+    for (column, values) in columns:
+        values = np.asarray(values)
+        assert len(values) == length, \
+            "Column %s has %d rows, expected %d" % (column, len(values), length)
+        if values.dtype.kind in ('i', 'u', 'b'):
+            kind = INTEGER_KIND
+            np.save(_column_path(tmp_directory, column),
+                values.astype(np.int32))
+        elif values.dtype.kind == 'f':
+            kind = FLOAT_KIND
+            np.save(_column_path(tmp_directory, column),
+                values.astype(np.float64))
+        else:
+            kind = CATEGORY_KIND
+            missing = pd.isnull(values)
+            strings = values.astype(str)
+            categories, codes = np.unique(strings[~missing],
+                return_inverse=True)
+            all_codes = np.empty(len(values), dtype=np.int32)
+            all_codes[missing] = -1
+            all_codes[~missing] = codes
+            np.save(_column_path(tmp_directory, column), all_codes)
+            np.save(_categories_path(tmp_directory, column), categories)
+        kinds.append((column, kind))
+
+    with open(join(tmp_directory, MANIFEST_FILENAME), 'w') as f:
+        json.dump({'columns': kinds, 'length': length}, f)
+    if exists(directory):
+        shutil.rmtree(directory)
+    rename(tmp_directory, directory)
+    logging.info("Wrote %d columns of %d rows to %s",
+        len(kinds), length, directory)
+
+
+class ColumnStore(object):
+    """
+    Lazily loads columns written by `write_columns`. Numeric columns are
+    memory-mapped, string columns are decoded into object arrays which
+    share one Python string per distinct value.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        with open(join(directory, MANIFEST_FILENAME)) as f:
+            manifest = json.load(f)
+        self.columns = [str(column) for (column, _) in manifest['columns']]
+        self._kinds = dict(
+            (str(column), kind) for (column, kind) in manifest['columns'])
+        self._length = manifest['length']
+        self._cache = {}
+
+    def __len__(self):
+        return self._length
+
+    def __contains__(self, column):
+        return column in self._kinds
+
+    def codes(self, column):
+        """
+        Integer codes of a string column, without decoding them
+        """
+        assert self._kinds[column] == CATEGORY_KIND, \
+            "Column %s doesn't contain strings" % column
+        return np.load(_column_path(self.directory, column), mmap_mode='r')
+
+    def categories(self, column):
+        """
+        Sorted distinct values of a string column, which its codes index into
+        """
+        assert self._kinds[column] == CATEGORY_KIND, \
+            "Column %s doesn't contain strings" % column
+        return np.load(_categories_path(self.directory, column))
+
+    def __getitem__(self, column):
+        if column in self._cache:
+            return self._cache[column]
+        if column not in self._kinds:
+            raise KeyError(column)
+        kind = self._kinds[column]
+        path = _column_path(self.directory, column)
+        if kind == CATEGORY_KIND:
+            categories = np.load(_categories_path(self.directory, column))
+            # missing values are coded as -1, which picks out the NaN
+            # appended to the end of the categories
+            categories = np.append(categories.astype(object), np.nan)
+            values = categories.take(np.load(path))
+        else:
+            values = np.load(path, mmap_mode='r')
+        self._cache[column] = values
+        return values
+
+    def take(self, column, rows):
+        """
+        Values of a column at the given rows (e.g. an index or boolean
+        array), only decoding those rows of a string column
+        """
+        if column in self._cache:
+            return self._cache[column][rows]
+        if column not in self._kinds:
+            raise KeyError(column)
+        if self._kinds[column] == CATEGORY_KIND:
+            categories = np.append(
+                self.categories(column).astype(object), np.nan)
+            return categories.take(self.codes(column)[rows])
+        return np.asarray(self[column][rows])
+
+    def to_dataframe(self, columns = None):
+        if columns is None:
+            columns = self.columns
+        return pd.DataFrame(
+            dict((column, self[column]) for column in columns),
+            columns = columns)
@@ -0,0 +1,94 @@
+# Copyright (c) 2014. Mount Sinai School of Medicine
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+import pandas as pd
+
+class TranscriptExonIndex(object):
+    """
+    Columns of the exon table with their rows sorted by transcript, so that
+    each transcript's exons are a contiguous slice. For every transcript we
+    keep the start and stop offsets of its slice, and looking up a
+    transcript's exons returns views into the sorted columns rather than
+    building (and caching) a DataFrame per transcript.
+    """
+
+    def __init__(self, transcript_codes, transcript_ids, columns):
+        """
+        Parameters
+        ----------
+        transcript_codes : sequence of int
+            Transcript of each row, as a position in `transcript_ids`
+            (negative for rows without a transcript)
+
+        transcript_ids : sequence of str
+            Sorted distinct transcript IDs
+
+        columns : dict
+            Mapping from column names to sequences with one value per row
+        """
+        transcript_codes = np.asarray(transcript_codes)
+        # stable sort, so each transcript's exons keep their original order
+        order = np.argsort(transcript_codes, kind='mergesort')
+        sorted_codes = transcript_codes[order]
+        codes = np.arange(len(transcript_ids))
+        starts = np.searchsorted(sorted_codes, codes, side='left')
+        stops = np.searchsorted(sorted_codes, codes, side='right')
+        # position of each transcript which has any exons in the offsets
+        self._codes = dict(
+            (transcript_id, code)
+            for (transcript_id, code, start, stop)
+            in zip(list(transcript_ids), codes, starts, stops)
+            if stop > start)
+        self._starts = starts
+        self._stops = stops
+        self._columns = dict(
+            (name, np.asarray(values)[order])
+            for (name, values) in columns.iteritems())
+
+    def __len__(self):
+        return len(self._codes)
+
+    def _slice(self, transcript_id):
+        code = self._codes.get(transcript_id)
+        if code is None:
+            return None
+        return slice(self._starts[code], self._stops[code])
+
+    def __contains__(self, transcript_id):
+        return self._slice(transcript_id) is not None
+
+    def get(self, transcript_id, column):
+        """
+        Returns a view of the given column for the transcript's exons
+
+        Raises KeyError if the transcript has no exons
+        """
+        rows = self._slice(transcript_id)
+        if rows is None:
+            raise KeyError(transcript_id)
+        return self._columns[column][rows]
+
+    def to_dataframe(self, transcript_id, columns):
+        """
+        Returns DataFrame of the given columns for the transcript's exons
+
+        Raises KeyError if the transcript has no exons
+        """
+        rows = self._slice(transcript_id)
+        if rows is None:
+            raise KeyError(transcript_id)
+        return pd.DataFrame(
+            dict((column, self._columns[column][rows]) for column in columns),
+            columns = columns)
@@ -1,7 +1,11 @@
 
 import logging
+from os import rename
+
 import pandas as pd
-import datacache
+
+from manifest import record_artifact, verify_artifact
+from reference_bundle import ReferenceFile, biomart_url, bundle_path
 
 
 # use genenames.org to make a table mapping between HUGO gene names and ensembl
@@ -12,11 +16,13 @@ import datacache
 _HUGO_URL = \
 "http://www.genenames.org/cgi-bin/download?col=gd_app_sym&col=gd_app_name&col=md_ensembl_id&status=Approved&status_opt=2&where=&order_by=gd_app_sym_sort&format=text&limit=&submit=submit"
 
+_HUGO_FILE = ReferenceFile(_HUGO_URL, "hugo_genes.tsv", False)
+
 
 def load_hugo_table(_table_cache = [None]):
 	if _table_cache[0] is None:
 		print "Downloading %s" % _HUGO_URL
-		df = datacache.fetch_csv_dataframe(_HUGO_URL, sep="\t")
+		df = pd.read_csv(_HUGO_FILE.fetch(), sep="\t")
 		_table_cache[0] = df
 	return _table_cache[0]
 
@@ -54,17 +60,20 @@ _BIOMART_QUERY_TRANSCRIPT_ID_TO_GENE_ID = \
 </Query>
 """.replace("\n", "")
 _BIOMART_URL_TRANSCRIPT_ID_TO_GENE_ID = \
-	"http://feb2014.archive.ensembl.org/biomart/martservice/result?query=%s" % \
-	_BIOMART_QUERY_TRANSCRIPT_ID_TO_GENE_ID
+	biomart_url(_BIOMART_QUERY_TRANSCRIPT_ID_TO_GENE_ID)
+
+_BIOMART_TRANSCRIPT_ID_TO_GENE_ID_FILE = ReferenceFile(
+	_BIOMART_URL_TRANSCRIPT_ID_TO_GENE_ID, "biomart_transcript_gene.tsv", False)
+
+def load_biomart_transcript_gene_table():
+	print ("Fetching Ensembl ID mappings from BioMart %s"
+		) % _BIOMART_URL_TRANSCRIPT_ID_TO_GENE_ID
+	biomart_filename = _BIOMART_TRANSCRIPT_ID_TO_GENE_ID_FILE.fetch()
+	return pd.read_csv(biomart_filename, sep='\t')
 
 def transcript_id_to_gene_id(transcript_id, _table_cache = [None]):
 	if _table_cache[0] is None:
-		print ("Fetching Ensembl ID mappings from BioMart %s"
-			) % _BIOMART_URL_TRANSCRIPT_ID_TO_GENE_ID
-		biomart_filename = \
-			datacache.fetch_file(_BIOMART_URL_TRANSCRIPT_ID_TO_GENE_ID,
-				"biomart_transcript_gene.tsv")
-		df = pd.read_csv(biomart_filename, sep='\t')
+		df = load_biomart_transcript_gene_table()
 		gene_ids = df['Ensembl Gene ID']
 		transcript_ids = df['Ensembl Transcript ID']
 		mapping = dict(zip(transcript_ids, gene_ids))
@@ -88,20 +97,128 @@ _BIOMART_QUERY_TRANSCRIPT_ID_TO_TRANSCRIPT_NAME = \
 </Query>
 """.replace("\n", "")
 _BIOMART_URL_TRANSCRIPT_ID_TO_TRANSCRIPT_NAME = \
-	"http://feb2014.archive.ensembl.org/biomart/martservice/result?query=%s" % \
-	_BIOMART_QUERY_TRANSCRIPT_ID_TO_TRANSCRIPT_NAME
+	biomart_url(_BIOMART_QUERY_TRANSCRIPT_ID_TO_TRANSCRIPT_NAME)
+
+_BIOMART_TRANSCRIPT_ID_TO_TRANSCRIPT_NAME_FILE = ReferenceFile(
+	_BIOMART_URL_TRANSCRIPT_ID_TO_TRANSCRIPT_NAME,
+	"biomart_transcript_name.tsv",
+	False)
+
+def load_biomart_transcript_name_table():
+	print ("Fetching Ensembl ID mappings from BioMart %s"
+		) % _BIOMART_URL_TRANSCRIPT_ID_TO_TRANSCRIPT_NAME
+	biomart_filename = _BIOMART_TRANSCRIPT_ID_TO_TRANSCRIPT_NAME_FILE.fetch()
+	return pd.read_csv(biomart_filename, sep='\t')
 
 def transcript_id_to_transcript_name(transcript_id, _table_cache = [None]):
 	if _table_cache[0] is None:
-		print ("Fetching Ensembl ID mappings from BioMart %s"
-			) % _BIOMART_URL_TRANSCRIPT_ID_TO_TRANSCRIPT_NAME
-		biomart_filename = \
-			datacache.fetch_file(_BIOMART_URL_TRANSCRIPT_ID_TO_TRANSCRIPT_NAME,
-				"biomart_transcript_name.tsv")
-		df = pd.read_csv(biomart_filename, sep='\t')
+		df = load_biomart_transcript_name_table()
 		transcript_ids = df['Ensembl Transcript ID']
 		transcript_names = df['Associated Transcript Name']
 		mapping = dict(zip(transcript_ids, transcript_names))
 		_table_cache[0] = mapping
 	mapping = _table_cache[0]
 	return mapping[transcript_id]
+
+
+# downloads needed to build the transcript name table
+REFERENCE_FILES = [
+	_HUGO_FILE,
+	_BIOMART_TRANSCRIPT_ID_TO_GENE_ID_FILE,
+	_BIOMART_TRANSCRIPT_ID_TO_TRANSCRIPT_NAME_FILE,
+]
+
+TRANSCRIPT_NAME_TABLE_FILENAME = "transcript_names.tsv"
+
+def build_transcript_name_table():
+	"""
+	Join the HUGO and BioMart tables into a local table with one row
+	per transcript and the columns:
+		- transcript_id
+		- transcript_name
+		- gene_id
+		- gene_name
+
+	The downloads only happen the first time, afterward this just returns
+	the path of the existing table.
+	"""
+	path = bundle_path(TRANSCRIPT_NAME_TABLE_FILENAME)
+	params = {
+		'sources' : [reference_file.url for reference_file in REFERENCE_FILES]
+	}
+	if verify_artifact(path, params):
+		return path
+	transcript_genes = load_biomart_transcript_gene_table()
+	transcript_genes = pd.DataFrame({
+		'transcript_id' : transcript_genes['Ensembl Transcript ID'],
+		'gene_id' : transcript_genes['Ensembl Gene ID'],
+	})
+	transcript_names = load_biomart_transcript_name_table()
+	transcript_names = pd.DataFrame({
+		'transcript_id' : transcript_names['Ensembl Transcript ID'],
+		'transcript_name' : transcript_names['Associated Transcript Name'],
+	})
+	hugo = load_hugo_table()
+	hugo = hugo[~hugo['Ensembl ID(supplied by Ensembl)'].isnull()]
+	gene_names = pd.DataFrame({
+		'gene_id' : hugo['Ensembl ID(supplied by Ensembl)'],
+		'gene_name' : hugo['Approved Symbol'],
+	})
+	df = transcript_genes.drop_duplicates('transcript_id')
+	df = df.merge(
+		transcript_names.drop_duplicates('transcript_id'),
+		on='transcript_id',
+		how='left')
+	df = df.merge(
+		gene_names.drop_duplicates('gene_id'),
+		on='gene_id',
+		how='left')
+	columns = ['transcript_id', 'transcript_name', 'gene_id', 'gene_name']
+	# write to a temporary file first so that an interrupted build
+	# doesn't leave a truncated table behind
+	tmp_path = path + ".tmp"
+	df[columns].to_csv(tmp_path, sep='\t', index=False)
+	rename(tmp_path, path)
+	record_artifact(path, params)
+	return path
+
+def load_transcript_name_table(_table_cache = [None]):
+	"""
+	DataFrame of names for each transcript, indexed by transcript ID
+	"""
+	if _table_cache[0] is None:
+		path = build_transcript_name_table()
+		_table_cache[0] = pd.read_csv(path, sep='\t', index_col='transcript_id')
+	return _table_cache[0]
+
+def _gene_name_series(_series_cache = [None]):
+	if _series_cache[0] is None:
+		table = load_transcript_name_table()
+		genes = table[['gene_id', 'gene_name']].drop_duplicates('gene_id')
+		_series_cache[0] = pd.Series(
+			genes['gene_name'].values, index=genes['gene_id'].values)
+	return _series_cache[0]
+
+def _map_values(keys, mapping):
+	"""
+	Look up every element of `keys` (a sequence or Series) in the Series
+	`mapping`, returning a Series with NaN wherever a key is missing.
+	"""
+	if not isinstance(keys, pd.Series):
+		keys = pd.Series(list(keys))
+	return keys.map(mapping)
+
+def map_transcript_ids_to_gene_ids(transcript_ids):
+	return _map_values(
+		transcript_ids, load_transcript_name_table()['gene_id'])
+
+def map_transcript_ids_to_gene_names(transcript_ids):
+	return _map_values(
+		transcript_ids, load_transcript_name_table()['gene_name'])
+
+def map_transcript_ids_to_transcript_names(transcript_ids):
+	return _map_values(
+		transcript_ids, load_transcript_name_table()['transcript_name'])
+
+def map_gene_ids_to_names(gene_ids):
+	return _map_values(gene_ids, _gene_name_series())
@@ -0,0 +1,141 @@
+# Copyright (c) 2014. Mount Sinai School of Medicine
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+
+class TranscriptIntervalIndex(object):
+    """
+    Per-chromosome index over transcript intervals which answers
+    "which transcripts contain this position" with a binary search instead
+    of a scan over every transcript on the chromosome.
+
+    For each chromosome the intervals are sorted by start position and
+    we keep a running maximum of their end positions. Every interval
+    left of the first running maximum past `pos` must end before `pos`,
+    and every interval right of the last start before `pos` must begin
+    after it, so only the rows in between need to be checked.
+    """
+
+    def __init__(self, contigs, starts, ends):
+        """
+        Parameters
+        ----------
+        contigs : sequence of chromosome names
+
+        starts : sequence of int
+            First genomic position of each interval
+
+        ends : sequence of int
+            Last genomic position of each interval
+        """
+        contigs = np.asarray(contigs).astype(str)
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        assert len(contigs) == len(starts) == len(ends), \
+            "Mismatched lengths for contigs, starts and ends"
+        self._contigs = {}
+        for contig in set(contigs):
+            rows = np.nonzero(contigs == contig)[0]
+            order = np.argsort(starts[rows], kind='mergesort')
+            rows = rows[order]
+            contig_ends = ends[rows]
+            self._contigs[contig] = (
+                rows,
+                starts[rows],
+                contig_ends,
+                np.maximum.accumulate(contig_ends),
+            )
+
+    def __len__(self):
+        return sum(len(entry[0]) for entry in self._contigs.itervalues())
+
+    def find(self, contig, pos):
+        """
+        Returns sorted array of row numbers (positions in the sequences given
+        to the constructor) of intervals on `contig` which strictly contain
+        `pos`, i.e. start < pos < end.
+        """
+        entry = self._contigs.get(str(contig))
+        if entry is None:
+            return np.array([], dtype=np.int64)
+        rows, starts, ends, running_max_end = entry
+        first = np.searchsorted(running_max_end, pos, side='right')
+        last = np.searchsorted(starts, pos, side='left')
+        if first >= last:
+            return np.array([], dtype=np.int64)
+        candidates = slice(first, last)
+        mask = ends[candidates] > pos
+        return np.sort(rows[candidates][mask])
+
+class MergedIntervals(object):
+    """
+    Union of closed intervals on each chromosome, merged into sorted
+    disjoint intervals so that checking whether positions fall within any
+    of them takes one binary search per chromosome.
+    """
+
+    def __init__(self, contigs, starts, ends):
+        """
+        Parameters
+        ----------
+        contigs : sequence of chromosome names
+
+        starts : sequence of int
+            First genomic position of each interval
+
+        ends : sequence of int
+            Last genomic position of each interval
+        """
+        contigs = np.asarray(contigs).astype(str)
+        starts = np.asarray(starts, dtype=np.int64)
+        ends = np.asarray(ends, dtype=np.int64)
+        assert len(contigs) == len(starts) == len(ends), \
+            "Mismatched lengths for contigs, starts and ends"
+        self._contigs = {}
+        for contig in set(contigs):
+            rows = np.nonzero(contigs == contig)[0]
+            order = np.argsort(starts[rows], kind='mergesort')
+            contig_starts = starts[rows][order]
+            running_max_end = np.maximum.accumulate(ends[rows][order])
+            # an interval begins a new merged interval unless it overlaps
+            # or directly follows everything before it
+            first = np.ones(len(rows), dtype=bool)
+            first[1:] = contig_starts[1:] > running_max_end[:-1] + 1
+            last = np.roll(first, -1)
+            self._contigs[contig] = (
+                contig_starts[first],
+                running_max_end[last],
+            )
+
+    def __len__(self):
+        return sum(len(entry[0]) for entry in self._contigs.itervalues())
+
+    def contains(self, contigs, positions):
+        """
+        Returns boolean array which is True for each position on the
+        corresponding contig which falls within one of the intervals
+        """
+        contigs = np.asarray(contigs).astype(str)
+        positions = np.asarray(positions, dtype=np.int64)
+        result = np.zeros(len(positions), dtype=bool)
+        for contig in set(contigs):
+            entry = self._contigs.get(contig)
+            if entry is None:
+                continue
+            starts, ends = entry
+            rows = np.nonzero(contigs == contig)[0]
+            contig_positions = positions[rows]
+            i = np.searchsorted(starts, contig_positions, side='right') - 1
+            result[rows] = (i >= 0) & (contig_positions <= ends[i.clip(0)])
+        return result
@@ -0,0 +1,180 @@
+# Copyright (c) 2014. Mount Sinai School of Medicine
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Every directory of tables and indices built from reference files has a
+manifest listing what was built there: for each artifact, the parameters
+it was built with and the size and SHA-1 hash of each of its files.
+
+An artifact is only recorded once all of its files are written, so a
+build which crashed halfway through is rebuilt instead of being loaded.
+Checking an artifact at load time only compares its parameters and file
+sizes; the (slow) content hashes are checked by verify_directory.
+"""
+
+from contextlib import contextmanager
+import fcntl
+import hashlib
+import json
+import logging
+from os import listdir, rename
+from os.path import basename, dirname, exists, getsize, isdir, join, relpath
+
+MANIFEST_FILENAME = "manifest.json"
+
+_LOCK_FILENAME = "manifest.lock"
+
+def _manifest_path(directory):
+    return join(directory, MANIFEST_FILENAME)
+
+@contextmanager
+def _locked(directory):
+    """
+    Hold an exclusive lock on the manifest of `directory`, since artifacts
+    in the same directory can be built concurrently by separate processes
+    """
+    with open(join(directory, _LOCK_FILENAME), 'a') as f:
+        fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+def read_manifest(directory):
+    """
+    Dictionary mapping the name of each artifact recorded in `directory`
+    to its entry, empty if nothing has been recorded there yet
+    """
+    path = _manifest_path(directory)
+    if not exists(path):
+        return {}
+    with open(path) as f:
+        return json.load(f)
+
+def _write_manifest(directory, manifest):
+    path = _manifest_path(directory)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(manifest, f, indent = 2, sort_keys = True)
+    rename(tmp_path, path)
+
+def file_sha1(path, chunk_size = 2 ** 20):
+    sha1 = hashlib.sha1()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), ''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+def _normalize(params):
+    # compare parameters the way they come back out of the JSON file,
+    # e.g. with tuples as lists and strings as unicode
+    return json.loads(json.dumps(params, sort_keys = True))
+
+def record_artifact(path, params, files = None):
+    """
+    Record the artifact at `path` as completely built.
+
+    Parameters
+    ----------
+    path : str
+        Path of the artifact, which is recorded in the manifest of the
+        directory containing it
+
+    params : dict
+        JSON-serializable parameters the artifact was built with
+
+    files : list of str, optional
+        Paths of the files making up the artifact. By default either the
+        file at `path` or, if `path` is a directory, the files in it.
+    """
+    directory = dirname(path)
+    if files is None:
+        if isdir(path):
+            files = [join(path, name) for name in sorted(listdir(path))]
+        else:
+            files = [path]
+    entry = {
+        'params' : _normalize(params),
+        'files' : dict(
+            (relpath(f, directory), {
+                'size' : getsize(f),
+                'sha1' : file_sha1(f),
+            })
+            for f in files
+        ),
+    }
+    with _locked(directory):
+        manifest = read_manifest(directory)
+        manifest[basename(path)] = entry
+        _write_manifest(directory, manifest)
+
+def forget_artifact(path):
+    """
+    Remove the artifact at `path` from its manifest, so it gets rebuilt
+    """
+    directory = dirname(path)
+    with _locked(directory):
+        manifest = read_manifest(directory)
+        if manifest.pop(basename(path), None) is not None:
+            _write_manifest(directory, manifest)
+
+def _check_entry(directory, name, entry, full):
+    for (filename, info) in sorted(entry['files'].iteritems()):
+        file_path = join(directory, filename)
+        if not exists(file_path):
+            logging.warning("%s is missing %s", name, file_path)
+            return False
+        if getsize(file_path) != info['size']:
+            logging.warning(
+                "Expected %s to have %d bytes, got %d",
+                file_path,
+                info['size'],
+                getsize(file_path))
+            return False
+        if full and file_sha1(file_path) != info['sha1']:
+            logging.warning("SHA-1 hash of %s doesn't match", file_path)
+            return False
+    return True
+
+def verify_artifact(path, params, full = False):
+    """
+    True if the artifact at `path` was recorded with the same parameters
+    and its files still have their recorded sizes (and, if `full` is True,
+    their recorded hashes).
+    """
+    directory = dirname(path)
+    name = basename(path)
+    entry = read_manifest(directory).get(name)
+    if entry is None:
+        logging.info("No complete build of %s in %s", name, directory)
+        return False
+    if entry['params'] != _normalize(params):
+        logging.warning(
+            "%s was built with %s, expected %s",
+            path,
+            entry['params'],
+            params)
+        return False
+    return _check_entry(directory, name, entry, full)
+
+def verify_directory(directory):
+    """
+    Check the sizes and hashes of every artifact recorded in `directory`,
+    returning the paths of the ones which don't match.
+    """
+    failed = []
+    for (name, entry) in sorted(read_manifest(directory).iteritems()):
+        if not _check_entry(directory, name, entry, full = True):
+            failed.append(join(directory, name))
+    return failed
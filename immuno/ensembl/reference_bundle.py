@@ -0,0 +1,106 @@
+# Copyright (c) 2014. Mount Sinai School of Medicine
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Every reference file which gets downloaded (Ensembl annotation dumps,
+transcript sequences, gene name tables) or built from those downloads goes
+into one cache directory named after the genome assembly and Ensembl
+release. Files from different releases never mix, so switching between
+releases (with the IMMUNO_ENSEMBL_RELEASE environment variable) reuses
+whatever was already built for each of them, and the whole bundle can be
+prepared ahead of time with prepare_reference.py.
+"""
+
+from collections import namedtuple
+from os import environ
+from os.path import join
+
+import datacache
+
+ENSEMBL_RELEASE = int(environ.get("IMMUNO_ENSEMBL_RELEASE", 75))
+
+# release 75 was the last one on GRCh37
+GENOME_ASSEMBLY = "GRCh37" if ENSEMBL_RELEASE <= 75 else "GRCh38"
+
+BUNDLE_NAME = "%s.%d" % (GENOME_ASSEMBLY, ENSEMBL_RELEASE)
+
+# datacache subdirectory holding the bundle
+BUNDLE_SUBDIR = join("immuno", BUNDLE_NAME)
+
+_ENSEMBL_FTP_URL = "ftp://ftp.ensembl.org/pub/release-%d" % ENSEMBL_RELEASE
+
+def mysql_dump_url(table_name):
+    """
+    URL of a table from the MySQL dump of the human core database
+    """
+    return "%s/mysql/homo_sapiens_core_%d_%s/%s.txt.gz" % (
+        _ENSEMBL_FTP_URL,
+        ENSEMBL_RELEASE,
+        GENOME_ASSEMBLY[-2:],
+        table_name)
+
+def fasta_url(sequence_type):
+    """
+    URL of the FASTA file of all human transcript sequences of the given
+    type ("cdna", "cds" or "pep")
+    """
+    if ENSEMBL_RELEASE <= 75:
+        filename = "Homo_sapiens.%s.%d.%s.all.fa.gz" % (
+            GENOME_ASSEMBLY, ENSEMBL_RELEASE, sequence_type)
+    else:
+        # later releases dropped the release number from FASTA filenames
+        filename = "Homo_sapiens.%s.%s.all.fa.gz" % (
+            GENOME_ASSEMBLY, sequence_type)
+    return "%s/fasta/homo_sapiens/%s/%s" % (
+        _ENSEMBL_FTP_URL, sequence_type, filename)
+
+# archived BioMart of each release, releases without a known archive fall
+# back on the current BioMart
+_BIOMART_HOSTS = {
+    75 : "feb2014.archive.ensembl.org",
+    76 : "aug2014.archive.ensembl.org",
+    77 : "oct2014.archive.ensembl.org",
+    78 : "dec2014.archive.ensembl.org",
+}
+
+def biomart_url(query):
+    return "http://%s/biomart/martservice/result?query=%s" % (
+        _BIOMART_HOSTS.get(ENSEMBL_RELEASE, "www.ensembl.org"), query)
+
+def bundle_path(filename):
+    """
+    Path of a file in the reference bundle (creating the bundle directory
+    if it doesn't exist)
+    """
+    return datacache.build_path(filename, subdir = BUNDLE_SUBDIR)
+
+class ReferenceFile(namedtuple("ReferenceFile", "url filename decompress")):
+    """
+    Remote file which gets downloaded into the reference bundle as
+    `filename`, decompressing it first if `decompress` is True.
+    """
+
+    def local_path(self):
+        return bundle_path(self.filename)
+
+    def fetch(self):
+        """
+        Download the file unless it's already in the bundle and return
+        its local path
+        """
+        return datacache.fetch_file(
+            self.url,
+            filename = self.filename,
+            decompress = self.decompress,
+            subdir = BUNDLE_SUBDIR)
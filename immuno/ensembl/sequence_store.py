@@ -0,0 +1,198 @@
+# Copyright (c) 2014. Mount Sinai School of Medicine
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Read-only store for the sequences of a FASTA file: all the sequences
+concatenated into one file, plus a sorted array of their IDs with the
+offset and length of each sequence. Everything is memory-mapped, so
+looking up a sequence is a binary search and a slice, and processes
+reading the same store share the operating system's page cache.
+"""
+
+import gzip
+import logging
+import mmap
+from os import rename
+from os.path import exists, getsize
+
+import numpy as np
+
+def _ids_path(path):
+    return path + ".ids.npy"
+
+def _offsets_path(path):
+    return path + ".offsets.npy"
+
+def _lengths_path(path):
+    return path + ".lengths.npy"
+
+def _sequences_path(path):
+    return path + ".seq"
+
+def sequence_store_files(path):
+    """
+    Paths of all the files making up the store at `path`
+    """
+    return [
+        _ids_path(path),
+        _offsets_path(path),
+        _lengths_path(path),
+        _sequences_path(path),
+    ]
+
+def sequence_store_exists(path):
+    return all(exists(p) for p in sequence_store_files(path))
+
+def _open_fasta(fasta_path):
+    if fasta_path.endswith(".gz"):
+        return gzip.open(fasta_path, 'rb')
+    else:
+        return open(fasta_path, 'rb')
+
+def _read_lines(fasta_path, chunk_size = 2 ** 20):
+    """
+    Generator over the lines of a (possibly gzip'd) FASTA file, without
+    their line endings. The file is read in large chunks since iterating
+    over a GzipFile line by line is several times slower.
+    """
+    with _open_fasta(fasta_path) as f:
+        remainder = ""
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            lines = (remainder + chunk).split("\n")
+            remainder = lines.pop()
+            for line in lines:
+                yield line
+        if remainder:
+            yield remainder
+
+def read_fasta(fasta_path):
+    """
+    Generator over the (ID, sequence) pairs of a (possibly gzip'd) FASTA
+    file, where an ID is the first word of a header line. Unlike
+    BioPython's parser, this doesn't build a record object per sequence.
+    """
+    sequence_id = None
+    lines = []
+    for line in _read_lines(fasta_path):
+        if line.startswith(">"):
+            if sequence_id is not None:
+                yield sequence_id, "".join(lines)
+            sequence_id = line[1:].split(None, 1)[0]
+            lines = []
+        else:
+            lines.append(line.strip())
+    if sequence_id is not None:
+        yield sequence_id, "".join(lines)
+
+def build_sequence_store(fasta_path, path):
+    """
+    Write the sequences of a (possibly gzip'd) FASTA file to a store with
+    the given path prefix. A sequence's ID is the first word of its
+    header line, and only the first sequence with each ID is kept.
+    """
+    ids = []
+    offsets = []
+    lengths = []
+    tmp_sequences_path = _sequences_path(path) + ".tmp"
+    offset = 0
+    with open(tmp_sequences_path, 'wb') as out:
+        length = 0
+        for line in _read_lines(fasta_path):
+            if line.startswith(">"):
+                if len(ids) > 0:
+                    lengths.append(length)
+                    offset += length
+                ids.append(line[1:].split(None, 1)[0])
+                offsets.append(offset)
+                length = 0
+            else:
+                line = line.strip()
+                out.write(line)
+                length += len(line)
+        if len(ids) > 0:
+            lengths.append(length)
+
+    ids = np.array(ids, dtype=str)
+    order = np.argsort(ids, kind='mergesort')
+    ids = ids[order]
+    # drop repeated IDs, keeping the first occurrence in the FASTA file
+    unique = np.ones(len(ids), dtype=bool)
+    unique[1:] = ids[1:] != ids[:-1]
+    if not unique.all():
+        logging.warning(
+            "Dropping %d repeated IDs from %s", (~unique).sum(), fasta_path)
+    order = order[unique]
+
+    np.save(_ids_path(path), ids[unique])
+    np.save(_offsets_path(path), np.array(offsets, dtype=np.int64)[order])
+    np.save(_lengths_path(path), np.array(lengths, dtype=np.int64)[order])
+    # the sequence file is renamed last since its presence is what
+    # marks the store as complete
+    rename(tmp_sequences_path, _sequences_path(path))
+    logging.info("Wrote %d sequences from %s to %s",
+        len(order), fasta_path, path)
+
+
+class SequenceStore(object):
+    """
+    Memory-mapped store of sequences written by build_sequence_store
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._ids = np.load(_ids_path(path), mmap_mode='r')
+        self._offsets = np.load(_offsets_path(path), mmap_mode='r')
+        self._lengths = np.load(_lengths_path(path), mmap_mode='r')
+        sequences_path = _sequences_path(path)
+        with open(sequences_path, 'rb') as f:
+            # mmap can't map an empty file
+            if getsize(sequences_path) > 0:
+                self._sequences = mmap.mmap(
+                    f.fileno(), 0, access = mmap.ACCESS_READ)
+            else:
+                self._sequences = ""
+
+    def __len__(self):
+        return len(self._ids)
+
+    def _find(self, sequence_id):
+        i = np.searchsorted(self._ids, sequence_id)
+        if i < len(self._ids) and self._ids[i] == sequence_id:
+            return i
+        return None
+
+    def __contains__(self, sequence_id):
+        return self._find(sequence_id) is not None
+
+    def get(self, sequence_id):
+        """
+        Returns the sequence with the given ID, or None if it's missing
+        """
+        i = self._find(sequence_id)
+        if i is None:
+            return None
+        start = int(self._offsets[i])
+        return self._sequences[start : start + int(self._lengths[i])]
+
+    def get_many(self, sequence_ids):
+        """
+        Returns dictionary mapping each of the given IDs to its sequence
+        (or None if it's missing)
+        """
+        return dict(
+            (sequence_id, self.get(sequence_id))
+            for sequence_id in set(sequence_ids))
@@ -13,67 +13,158 @@
 # limitations under the License.
 
 import logging
-from os.path import join
+from os import environ, remove, rename
+from os.path import basename, exists, splitext
 import sqlite3
+import time
 
-from Bio import SeqIO
-import appdirs
-from datacache import fetch_fasta_db, ensure_dir
+from immuno.dna import translate
+from immuno.lru_cache import LRUCache
+from manifest import record_artifact, verify_artifact
+from reference_bundle import ReferenceFile, fasta_url
+from sequence_store import (
+    SequenceStore, build_sequence_store, sequence_store_files, read_fasta
+)
 
-CDNA_TRANSCRIPT_URL = \
-'ftp://ftp.ensembl.org/pub/release-75/fasta/homo_sapiens/cdna/Homo_sapiens.GRCh37.75.cdna.all.fa.gz'
+CDNA_TRANSCRIPT_URL = fasta_url("cdna")
 
-CDNA_TRANSCRIPT_FILE = 'Homo_sapiens.GRCh37.75.cdna.all.fa'
+CDNA_TRANSCRIPT_FILE = basename(CDNA_TRANSCRIPT_URL)
 
-def _build_cdna_db():
+CDS_TRANSCRIPT_URL = fasta_url("cds")
+
+CDS_TRANSCRIPT_FILE = basename(CDS_TRANSCRIPT_URL)
+
+PROTEIN_TRANSCIPT_URL = fasta_url("pep")
+
+PROTEIN_TRANSCRIPT_FILE = basename(PROTEIN_TRANSCIPT_URL)
+
+# the FASTA files are kept gzip'd since they're only ever streamed
+# through once to build a database or sequence store
+_FASTA_SOURCES = {
+    "CDNA" : ReferenceFile(CDNA_TRANSCRIPT_URL, CDNA_TRANSCRIPT_FILE, False),
+    "CDS" : ReferenceFile(CDS_TRANSCRIPT_URL, CDS_TRANSCRIPT_FILE, False),
+    "PROTEIN" : ReferenceFile(
+        PROTEIN_TRANSCIPT_URL, PROTEIN_TRANSCRIPT_FILE, False),
+}
+
+# FASTA files of reference sequences
+REFERENCE_FILES = [
+    _FASTA_SOURCES[table_name] for table_name in sorted(_FASTA_SOURCES)
+]
+
+def _unique_sequences(fasta_path):
+    """
+    Sequences of a FASTA file, keeping only the first one with each ID
     """
-    Download a FASTA file containing cDNA sequences for each known transcript,
-    return sqlite3 database mapping ensembl transcript IDs to cDNA sequences.
+    seen = set()
+    n_repeated = 0
+    for (sequence_id, seq) in read_fasta(fasta_path):
+        if sequence_id in seen:
+            n_repeated += 1
+        else:
+            seen.add(sequence_id)
+            yield sequence_id, seq
+    if n_repeated > 0:
+        logging.warning(
+            "Dropped %d repeated IDs from %s", n_repeated, fasta_path)
+
+def build_sequence_db(fasta_path, db_path, table_name):
     """
-    return fetch_fasta_db(
-        table_name = "CDNA",
-        fasta_filename = CDNA_TRANSCRIPT_FILE,
-        download_url = CDNA_TRANSCRIPT_URL,
-        key_column = 'id',
-        value_column = 'seq',
-        subdir = "immuno")
+    Load the sequences of a (possibly gzip'd) FASTA file into the table
+    `table_name` (with columns id and seq) of a new SQLite database.
 
-CDS_TRANSCRIPT_URL = \
-'ftp://ftp.ensembl.org/pub/release-75/fasta/homo_sapiens/cds/Homo_sapiens.GRCh37.75.cds.all.fa.gz'
+    The rows are streamed into a single executemany with journaling and
+    syncing turned off, and the index on id is only built once they're
+    all in, which is much faster than maintaining it during the load.
+    The database is written under a temporary name, so an interrupted
+    build is never mistaken for a complete one.
+    """
+    start_time = time.time()
+    tmp_path = db_path + ".tmp"
+    if exists(tmp_path):
+        remove(tmp_path)
+    db = sqlite3.connect(tmp_path)
+    try:
+        db.execute("PRAGMA journal_mode = OFF")
+        db.execute("PRAGMA synchronous = OFF")
+        db.execute("CREATE TABLE %s (id TEXT NOT NULL, seq TEXT)" % table_name)
+        with db:
+            db.executemany(
+                "INSERT INTO %s VALUES (?, ?)" % table_name,
+                _unique_sequences(fasta_path))
+        n_rows = db.execute(
+            "SELECT COUNT(*) FROM %s" % table_name).fetchone()[0]
+        load_time = time.time() - start_time
+        db.execute("CREATE UNIQUE INDEX %s_id ON %s (id)" % (
+            table_name, table_name))
+        db.commit()
+    finally:
+        db.close()
+    rename(tmp_path, db_path)
+    elapsed = time.time() - start_time
+    logging.info(
+        "Loaded %d rows into %s in %0.2fs (%d rows/sec, %0.2fs indexing)",
+        n_rows,
+        db_path,
+        elapsed,
+        n_rows / max(elapsed, 10.0 ** -6),
+        elapsed - load_time)
 
-CDS_TRANSCRIPT_FILE = 'Homo_sapiens.GRCh37.75.cds.all.fa'
+def _build_sequence_db(table_name):
+    """
+    Download the FASTA file for the given kind of sequence and return a
+    connection to a SQLite database of its contents, building it if needed.
+    """
+    reference_file = _FASTA_SOURCES[table_name]
+    fasta_path = reference_file.fetch()
+    db_path = splitext(fasta_path)[0] + ".db"
+    params = {'source' : reference_file.url, 'table' : table_name}
+    if not verify_artifact(db_path, params):
+        build_sequence_db(fasta_path, db_path, table_name)
+        record_artifact(db_path, params)
+    return sqlite3.connect(db_path)
 
-def _build_cds_db():
+def _build_sequence_store(table_name):
     """
-    Download a FASTA file containing CDS sequences for each known transcript,
-    return sqlite3 database mapping ensembl transcript IDs to CDS sequences.
+    Download the FASTA file for the given kind of sequence and return a
+    memory-mapped SequenceStore of its contents, building it if needed.
     """
-    return fetch_fasta_db(
-        table_name = "CDS",
-        fasta_filename = CDS_TRANSCRIPT_FILE,
-        download_url = CDS_TRANSCRIPT_URL,
-        key_column = 'id',
-        value_column = 'seq',
-        subdir = "immuno")
+    reference_file = _FASTA_SOURCES[table_name]
+    fasta_path = reference_file.fetch()
+    store_path = splitext(fasta_path)[0]
+    params = {'source' : reference_file.url}
+    if not verify_artifact(store_path, params):
+        build_sequence_store(fasta_path, store_path)
+        record_artifact(store_path, params, sequence_store_files(store_path))
+    return SequenceStore(store_path)
+
+# Reference sequences are either looked up in SQLite tables or in
+# memory-mapped sequence stores which can be shared between processes
+SQLITE_BACKEND = "sqlite"
+MMAP_BACKEND = "mmap"
+
+DEFAULT_BACKEND = environ.get("IMMUNO_SEQUENCE_BACKEND", SQLITE_BACKEND)
+
+# SQLite limits the number of parameters in a single query to 999
+QUERY_CHUNK_SIZE = 500
 
-PROTEIN_TRANSCIPT_URL = \
-'ftp://ftp.ensembl.org/pub/release-75/fasta/homo_sapiens/pep/Homo_sapiens.GRCh37.75.pep.all.fa.gz'
+# how many sequences of each kind to keep in memory
+SEQUENCE_CACHE_SIZE = 20000
 
-PROTEIN_TRANSCRIPT_FILE = 'Homo_sapiens.GRCh37.75.pep.all.fa'
+# how many translated reference CDS sequences to keep in memory
+TRANSLATION_CACHE_SIZE = 5000
 
-def _build_protein_db():
+def _tune_read_only_db(db):
     """
-    Downloads a FASTA file containing amino acid sequences of human
-    transcripts, return sqlite3 database mapping ensembl protein IDs to
-    amino acid sequences.
+    The sequence databases are never modified after they're built, so let
+    SQLite memory-map them and keep more of their pages cached.
     """
-    return fetch_fasta_db(
-        table_name = "PROTEIN",
-        fasta_filename = PROTEIN_TRANSCRIPT_FILE,
-        download_url = PROTEIN_TRANSCIPT_URL,
-        key_column = 'id',
-        value_column = 'seq',
-        subdir = "immuno")
+    db.execute("PRAGMA query_only = ON")
+    db.execute("PRAGMA mmap_size = %d" % 2 ** 30)
+    # negative cache sizes are in KiB rather than pages
+    db.execute("PRAGMA cache_size = -%d" % (64 * 1024))
+    db.execute("PRAGMA temp_store = MEMORY")
+    return db
 
 def _exec_transcript_query(db, table_name, transcript_id):
     query = "select seq from %s where id = ?" % table_name
@@ -88,31 +179,156 @@ def _exec_transcript_query(db, table_name, transcript_id):
         # return the first element of result tuple
         return result[0]
 
+def _exec_transcript_many_query(db, table_name, transcript_ids):
+    """
+    Returns dictionary mapping each transcript ID found in the table to
+    its sequence, querying up to QUERY_CHUNK_SIZE IDs at a time.
+    """
+    transcript_ids = list(transcript_ids)
+    result = {}
+    for i in xrange(0, len(transcript_ids), QUERY_CHUNK_SIZE):
+        chunk = transcript_ids[i:i + QUERY_CHUNK_SIZE]
+        query = "select id, seq from %s where id in (%s)" % (
+            table_name, ",".join("?" * len(chunk)))
+        for (transcript_id, seq) in db.execute(query, chunk):
+            result[transcript_id] = seq
+    return result
+
 class EnsemblReferenceData(object):
     """
     Singleton class which allows for lazy loading of reference
     cDNA and amino acid sequences of transcripts
     """
-    def __init__(self):
-        self._cdna_db = None
-        self._cds_db = None
-        self._protein_db = None
+    def __init__(
+            self,
+            cache_size = SEQUENCE_CACHE_SIZE,
+            backend = DEFAULT_BACKEND,
+            translation_cache_size = TRANSLATION_CACHE_SIZE):
+        assert backend in (SQLITE_BACKEND, MMAP_BACKEND), \
+            "Unknown sequence backend %s" % backend
+        self.backend = backend
+        self._dbs = {}
+        self._stores = {}
+        self._caches = dict(
+            (table_name, LRUCache(cache_size))
+            for table_name in _FASTA_SOURCES)
+        self._translations = LRUCache(translation_cache_size)
+
+    def _get_db(self, table_name):
+        if table_name not in self._dbs:
+            db = _build_sequence_db(table_name)
+            self._dbs[table_name] = _tune_read_only_db(db)
+        return self._dbs[table_name]
+
+    def _get_store(self, table_name):
+        if table_name not in self._stores:
+            self._stores[table_name] = _build_sequence_store(table_name)
+        return self._stores[table_name]
+
+    def preload(self, table_names = None):
+        """
+        Open the databases (or sequence stores) of the given tables, by
+        default all of them, so that the first lookup doesn't pay for
+        building or opening them.
+        """
+        if table_names is None:
+            table_names = sorted(_FASTA_SOURCES)
+        for table_name in table_names:
+            if self.backend == MMAP_BACKEND:
+                self._get_store(table_name)
+            else:
+                self._get_db(table_name)
+
+    def reset_connections(self):
+        """
+        Forget open database connections, which can't be used from a forked
+        process. Each process then opens its own connections as needed,
+        while cached sequences and memory-mapped stores are kept.
+        """
+        self._dbs = {}
+
+    def _get(self, table_name, transcript_id):
+        if self.backend == MMAP_BACKEND:
+            # slicing the memory-mapped store is cheap enough that
+            # there's no point in keeping another copy in a cache
+            seq = self._get_store(table_name).get(transcript_id)
+            if seq is None:
+                logging.warning("No entries found with transcript_id = %s",
+                    transcript_id)
+            return seq
+        cache = self._caches[table_name]
+        if transcript_id in cache:
+            return cache[transcript_id]
+        seq = _exec_transcript_query(
+            self._get_db(table_name), table_name, transcript_id)
+        cache[transcript_id] = seq
+        return seq
+
+    def _get_many(self, table_name, transcript_ids):
+        """
+        Returns dictionary mapping each of the given transcript IDs to its
+        sequence (or None if it's missing), only querying the database for
+        IDs which aren't already cached.
+        """
+        if self.backend == MMAP_BACKEND:
+            return dict(
+                (transcript_id, self._get(table_name, transcript_id))
+                for transcript_id in set(transcript_ids))
+        cache = self._caches[table_name]
+        result = {}
+        missing = []
+        for transcript_id in set(transcript_ids):
+            if transcript_id in cache:
+                result[transcript_id] = cache[transcript_id]
+            else:
+                missing.append(transcript_id)
+        if len(missing) > 0:
+            found = _exec_transcript_many_query(
+                self._get_db(table_name), table_name, missing)
+            for transcript_id in missing:
+                seq = found.get(transcript_id)
+                if seq is None:
+                    logging.warning(
+                        "No entries found with transcript_id = %s",
+                        transcript_id)
+                cache[transcript_id] = seq
+                result[transcript_id] = seq
+        return result
 
     def get_cdna(self, transcript_id):
-        if self._cdna_db is None:
-            self._cdna_db = _build_cdna_db()
-        return _exec_transcript_query(
-            self._cdna_db, "CDNA", transcript_id)
+        return self._get("CDNA", transcript_id)
 
     def get_cds(self, transcript_id):
-        if self._cds_db is None:
-            self._cds_db = _build_cds_db()
-        return _exec_transcript_query(
-            self._cds_db, "CDS", transcript_id)
+        return self._get("CDS", transcript_id)
 
     def get_protein(self, transcript_id):
-        if self._protein_db is None:
-            self._protein_db = _build_protein_db()
-        print transcript_id
-        return _exec_transcript_query(
-            self._protein_db, "PROTEIN", transcript_id)
+        return self._get("PROTEIN", transcript_id)
+
+    def get_cds_translation(self, transcript_id):
+        """
+        Returns the amino acid translation of a transcript's CDS (including
+        any stop codons), or None if the CDS is missing. Each transcript is
+        only translated the first time it's requested, as long as its
+        translation stays in the cache.
+
+        Unlike get_protein, which looks up Ensembl's own protein sequences
+        by protein ID, this always matches the sequence which mutated CDS
+        sequences are compared against.
+        """
+        translation = self._translations.get(transcript_id)
+        if translation is None:
+            cds = self.get_cds(transcript_id)
+            if not cds:
+                return None
+            translation = translate(cds)
+            self._translations[transcript_id] = translation
+        return translation
+
+    def get_cdna_many(self, transcript_ids):
+        return self._get_many("CDNA", transcript_ids)
+
+    def get_cds_many(self, transcript_ids):
+        return self._get_many("CDS", transcript_ids)
+
+    def get_protein_many(self, transcript_ids):
+        return self._get_many("PROTEIN", transcript_ids)
@@ -12,18 +12,19 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from os.path import exists
+from os import rename
+from os.path import basename, splitext
 
 import hashlib
 import base64
 import logging
 
+import numpy as np
 import pandas as pd
-import datacache 
-from datacache import build_path
 
-def fetch_file(url, decompress = True):
-    return datacache.fetch_file(url, decompress = decompress, subdir = "immuno")
+from columnar import write_columns, write_column_arrays
+from manifest import record_artifact, verify_artifact
+from reference_bundle import ReferenceFile, bundle_path, mysql_dump_url
 
 STANDARD_CONTIGS = set([
     '1', '2', '3', '4', '5', '6', '7', '8', '9', '10', '11', '12', '13', '14',
@@ -41,13 +42,11 @@ GENE_HEADER = [
     'version', 'created_date', 'modified_date'
 ]
 
-GENE_DATA_URL = \
-"ftp://ftp.ensembl.org/pub/release-75/mysql/homo_sapiens_core_75_37/gene.txt.gz"
+GENE_DATA_URL = mysql_dump_url("gene")
 
 SEQ_REGION_HEADER = ['seq_region_id', 'name', 'coord_system_id']
 
-SEQ_REGION_DATA_URL = \
-"ftp://ftp.ensembl.org/pub/release-75/mysql/homo_sapiens_core_75_37/seq_region.txt.gz"
+SEQ_REGION_DATA_URL = mysql_dump_url("seq_region")
 
 EXON_HEADER = [
     "exon_id", "seq_region_id", "seq_region_start",
@@ -56,8 +55,7 @@ EXON_HEADER = [
     "created_date", "modified_date"
 ]
 
-EXON_DATA_URL = \
-"ftp://ftp.ensembl.org/pub/release-75/mysql/homo_sapiens_core_75_37/exon.txt.gz"
+EXON_DATA_URL = mysql_dump_url("exon")
 
 TRANSCRIPT_HEADER = [
     "transcript_id", "gene_id", "analysis_id",
@@ -67,11 +65,9 @@ TRANSCRIPT_HEADER = [
     "version", "created_date", "modified_date"
 ]
 
-TRANSCRIPT_DATA_URL = \
-"ftp://ftp.ensembl.org/pub/release-75/mysql/homo_sapiens_core_75_37/transcript.txt.gz"
+TRANSCRIPT_DATA_URL = mysql_dump_url("transcript")
 
-EXON_TRANSCRIPT_DATA_URL = \
-"ftp://ftp.ensembl.org/pub/release-75/mysql/homo_sapiens_core_75_37/exon_transcript.txt.gz"
+EXON_TRANSCRIPT_DATA_URL = mysql_dump_url("exon_transcript")
 
 TRANSLATION_HEADER = [
     "translation_id", "transcript_id", "seq_start",
@@ -79,8 +75,28 @@ TRANSLATION_HEADER = [
     "stable_id","version", "created_date", "modified_date"
 ]
 
-TRANSLATION_DATA_URL = \
-"ftp://ftp.ensembl.org/pub/release-75/mysql/homo_sapiens_core_75_37/translation.txt.gz"
+TRANSLATION_DATA_URL = mysql_dump_url("translation")
+
+GENE_DATA_FILE = ReferenceFile(GENE_DATA_URL, "gene.txt", True)
+SEQ_REGION_DATA_FILE = \
+    ReferenceFile(SEQ_REGION_DATA_URL, "seq_region.txt", True)
+EXON_DATA_FILE = ReferenceFile(EXON_DATA_URL, "exon.txt", True)
+TRANSCRIPT_DATA_FILE = \
+    ReferenceFile(TRANSCRIPT_DATA_URL, "transcript.txt", True)
+TRANSLATION_DATA_FILE = \
+    ReferenceFile(TRANSLATION_DATA_URL, "translation.txt", True)
+EXON_TRANSCRIPT_DATA_FILE = \
+    ReferenceFile(EXON_TRANSCRIPT_DATA_URL, "exon_transcript.txt", True)
+
+# downloads needed to build the transcript metadata table
+REFERENCE_FILES = [
+    GENE_DATA_FILE,
+    SEQ_REGION_DATA_FILE,
+    EXON_DATA_FILE,
+    TRANSCRIPT_DATA_FILE,
+    TRANSLATION_DATA_FILE,
+    EXON_TRANSCRIPT_DATA_FILE,
+]
 
 def short_hash(s, n = 4):
     return base64.urlsafe_b64encode(hashlib.sha1(s).digest())[:n]
@@ -96,6 +112,263 @@ def versioned_filename(base, deps, ext):
         result = result + "_" + short_hash(dep)
     return result + "." + ext
 
+TRANSCRIPT_METADATA_COLUMNS = [
+    'name',
+    'stable_id_gene',
+    'description_gene',
+    'seq_region_start_gene',
+    'seq_region_end_gene',
+    'seq_region_strand_gene',
+    'stable_id_transcript',
+    'seq_region_start_transcript',
+    'seq_region_end_transcript',
+    'biotype',
+    'is_canonical',
+    'seq_start',
+    'start_exon_id',
+    'seq_end',
+    'end_exon_id',
+    'stable_id_translation',
+    'stable_id_exon',
+    'exon_id',
+    'rank',
+    'phase',
+    'seq_region_start_exon',
+    'seq_region_end_exon']
+
+# columns of each dump needed to build the transcript metadata table, with
+# dtypes small enough for every value in them (Ensembl IDs and positions
+# fit in 32 bits)
+_SEQ_REGION_DTYPES = {
+    'seq_region_id' : np.int32,
+    'name' : str,
+}
+
+_GENE_DTYPES = {
+    'gene_id' : np.int32,
+    'seq_region_id' : np.int32,
+    'seq_region_start' : np.int32,
+    'seq_region_end' : np.int32,
+    'seq_region_strand' : np.int8,
+    'description' : object,
+    'canonical_transcript_id' : np.int32,
+    'stable_id' : object,
+}
+
+_TRANSCRIPT_DTYPES = {
+    'transcript_id' : np.int32,
+    'gene_id' : np.int32,
+    'seq_region_start' : np.int32,
+    'seq_region_end' : np.int32,
+    'biotype' : object,
+    'stable_id' : object,
+}
+
+_TRANSLATION_DTYPES = {
+    'transcript_id' : np.int32,
+    'seq_start' : np.int32,
+    'start_exon_id' : np.int32,
+    'seq_end' : np.int32,
+    'end_exon_id' : np.int32,
+    'stable_id' : object,
+}
+
+_EXON_DTYPES = {
+    'exon_id' : np.int32,
+    'seq_region_start' : np.int32,
+    'seq_region_end' : np.int32,
+    'phase' : np.int8,
+    'stable_id' : object,
+}
+
+_EXON_TRANSCRIPT_HEADER = ['exon_id', 'transcript_id', 'rank']
+
+_EXON_TRANSCRIPT_DTYPES = {
+    'exon_id' : np.int32,
+    'transcript_id' : np.int32,
+    'rank' : np.int16,
+}
+
+# number of rows of a dump parsed at a time, and of the output table
+# formatted at a time
+_CHUNK_SIZE = 100000
+
+def _read_dump(path, header, dtypes, keep = None):
+    """
+    Read the columns in `dtypes` from a tab-separated Ensembl MySQL dump,
+    a chunk at a time. If given, `keep` is called on each chunk and returns
+    a mask of the rows to keep, so that unneeded rows never pile up.
+    """
+    chunks = []
+    for chunk in pd.read_csv(
+            path,
+            sep = '\t',
+            names = header,
+            usecols = list(dtypes),
+            dtype = dtypes,
+            index_col = False,
+            chunksize = _CHUNK_SIZE):
+        if keep is not None:
+            chunk = chunk[keep(chunk)]
+        chunks.append(chunk)
+    if len(chunks) == 1:
+        return chunks[0]
+    return pd.concat(chunks, ignore_index = True)
+
+def _lookup(keys, values):
+    """
+    Position in `keys` (which must be unique) of each element of `values`,
+    or -1 for elements which aren't in it
+    """
+    keys = np.asarray(keys)
+    values = np.asarray(values)
+    if len(keys) == 0:
+        return -np.ones(len(values), dtype=int)
+    order = np.argsort(keys, kind='mergesort')
+    sorted_keys = keys[order]
+    assert (sorted_keys[1:] != sorted_keys[:-1]).all(), \
+        "Expected unique keys"
+    i = np.searchsorted(sorted_keys, values)
+    i[i == len(keys)] = 0
+    return np.where(sorted_keys[i] == values, order[i], -1)
+
+def _build_transcript_metadata(paths, filter_contigs):
+    """
+    Join the dumps at `paths` (gene, seq_region, exon, transcript,
+    translation and exon_transcript), returning the length of the joined
+    table and a function which materializes its given column for a slice
+    of its rows.
+
+    Rows are filtered down to the given contigs before anything else, every
+    join is a lookup of integer IDs, and the joined table itself is only
+    kept as arrays of row numbers into each of the dumps. Rows come out
+    in the same order as merging the full DataFrames in pandas:
+    transcripts in order of their first exon in exon.txt, and each
+    transcript's rows in exon.txt order.
+    """
+    (gene_path, seq_region_path, exon_path, transcript_path,
+        translation_path, exon_transcript_path) = paths
+
+    seq_region = _read_dump(
+        seq_region_path, SEQ_REGION_HEADER, _SEQ_REGION_DTYPES)
+    if filter_contigs:
+        seq_region = seq_region[
+            seq_region['name'].isin(list(filter_contigs)).values]
+    seq_region_ids = seq_region['seq_region_id'].values
+
+    gene = _read_dump(
+        gene_path, GENE_HEADER, _GENE_DTYPES,
+        keep = lambda df: np.in1d(df['seq_region_id'].values, seq_region_ids))
+
+    translation = _read_dump(
+        translation_path, TRANSLATION_HEADER, _TRANSLATION_DTYPES)
+    # only transcripts with a translation on one of the kept genes
+    transcript = _read_dump(
+        transcript_path, TRANSCRIPT_HEADER, _TRANSCRIPT_DTYPES,
+        keep = lambda df: (
+            np.in1d(df['gene_id'].values, gene['gene_id'].values) &
+            np.in1d(df['transcript_id'].values,
+                translation['transcript_id'].values)))
+    exon_transcript = _read_dump(
+        exon_transcript_path, _EXON_TRANSCRIPT_HEADER, _EXON_TRANSCRIPT_DTYPES,
+        keep = lambda df: np.in1d(
+            df['transcript_id'].values, transcript['transcript_id'].values))
+    exon = _read_dump(
+        exon_path, EXON_HEADER, _EXON_DTYPES,
+        keep = lambda df: np.in1d(
+            df['exon_id'].values, exon_transcript['exon_id'].values))
+
+    exon_rows = _lookup(
+        exon['exon_id'].values, exon_transcript['exon_id'].values)
+    exon_transcript_rows = np.where(exon_rows >= 0)[0]
+    exon_rows = exon_rows[exon_transcript_rows]
+    # exons in exon.txt order, each exon's transcripts in
+    # exon_transcript.txt order
+    order = np.argsort(exon_rows, kind='mergesort')
+    exon_transcript_rows = exon_transcript_rows[order]
+    exon_rows = exon_rows[order]
+    # then grouped by transcript, in order of each transcript's first row
+    _, first_rows, transcript_groups = np.unique(
+        exon_transcript['transcript_id'].values[exon_transcript_rows],
+        return_index = True,
+        return_inverse = True)
+    order = np.argsort(first_rows[transcript_groups], kind='mergesort')
+    exon_transcript_rows = exon_transcript_rows[order]
+    exon_rows = exon_rows[order]
+
+    transcript_ids = exon_transcript['transcript_id'].values[
+        exon_transcript_rows]
+    transcript_rows = _lookup(
+        transcript['transcript_id'].values, transcript_ids)
+    translation_rows = _lookup(
+        translation['transcript_id'].values, transcript_ids)
+    gene_rows = _lookup(
+        gene['gene_id'].values,
+        transcript['gene_id'].values[transcript_rows])
+    seq_region_rows = _lookup(
+        seq_region_ids, gene['seq_region_id'].values[gene_rows])
+
+    def column_source(df, rows, column):
+        return lambda start, end: df[column].values[rows[start:end]]
+
+    sources = {
+        'name' : column_source(seq_region, seq_region_rows, 'name'),
+        'is_canonical' : lambda start, end: (
+            transcript_ids[start:end] == gene['canonical_transcript_id'].values[
+                gene_rows[start:end]]),
+        'rank' : column_source(
+            exon_transcript, exon_transcript_rows, 'rank'),
+    }
+    for column in [
+            'stable_id', 'description', 'seq_region_start', 'seq_region_end',
+            'seq_region_strand']:
+        sources[column + '_gene'] = column_source(gene, gene_rows, column)
+    for column in ['stable_id', 'seq_region_start', 'seq_region_end']:
+        sources[column + '_transcript'] = \
+            column_source(transcript, transcript_rows, column)
+    sources['biotype'] = column_source(transcript, transcript_rows, 'biotype')
+    for column in ['seq_start', 'start_exon_id', 'seq_end', 'end_exon_id']:
+        sources[column] = column_source(translation, translation_rows, column)
+    sources['stable_id_translation'] = \
+        column_source(translation, translation_rows, 'stable_id')
+    for column in ['stable_id', 'seq_region_start', 'seq_region_end']:
+        sources[column + '_exon'] = column_source(exon, exon_rows, column)
+    for column in ['exon_id', 'phase']:
+        sources[column] = column_source(exon, exon_rows, column)
+    assert set(sources) == set(TRANSCRIPT_METADATA_COLUMNS)
+
+    def get_column(column, start = 0, end = None):
+        if end is None:
+            end = len(exon_rows)
+        return sources[column](start, end)
+    return len(exon_rows), get_column
+
+def _write_transcript_metadata(n_rows, get_column, path):
+    """
+    Write the joined table to a TSV file a chunk of rows at a time, and
+    then to a columnar copy one column at a time
+    """
+    tmp_path = path + ".tmp"
+    with open(tmp_path, 'w') as f:
+        pd.DataFrame(columns = TRANSCRIPT_METADATA_COLUMNS).to_csv(
+            f, index=False, sep='\t')
+        for start in xrange(0, n_rows, _CHUNK_SIZE):
+            end = min(start + _CHUNK_SIZE, n_rows)
+            chunk = pd.DataFrame(
+                dict((column, get_column(column, start, end))
+                    for column in TRANSCRIPT_METADATA_COLUMNS),
+                columns = TRANSCRIPT_METADATA_COLUMNS)
+            chunk.to_csv(f, index=False, header=False, sep='\t')
+    write_column_arrays(
+        ((column, get_column(column))
+            for column in TRANSCRIPT_METADATA_COLUMNS),
+        n_rows,
+        _columns_path(path))
+    rename(tmp_path, path)
+
+def _columns_params(tsv_path):
+    return {'table' : basename(tsv_path)}
+
 def download_transcript_metadata(filter_contigs = STANDARD_CONTIGS):
 
     output_filename = versioned_filename(
@@ -105,100 +378,41 @@ def download_transcript_metadata(filter_contigs = STANDARD_CONTIGS):
             SEQ_REGION_DATA_URL,
             EXON_DATA_URL,
             TRANSCRIPT_DATA_URL,
-            TRANSLATION_DATA_URL],
+            TRANSLATION_DATA_URL,
+            # rebuild cached tables whenever their columns change
+            ",".join(TRANSCRIPT_METADATA_COLUMNS)],
         ext = "tsv")
-    full_path = build_path(output_filename, subdir = "immuno")
+    full_path = bundle_path(output_filename)
     logging.info("Transcript metadata path %s", full_path)
 
-    if not exists(full_path):
-        GENE_DATA_PATH = fetch_file(GENE_DATA_URL)
-        SEQ_REGION_DATA_PATH = fetch_file(SEQ_REGION_DATA_URL)
-        EXON_DATA_PATH = fetch_file(EXON_DATA_URL)
-        TRANSCRIPT_DATA_PATH = fetch_file(TRANSCRIPT_DATA_URL)
-        TRANSLATION_DATA_PATH = fetch_file(TRANSLATION_DATA_URL)
-        EXON_TRANSCRIPT_DATA_PATH = fetch_file(EXON_TRANSCRIPT_DATA_URL)
-        seqregion = pd.read_csv(
-            SEQ_REGION_DATA_PATH,
-            sep='\t',
-            names = SEQ_REGION_HEADER,
-            index_col=False)
-
-        def in_filter_contigs(x):
-            return x in filter_contigs
-
-        if filter_contigs:
-            seqregion = seqregion[seqregion['name'].map(in_filter_contigs)]
-
-        # TODO: Ask Arun what's going on here, leave a good explanation
-        gene = pd.read_csv(
-            GENE_DATA_PATH,
-            sep='\t',
-            names = GENE_HEADER,
-            index_col=False)
-        seqregion_gene = gene.merge(seqregion, on='seq_region_id')
-        transcript = pd.read_csv(
-            TRANSCRIPT_DATA_PATH, sep='\t',
-            names = TRANSCRIPT_HEADER,
-            index_col=False)
-
-        translation = pd.read_csv(
-            TRANSLATION_DATA_PATH, sep='\t',
-            names = TRANSLATION_HEADER,
-            index_col=False)
-
-        transcript = transcript.merge(
-                translation,
-                on='transcript_id',
-                suffixes = ['', '_translation'])
-
-        gene_transcript = transcript.merge(
-            seqregion_gene,
-            on='gene_id',
-            suffixes = ['', '_gene'])
-
-
-        exon = pd.read_csv(
-            EXON_DATA_PATH,
-            sep='\t',
-            names=EXON_HEADER,
-            index_col=False)
-        exon_transcript = pd.read_csv(
-            EXON_TRANSCRIPT_DATA_PATH,
-            sep='\t',
-            names=['exon_id', 'transcript_id', 'rank'])
-        exon_w_exon_transcript = pd.merge(
-            exon,
-            exon_transcript,
-            on='exon_id',
-            suffixes=('_exon', '_et'))
-
-        exon_w_transcript = pd.merge(
-            exon_w_exon_transcript,
-            gene_transcript,
-            on='transcript_id',
-            suffixes=('_exon', '_transcript'))
-        print exon_w_transcript.columns
-        exon_cols = [
-            'name',
-            'stable_id_gene',
-            'description_gene',
-            'seq_region_start_gene',
-            'seq_region_end_gene',
-            'seq_region_strand_gene',
-            'stable_id_transcript',
-            'seq_region_start_transcript',
-            'seq_region_end_transcript',
-            'seq_start',
-            'start_exon_id',
-            'seq_end',
-            'end_exon_id',
-            'stable_id_translation',
-            'stable_id_exon',
-            'exon_id',
-            'rank',
-            'phase',
-            'seq_region_start_exon',
-            'seq_region_end_exon']
-        exon_data = exon_w_transcript[exon_cols]
-        exon_data.to_csv(full_path, index=False, sep='\t')
+    params = {
+        'sources' : [reference_file.url for reference_file in REFERENCE_FILES],
+        'columns' : TRANSCRIPT_METADATA_COLUMNS,
+        'contigs' : sorted(filter_contigs) if filter_contigs else None,
+    }
+    if not verify_artifact(full_path, params):
+        paths = [reference_file.fetch() for reference_file in REFERENCE_FILES]
+        n_rows, get_column = _build_transcript_metadata(paths, filter_contigs)
+        _write_transcript_metadata(n_rows, get_column, full_path)
+        record_artifact(
+            _columns_path(full_path), _columns_params(full_path))
+        record_artifact(full_path, params)
     return full_path
+
+def _columns_path(tsv_path):
+    return splitext(tsv_path)[0] + ".columns"
+
+def transcript_metadata_columns_path(tsv_path):
+    """
+    Returns path to a directory containing a typed binary copy of the
+    transcript metadata table at `tsv_path`, one NumPy file per column.
+    """
+    columns_path = _columns_path(tsv_path)
+    params = _columns_params(tsv_path)
+    if not verify_artifact(columns_path, params):
+        # metadata built before the binary copy was added to the build,
+        # or a table which didn't come from download_transcript_metadata
+        exon_data = pd.read_csv(tsv_path, sep='\t', low_memory = False)
+        write_columns(exon_data, columns_path)
+        record_artifact(columns_path, params)
+    return columns_path
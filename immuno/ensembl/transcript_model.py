@@ -0,0 +1,114 @@
+# Copyright (c) 2014. Mount Sinai School of Medicine
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import numpy as np
+
+class TranscriptModel(object):
+    """
+    Exon structure of a single transcript, precomputed so that mapping
+    genomic positions into many transcripts at once (see
+    annotation.get_transcript_indices_from_positions) only takes one
+    binary search.
+    """
+
+    __slots__ = (
+        'transcript_id',
+        'exon_starts',
+        'exon_ends',
+        'exon_offsets',
+        'length',
+        'forward',
+        'five_prime_utr_length',
+        'cds_start_phase',
+    )
+
+    def __init__(
+            self,
+            transcript_id,
+            exon_starts,
+            exon_ends,
+            forward,
+            five_prime_utr_length,
+            cds_start_phase):
+        """
+        Parameters
+        ----------
+        transcript_id : str
+
+        exon_starts : list of int
+            Genomic start position of each exon, sorted in ascending order
+
+        exon_ends : list of int
+            Genomic end position of each exon (inclusive)
+
+        forward : bool
+            Is the transcript on the forward strand?
+
+        five_prime_utr_length : int or None
+            Number of cDNA bases before the start of the coding sequence,
+            None if the transcript has no coding sequence
+
+        cds_start_phase : int
+            Phase of the first coding exon, 0 for complete transcripts
+        """
+        self.transcript_id = transcript_id
+        self.exon_starts = exon_starts
+        self.exon_ends = exon_ends
+        # number of transcript bases before each exon, in genomic order
+        offsets = []
+        length = 0
+        for (start, end) in zip(exon_starts, exon_ends):
+            offsets.append(length)
+            length += end - start + 1
+        self.exon_offsets = offsets
+        self.length = length
+        self.forward = forward
+        self.five_prime_utr_length = five_prime_utr_length
+        self.cds_start_phase = cds_start_phase
+
+    @classmethod
+    def from_exons(cls, transcript_id, exons_df, forward, cds_start_phase):
+        """
+        Build a model from a DataFrame of a transcript's exons with columns
+        'exon_id', 'seq_region_start_exon', 'seq_region_end_exon',
+        'start_exon_id' and 'seq_start'.
+        """
+        starts = exons_df['seq_region_start_exon'].values
+        ends = exons_df['seq_region_end_exon'].values
+        exon_ids = exons_df['exon_id'].values
+        order = np.lexsort((ends, starts))
+        starts = [int(x) for x in starts[order]]
+        ends = [int(x) for x in ends[order]]
+        exon_ids = exon_ids[order]
+
+        # walk the exons in transcript order until reaching
+        # the one where translation starts
+        start_exon_id = exons_df['start_exon_id'].values[0]
+        seq_start = exons_df['seq_start'].values[0]
+        walk = range(len(starts)) if forward else range(len(starts) - 1, -1, -1)
+        utr_length = 0
+        five_prime_utr_length = None
+        for i in walk:
+            if exon_ids[i] == start_exon_id:
+                five_prime_utr_length = utr_length + int(seq_start) - 1
+                break
+            utr_length += ends[i] - starts[i] + 1
+
+        return cls(
+            transcript_id,
+            starts,
+            ends,
+            forward,
+            five_prime_utr_length,
+            cds_start_phase)
@@ -20,13 +20,20 @@ the mutated residue.
 import logging
 
 from immuno.mutate import (
-    mutate_protein_from_transcript, mutate, gene_mutation_description
+    mutate_protein_many, mutate, gene_mutation_description
 )
 from transcript_data import EnsemblReferenceData
 import annotation
 
 _ensembl = EnsemblReferenceData()
 
+def prefetch_transcripts(transcript_ids):
+    """
+    Load the CDS sequences of many transcripts with a few batched queries,
+    so later calls to peptide_from_transcript_variant find them cached.
+    """
+    _ensembl.get_cds_many(transcript_ids)
+
 def peptide_from_protein_transcript_variant(transcript_id, pos, ref, alt):
     """
     Given an ensembl transcript ID, mutate amino acid `ref` to `alt` at
@@ -45,39 +52,46 @@ def peptide_from_protein_transcript_variant(transcript_id, pos, ref, alt):
             return None
     return None
 
-def peptide_from_transcript_variant(
-        transcript_id, pos, ref, alt,
-        padding = None,
-        max_length = None):
+def _error_result(msg, *args):
+    logging.warning(msg, *args)
+    return None, -1, -1, msg % args
 
+def _cds_variant(transcript_id, transcript, forward, pos, ref, alt,
+        transcript_index):
+    """
+    Returns the position of a genomic variant in the CDS of a transcript
+    along with its ref and alt bases on the transcript's strand, or an
+    error result if the variant can't be applied to the transcript.
+    """
     # sometimes empty strings get represented with a '.'
     if ref == ".":
         ref = ""
     if alt == ".":
         alt = ""
 
-    forward = annotation.is_forward_strand(transcript_id)
     ref = ref if forward else annotation.reverse_complement(ref)
     alt = alt if forward else annotation.reverse_complement(alt)
-    transcript = _ensembl.get_cds(transcript_id)
-    def error_result(msg, *args):
-        logging.warning(msg, *args)
-        return None, -1, -1, msg % args
 
     if not transcript:
-        return error_result("Couldn't find transcript for ID %s", transcript_id)
+        return None, _error_result(
+            "Couldn't find transcript for ID %s", transcript_id)
 
-    idx = annotation.get_transcript_index_from_pos(
-        pos,
-        transcript_id,
-        skip_untranslated_region = True)
+    if transcript_index is None:
+        idx = annotation.get_transcript_index_from_pos(
+            pos,
+            transcript_id,
+            skip_untranslated_region = True)
+    elif transcript_index < 0:
+        idx = None
+    else:
+        idx = transcript_index
     if idx is None:
-        return error_result(
+        return None, _error_result(
             "Couldn't translate gene position %s into transcript index for %s",
             pos,
             transcript_id)
     elif idx >= len(transcript):
-        return error_result(
+        return None, _error_result(
             "Index %d longer than sequence (len %d) for transcript %s (%s)",
             idx,
             len(transcript),
@@ -92,21 +106,160 @@ def peptide_from_transcript_variant(
     transcript_ref = str(transcript[idx:idx+len(ref)])
     if transcript_ref != ref:
         mutation_description = gene_mutation_description(pos, ref, alt)
-        return error_result(
+        return None, _error_result(
             "VCF/MAF expected %s at idx %d of transcript %s, found %s (%s)" % \
                 (ref, idx, transcript_id, transcript_ref, mutation_description)
         )
-    region = mutate_protein_from_transcript(
-        transcript,
-        idx,
-        ref,
-        alt,
-        padding = padding)
-    start = region.mutation_start
-    stop = start + region.n_inserted
-    if max_length and len(region.seq) > max_length:
-        seq = region.seq[:max_length]
+    return (idx, ref, alt), None
+
+def _codon_span(idx, ref):
+    """
+    First and last codon touched by replacing `ref` at CDS index `idx`
+    """
+    return idx // 3, (idx + max(len(ref), 1) - 1) // 3
+
+def _codon_clusters(cds_variants):
+    """
+    Sweep over (idx, ref, alt, ...) variants sorted by CDS index, grouping
+    together the ones which change a common codon. Groups with variants
+    whose bases overlap (e.g. two alleles at the same position) can't all
+    be on the same copy of the transcript and are split up again.
+    """
+    clusters = []
+    last_codon = None
+    for variant in cds_variants:
+        (idx, ref) = variant[:2]
+        first, last = _codon_span(idx, ref)
+        if clusters and first <= last_codon:
+            clusters[-1].append(variant)
+            last_codon = max(last_codon, last)
+        else:
+            clusters.append([variant])
+            last_codon = last
+    result = []
+    for cluster in clusters:
+        disjoint = all(
+            curr[0] >= prev[0] + len(prev[1]) and curr[0] != prev[0]
+            for (prev, curr) in zip(cluster, cluster[1:]))
+        if disjoint:
+            result.append(cluster)
+        else:
+            result.extend([variant] for variant in cluster)
+    return result
+
+def _merge_variants(transcript, cluster):
+    """
+    Combine non-overlapping (idx, ref, alt, ...) variants, sorted by CDS
+    index, into a single replacement of the bases they span
+    """
+    if len(cluster) == 1:
+        return cluster[0][:3]
+    start = cluster[0][0]
+    end = max(idx + len(ref) for (idx, ref) in
+        (variant[:2] for variant in cluster))
+    pieces = []
+    cursor = start
+    for (idx, ref, alt) in (variant[:3] for variant in cluster):
+        pieces.append(transcript[cursor:idx])
+        pieces.append(alt)
+        cursor = idx + len(ref)
+    pieces.append(transcript[cursor:end])
+    return start, transcript[start:end], "".join(pieces)
+
+def _peptide_result(seq, mutation_start, n_inserted, annot, max_length):
+    start = int(mutation_start)
+    stop = start + int(n_inserted)
+    if max_length and len(seq) > max_length:
+        seq = seq[:max_length]
         stop = min(stop, max_length)
+    return seq, start, stop, annot
+
+def peptides_from_transcript_variants(
+        transcript_id,
+        variants,
+        padding = None,
+        max_length = None,
+        combine_codon_variants = False):
+    """
+    Apply many genomic variants to the CDS of one transcript, fetching and
+    translating its reference sequence only once. Returns a list with the
+    result of peptide_from_transcript_variant for each variant.
+
+    Parameters
+    ----------
+    transcript_id : str
+
+    variants : list of tuples
+        (pos, ref, alt, transcript_index) of each variant, where
+        transcript_index is the CDS index of `pos` if it's already been
+        computed (negative if it couldn't be) and otherwise None
+
+    padding : int, optional
+
+    max_length : int, optional
+
+    combine_codon_variants : bool
+        Apply variants which change the same codon together (e.g. the bases
+        of a multi-nucleotide substitution which a variant caller reported
+        separately), so that each of them gets the peptide resulting from
+        all of them. Otherwise every variant is applied on its own.
+    """
+    forward = annotation.is_forward_strand(transcript_id)
+    transcript = _ensembl.get_cds(transcript_id)
+    results = [None] * len(variants)
+    cds_variants = []
+    for (i, (pos, ref, alt, transcript_index)) in enumerate(variants):
+        cds_variant, error = _cds_variant(
+            transcript_id, transcript, forward, pos, ref, alt,
+            transcript_index)
+        if error is None:
+            cds_variants.append(cds_variant + (i,))
+        else:
+            results[i] = error
+    if not cds_variants:
+        return results
+
+    original_protein = _ensembl.get_cds_translation(transcript_id)
+    cds_variants.sort()
+    if combine_codon_variants:
+        clusters = _codon_clusters(cds_variants)
     else:
-        seq = region.seq
-    return seq, start, stop, region.annot
+        clusters = [[cds_variant] for cds_variant in cds_variants]
+    regions = mutate_protein_many(
+        transcript,
+        [_merge_variants(transcript, cluster) for cluster in clusters],
+        padding = padding,
+        original_protein = original_protein)
+    for (i, cluster) in enumerate(clusters):
+        result = _peptide_result(
+            regions.seqs[i],
+            regions.mutation_starts[i],
+            regions.n_inserted[i],
+            regions.annotations[i],
+            max_length)
+        for cds_variant in cluster:
+            results[cds_variant[-1]] = result
+    return results
+
+def peptide_from_transcript_variant(
+        transcript_id, pos, ref, alt,
+        padding = None,
+        max_length = None,
+        transcript_index = None):
+    """
+    Apply a genomic variant to the CDS of a transcript and translate the
+    region around it. Returns a tuple of the mutated amino acid sequence,
+    the start and stop of the mutated residues within that sequence,
+    and an annotation of the mutation (or an error message if no
+    sequence could be produced).
+
+    transcript_index : int, optional
+        CDS index of `pos` in this transcript if it's already been computed
+        (e.g. by annotation.get_transcript_indices_from_positions), or a
+        negative number if `pos` couldn't be translated into one
+    """
+    return peptides_from_transcript_variants(
+        transcript_id,
+        [(pos, ref, alt, transcript_index)],
+        padding = padding,
+        max_length = max_length)[0]
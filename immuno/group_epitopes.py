@@ -1,5 +1,5 @@
 
-from ensembl.gene_names import transcript_id_to_transcript_name
+from ensembl.gene_names import map_transcript_ids_to_transcript_names
 from peptide_binding_measure import (
         IC50_FIELD_NAME, PERCENTILE_RANK_FIELD_NAME
 )
@@ -59,6 +59,12 @@ def group_epitopes_dataframe(scored_epitopes, use_transcript_name = True):
 
     peptides = []
 
+    if use_transcript_name:
+        transcript_ids = scored_epitopes['TranscriptId'].unique()
+        transcript_names = map_transcript_ids_to_transcript_names(
+            transcript_ids)
+        transcript_names = dict(zip(transcript_ids, transcript_names))
+
     for (transcript_id, seq), transcript_group in \
             scored_epitopes.groupby(["TranscriptId", "SourceSequence"]):
         peptide_entry = {}
@@ -66,8 +72,7 @@ def group_epitopes_dataframe(scored_epitopes, use_transcript_name = True):
         peptide_entry["Peptide"] = seq
 
         if use_transcript_name:
-            transcript_name =  transcript_id_to_transcript_name(transcript_id)
-            peptide_entry['TranscriptId'] = transcript_name
+            peptide_entry['TranscriptId'] = transcript_names[transcript_id]
         else:
             peptide_entry['TranscriptId'] = transcript_id
 
@@ -40,6 +40,16 @@ def _load_allele_mapping_dict(path):
             result[k] = v
     return result
 
+def _load_peptide_set(path, _cache = {}):
+    """
+    Peptide sets are kept after they're first loaded, so predictors for
+    the same alleles (or forked processes) share one copy.
+    """
+    if path not in _cache:
+        with open(path, 'r') as f:
+            _cache[path] = frozenset(
+                l for l in f.read().split("\n") if len(l) > 0)
+    return _cache[path]
 
 class ImmunogenicityPredictor(object):
 
@@ -114,9 +124,8 @@ class ImmunogenicityPredictor(object):
                 "No MHC peptide set available for HLA allele %s (file = %s)" % \
                     (allele,filename)
 
-            with open(join(self.data_path, filename), 'r') as f:
-                peptide_set = {l for l in f.read().split("\n") if len(l) > 0}
-            self.peptide_sets[allele] = peptide_set
+            self.peptide_sets[allele] = _load_peptide_set(
+                join(self.data_path, filename))
 
     def predict(self, peptides_df):
         """
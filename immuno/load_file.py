@@ -15,13 +15,20 @@
 import logging
 from copy import deepcopy
 from collections import OrderedDict
+import socket
+import time
 
 import pandas as pd
 
+from annotation_client import AnnotationClient, default_server_path
 from common import normalize_chromosome_name, is_valid_peptide
 from ensembl import annotation, gene_names
-from ensembl.transcript_variant import peptide_from_transcript_variant
+from ensembl import transcript_variant
+from ensembl.transcript_variant import (
+    peptides_from_transcript_variants, prefetch_transcripts
+)
 from mutate import gene_mutation_description
+from prefix_index import PrefixIndex
 from vcf import load_vcf
 from maf import load_maf
 from fasta import load_fasta
@@ -67,8 +74,128 @@ def tab_to_vcf(tab_df):
         'id' : tab_df['dbsnpId']
     })
 
+def preload_reference_data():
+    """
+    Load everything that expanding variants needs, so that it's shared by
+    all later calls (or by forked worker processes)
+    """
+    start_time = time.time()
+    data = annotation.data
+    data.transcript_metadata_columns
+    data.transcripts_dataframe
+    data.transcript_interval_index
+    data.coding_regions
+    data.start_exons_dict
+    data.transcript_exons
+    gene_names.load_transcript_name_table()
+    transcript_variant._ensembl.preload()
+    logging.info(
+        "Loaded reference data in %0.4f seconds", time.time() - start_time)
+
+def _translate_transcripts(batch):
+    """
+    Apply each transcript's variants to it, e.g. in a worker process.
+
+    Parameters
+    ----------
+    batch : tuple
+        (padding, combine_codon_variants, transcript_variants) where
+        transcript_variants is a list of transcript IDs, each with a list
+        of (pos, ref, alt, transcript_index) variants
+    """
+    padding, combine_codon_variants, transcript_variants = batch
+    prefetch_transcripts(
+        [transcript_id for (transcript_id, _) in transcript_variants])
+    return [
+        peptides_from_transcript_variants(
+            transcript_id,
+            variants,
+            padding = padding,
+            combine_codon_variants = combine_codon_variants)
+        for (transcript_id, variants) in transcript_variants
+    ]
+
+def _translate_by_transcript(
+        transcripts_df,
+        transcript_indices,
+        group_cols,
+        padding,
+        combine_codon_variants,
+        worker_pool = None):
+    """
+    Returns dictionary mapping each (chr, pos, ref, alt, transcript_id)
+    to the result of peptide_from_transcript_variant. Every transcript's
+    variants are applied together, so its reference sequence is only
+    fetched and translated once, and transcripts are split between the
+    processes of `worker_pool` if one is given.
+
+    Variants whose position couldn't be translated into a transcript
+    index are included too, so that (as in peptide_from_transcript_variant)
+    a transcript without a CDS is reported as missing rather than as an
+    index error.
+    """
+    first_rows = transcripts_df.drop_duplicates(group_cols)
+    ok = first_rows['stable_id_transcript'].fillna("").astype(bool).values
+    ok &= first_rows['ref'].values != first_rows['alt'].values
+    ok &= ~first_rows['chr'].str.upper().str.startswith("M").values
+    first_rows = first_rows[ok]
+    keys = zip(*[first_rows[col].values for col in group_cols])
+    transcript_keys = {}
+    transcript_variants = {}
+    for (key, transcript_index) in zip(
+            keys,
+            transcript_indices['transcript_index'][first_rows.index].values):
+        (_, pos, ref, alt, transcript_id) = key
+        transcript_keys.setdefault(transcript_id, []).append(key)
+        transcript_variants.setdefault(transcript_id, []).append(
+            (pos, ref, alt, transcript_index))
+    transcript_ids = sorted(transcript_variants)
+    jobs = [
+        (transcript_id, transcript_variants[transcript_id])
+        for transcript_id in transcript_ids
+    ]
+
+    if worker_pool is None:
+        batches = [jobs]
+    else:
+        # split the transcripts into batches of about the same number of
+        # variants, several per worker
+        batch_size = max(1, len(keys) // (4 * worker_pool.n_workers))
+        batches = [[]]
+        n_batch_variants = 0
+        for job in jobs:
+            if n_batch_variants >= batch_size:
+                batches.append([])
+                n_batch_variants = 0
+            batches[-1].append(job)
+            n_batch_variants += len(job[1])
+    batches = [
+        (padding, combine_codon_variants, batch) for batch in batches
+    ]
+    if worker_pool is None:
+        batch_results = map(_translate_transcripts, batches)
+    else:
+        batch_results = worker_pool.imap(_translate_transcripts, batches)
+
+    results = []
+    for transcript_results in batch_results:
+        results.extend(transcript_results)
+    translations = {}
+    for (transcript_id, transcript_results) in zip(transcript_ids, results):
+        translations.update(
+            zip(transcript_keys[transcript_id], transcript_results))
+    return translations
+
 def expand_transcripts(
-        vcf_df, patient_id, min_peptide_length=9, max_peptide_length=31):
+        vcf_df,
+        patient_id,
+        min_peptide_length=9,
+        max_peptide_length=31,
+        canonical_only=False,
+        transcript_whitelist=None,
+        annotation_server=None,
+        worker_pool=None,
+        combine_codon_variants=False):
     """
     Applies genomic variants to all possible transcripts.
 
@@ -83,15 +210,66 @@ def expand_transcripts(
     min_peptide_length : int
 
     max_peptide_length : int
+
+    canonical_only : bool
+        Only apply variants to the canonical transcript of each gene
+
+    transcript_whitelist : collection of str, optional
+        Only apply variants to transcripts with these Ensembl IDs
+
+    annotation_server : str or bool, optional
+        Socket path of an annotation server (see annotation_server.py)
+        to do the work in a process which already has the reference data
+        loaded. By default taken from the IMMUNO_ANNOTATION_SERVER
+        environment variable, pass False to always work in this process.
+
+    worker_pool : PreloadedWorkerPool, optional
+        Apply the variants to their transcripts in these worker processes
+
+    combine_codon_variants : bool
+        Apply variants which change the same codon of a transcript together
+        instead of each on its own
     """
 
     assert len(vcf_df)  > 0, "No mutation entries for %s" % patient_id
     logging.info("Expanding transcripts from %d variants for %s", len(vcf_df), patient_id)
     vcf_df['chr'] = vcf_df.chr.map(normalize_chromosome_name)
 
+    if annotation_server is None:
+        annotation_server = default_server_path()
+    if annotation_server:
+        client = AnnotationClient(annotation_server)
+        try:
+            return client.expand_transcripts(
+                vcf_df,
+                patient_id,
+                min_peptide_length = min_peptide_length,
+                max_peptide_length = max_peptide_length,
+                canonical_only = canonical_only,
+                transcript_whitelist = transcript_whitelist,
+                combine_codon_variants = combine_codon_variants)
+        except socket.error, e:
+            logging.warning(
+                "Couldn't reach annotation server at %s (%s), "
+                "expanding transcripts locally",
+                annotation_server,
+                e)
+
+    # drop intronic and intergenic variants before any per-transcript work
+    in_coding_region = annotation.variants_in_coding_regions(vcf_df)
+    vcf_df['in_coding_region'] = in_coding_region
+    logging.info(
+        "Dropped %d/%d variants outside of coding regions for %s",
+        (~in_coding_region).sum(),
+        len(vcf_df),
+        patient_id)
+
     # annotate genomic mutations into all the possible
     # known transcripts they might be on
-    transcripts_df = annotation.annotate_vcf_transcripts(vcf_df)
+    transcripts_df = annotation.annotate_vcf_transcripts(
+        vcf_df[in_coding_region],
+        canonical_only = canonical_only,
+        transcript_whitelist = transcript_whitelist)
 
     assert len(transcripts_df) > 0, \
         "No annotated mutation entries for %s" % patient_id
@@ -100,11 +278,36 @@ def expand_transcripts(
          patient_id,
          len(transcripts_df))
 
-    new_rows = []
+    # convert all the genomic positions into CDS indices at once
+    transcript_indices = annotation.get_transcript_indices_from_positions(
+        transcripts_df)
+    translatable = \
+        transcript_indices['error'] == annotation.TRANSCRIPT_INDEX_OK
+    translatable_transcript_ids = \
+        transcripts_df['stable_id_transcript'][translatable].unique()
 
     group_cols = ['chr','pos', 'ref', 'alt', 'stable_id_transcript']
+    padding = max_peptide_length - 1
+
+    translations = _translate_by_transcript(
+        transcripts_df,
+        transcript_indices,
+        group_cols,
+        padding,
+        combine_codon_variants,
+        worker_pool = worker_pool)
+
+    # look up gene names for all the transcripts at once, falling back on
+    # Ensembl gene IDs for genes without a HUGO name
+    gene_ids = gene_names.map_transcript_ids_to_gene_ids(
+        translatable_transcript_ids)
+    genes = gene_names.map_transcript_ids_to_gene_names(
+        translatable_transcript_ids).fillna(gene_ids)
+    transcript_genes = dict(zip(translatable_transcript_ids, genes))
 
-    seen_source_sequences = set([])
+    new_rows = []
+
+    seen_source_sequences = PrefixIndex()
 
     # for each genetic variant in the source file,
     # we're going to print a string describing either the resulting
@@ -151,21 +354,17 @@ def expand_transcripts(
             skip("Not a variant, since ref %s matches alt %s", ref, alt)
             continue
 
-        padding = max_peptide_length - 1
-        if transcript_id:
-            seq, start, stop, annot = \
-                peptide_from_transcript_variant(
-                    transcript_id, pos, ref, alt,
-                    padding = padding)
-        else:
+        if not transcript_id:
             error("Skipping due to invalid transcript ID")
             continue
 
+        seq, start, stop, annot = \
+            translations[(chromosome, pos, ref, alt, transcript_id)]
+
         if not seq:
             error(annot)
         else:
-            starts_with = [s for s in seen_source_sequences if s.startswith(
-                seq)]
+            starts_with = seen_source_sequences.starting_with(seq)
             if any(starts_with):
                 msg = "Already seen %d sequence(s) starting with %s<%d>" % (
                     len(starts_with), seq, len(seq))
@@ -207,12 +406,7 @@ def expand_transcripts(
                     gene_mutation_description(pos, ref, alt))
                 row['GeneMutationInfo'] = gene_mutation_info
                 row['PeptideMutationInfo'] = annot
-                try:
-                    gene = gene_names.transcript_id_to_gene_name(transcript_id)
-                except:
-                    gene = gene_names.transcript_id_to_gene_id(transcript_id)
-
-                row['Gene'] = gene
+                row['Gene'] = transcript_genes[transcript_id]
                 success(row)
 
     assert len(new_rows) > 0, "No mutations!"
@@ -235,13 +429,23 @@ def expand_transcripts(
         'id',
         'name',
         'info',
-        'stable_id_transcript'
+        'stable_id_transcript',
+        'biotype',
+        'is_canonical',
+        'in_coding_region',
     )
     for dumb_field in dumb_fields:
         if dumb_field in transcripts_df.columns:
             transcripts_df = transcripts_df.drop(dumb_field, axis = 1)
     return transcripts_df, vcf_df, variant_report
 
+def load_transcript_whitelist(path):
+    """
+    Read a file with one Ensembl transcript ID per line
+    """
+    with open(path) as f:
+        return set(line.strip() for line in f if line.strip())
+
 def load_variants(input_filename):
     """
     Read the input file into a DataFrame containing (at least)
@@ -264,7 +468,14 @@ def load_variants(input_filename):
         assert False, "Unrecognized file type %s" % input_filename
     return vcf_df
 
-def load_file(input_filename, min_peptide_length=9, max_peptide_length=31):
+def load_file(
+        input_filename,
+        min_peptide_length=9,
+        max_peptide_length=31,
+        canonical_only=False,
+        transcript_whitelist=None,
+        worker_pool=None,
+        combine_codon_variants=False):
     """
     Load mutatated peptides from FASTA, VCF, or MAF file.
     For the latter two formats, expand their variants across all
@@ -279,6 +490,18 @@ def load_file(input_filename, min_peptide_length=9, max_peptide_length=31):
 
     max_peptide_length : int
 
+    canonical_only : bool
+        Only expand variants across the canonical transcript of each gene
+
+    transcript_whitelist : collection of str, optional
+        Only expand variants across transcripts with these Ensembl IDs
+
+    worker_pool : PreloadedWorkerPool, optional
+        Apply the variants to their transcripts in these worker processes
+
+    combine_codon_variants : bool
+        Apply variants which change the same codon of a transcript together
+
     Returns a dataframe with columns:
         - chr : chomosome
         - pos : position in the chromosome
@@ -304,4 +527,8 @@ def load_file(input_filename, min_peptide_length=9, max_peptide_length=31):
         vcf_df,
         input_filename,
         min_peptide_length = min_peptide_length,
-        max_peptide_length = max_peptide_length)
+        max_peptide_length = max_peptide_length,
+        canonical_only = canonical_only,
+        transcript_whitelist = transcript_whitelist,
+        worker_pool = worker_pool,
+        combine_codon_variants = combine_codon_variants)
@@ -0,0 +1,56 @@
+# Copyright (c) 2014. Mount Sinai School of Medicine
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from collections import OrderedDict
+
+class LRUCache(object):
+    """
+    Dictionary-like cache which holds at most `max_size` entries, evicting
+    the least recently used entry when it's full.
+    """
+
+    def __init__(self, max_size):
+        assert max_size > 0, "Invalid cache size %s" % max_size
+        self.max_size = max_size
+        self._d = OrderedDict()
+
+    def __len__(self):
+        return len(self._d)
+
+    def __contains__(self, key):
+        return key in self._d
+
+    def get(self, key, default = None):
+        try:
+            value = self._d.pop(key)
+        except KeyError:
+            return default
+        # re-insert to mark as most recently used
+        self._d[key] = value
+        return value
+
+    def __getitem__(self, key):
+        value = self._d.pop(key)
+        self._d[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        if key in self._d:
+            del self._d[key]
+        elif len(self._d) >= self.max_size:
+            self._d.popitem(last = False)
+        self._d[key] = value
+
+    def clear(self):
+        self._d.clear()
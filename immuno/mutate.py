@@ -16,7 +16,9 @@ import logging
 import math
 from collections import namedtuple
 
-from Bio.Seq import Seq
+import numpy as np
+
+from dna import translate
 
 
 def mutate_split(sequence, position, ref, alt):
@@ -70,6 +72,86 @@ def mutate(sequence, position, ref, alt):
     prefix, alt, suffix = mutate_split(sequence, position, ref, alt)
     return prefix + alt + suffix
 
+def _check_refs(sequence, positions, refs, message):
+    """
+    Assert that every ref other than '.' is found at its position in
+    `sequence`, comparing the bases of all of them in one go. `message` is
+    formatted with the found bases, position and ref of the first one which
+    isn't.
+    """
+    checked = [i for (i, ref) in enumerate(refs) if ref != '.']
+    expected = "".join([str(refs[i]) for i in checked])
+    if not expected:
+        return
+    lengths = np.array([len(refs[i]) for i in checked], dtype=int)
+    ends = np.cumsum(lengths)
+    starts = np.array([positions[i] for i in checked], dtype=int)
+    # index into the sequence of each base of the concatenated refs
+    indices = \
+        np.repeat(starts, lengths) + \
+        np.arange(len(expected)) - \
+        np.repeat(ends - lengths, lengths)
+    sequence = str(sequence)
+    found = np.zeros(len(expected), dtype=np.uint8)
+    in_range = (indices >= 0) & (indices < len(sequence))
+    found[in_range] = np.frombuffer(sequence, dtype=np.uint8)[
+        indices[in_range]]
+    mismatches = np.flatnonzero(
+        found != np.frombuffer(expected, dtype=np.uint8))
+    if len(mismatches) > 0:
+        i = checked[np.searchsorted(ends, mismatches[0], side='right')]
+        position = positions[i]
+        raise AssertionError(message % (
+            sequence[position:position+len(refs[i])], position, refs[i]))
+
+MutatedSequences = \
+    namedtuple(
+        "MutatedSequences",
+        (
+            "seqs",  # list of mutated sequences
+            "starts",  # array of where each alt starts in its sequence
+            "stops",  # array of where each alt stops in its sequence
+            "annotations",  # list of mutation annotations i.e. "V600E"
+        ))
+
+def mutate_many(sequence, positions, refs, alts):
+    """
+    Apply each of many mutations to its own copy of a sequence, checking
+    all of the refs at once. Returns a MutatedSequences with an entry for
+    each mutation.
+
+    Parameters
+    ----------
+    sequence : sequence
+        String of amino acids or DNA bases
+
+    positions : list of int
+        Position of each mutation in the sequence, starting from 0
+
+    refs : list of str
+        What do we expect to find at each position?
+
+    alts : list of str
+        Alternate allele to insert at each position
+    """
+    _check_refs(
+        sequence,
+        positions,
+        refs,
+        "Transcript ref base %s at position %d != given reference %s")
+    seqs = []
+    annotations = []
+    for (position, ref, alt) in zip(positions, refs, alts):
+        seqs.append(sequence[:position] + alt + sequence[position+len(ref):])
+        annotations.append("%s%d%s" % (ref, position + 1, alt))
+    starts = np.array(positions, dtype=int)
+    stops = starts + np.array([len(alt) for alt in alts], dtype=int)
+    return MutatedSequences(
+        seqs = seqs,
+        starts = starts,
+        stops = stops,
+        annotations = annotations)
+
 
 def gene_mutation_description(pos, ref, alt):
     if ref == alt:
@@ -131,12 +213,90 @@ Mutation = \
         ))
 
 
+def _splice_translation(
+        transcript_seq, original_protein, position, dna_ref, dna_alt):
+    """
+    Translation of `transcript_seq` with `dna_ref` at `position` replaced
+    by `dna_alt`, built from the translation of the unmutated transcript
+    and of only the codons that the mutation changes. Returns None for
+    mutations which this doesn't apply to (frameshifts and mutations of
+    the incomplete codon at the end of the transcript), which have to be
+    translated in full.
+    """
+    n_ref = len(dna_ref)
+    n_alt = len(dna_alt)
+    if (n_ref - n_alt) % 3 != 0:
+        return None
+    aa_position = position // 3
+    codon_start = 3 * aa_position
+    # the mutation doesn't change the reading frame, so the codons after
+    # it are the same in both sequences
+    n_ref_codons = (position + n_ref - codon_start + 2) // 3
+    n_alt_codons = (position + n_alt - codon_start + 2) // 3
+    codon_end = codon_start + 3 * n_ref_codons
+    if codon_end > 3 * len(original_protein):
+        return None
+    mutated_codons = translate(
+        transcript_seq[codon_start:position] +
+        dna_alt +
+        transcript_seq[position + n_ref:codon_end])
+    assert len(mutated_codons) == n_alt_codons
+    return (
+        original_protein[:aa_position] +
+        mutated_codons +
+        original_protein[aa_position + n_ref_codons:])
+
+# how many codons to translate at a time while looking for the stop codon
+# which ends a frameshift
+FRAMESHIFT_CHUNK_SIZE = 32
+
+def _frameshift_translation(
+        transcript_seq, original_protein, position, dna_ref, dna_alt):
+    """
+    Translation of `transcript_seq` with the frameshift replacing `dna_ref`
+    at `position` by `dna_alt`, only translated as far as the first stop
+    codon after the mutation. Returns that prefix of the mutated protein
+    along with the length of the whole mutated protein, or (None, None)
+    if the translation so far is the same as the unmutated protein's (in
+    which case the mutation might be silent, so it has to be translated
+    in full).
+    """
+    aa_position = position // 3
+    ref_end = position + len(dna_ref)
+    n_mutated_dna = len(transcript_seq) - len(dna_ref) + len(dna_alt)
+    n_mutated_protein = n_mutated_dna // 3
+
+    # codons which include any of the inserted bases, after which the
+    # rest of the transcript is read in its new frame
+    head = transcript_seq[3 * aa_position:position] + dna_alt
+    offset = ref_end + (-len(head)) % 3
+    head += transcript_seq[ref_end:offset]
+    pieces = [translate(head[:len(head) - len(head) % 3])]
+    chunk_length = 3 * FRAMESHIFT_CHUNK_SIZE
+    while '*' not in pieces[-1] and offset < len(transcript_seq):
+        chunk = transcript_seq[offset:offset + chunk_length]
+        chunk = chunk[:len(chunk) - len(chunk) % 3]
+        if not chunk:
+            break
+        pieces.append(translate(chunk))
+        offset += chunk_length
+    new_residues = "".join(pieces)
+    stop_codon = new_residues.find('*')
+    if stop_codon != -1:
+        new_residues = new_residues[:stop_codon + 1]
+
+    if new_residues == original_protein[
+            aa_position:aa_position + len(new_residues)]:
+        return None, None
+    return original_protein[:aa_position] + new_residues, n_mutated_protein
+
 def mutate_protein_from_transcript(
         transcript_seq,
         position,
         dna_ref,
         dna_alt,
-        padding = None):
+        padding = None,
+        original_protein = None):
     """
     Mutate a sequence by inserting the allele into the genomic transcript
     and translate to protein sequence
@@ -158,10 +318,14 @@ def mutate_protein_from_transcript(
     padding : int, optional
         Number of wildtype amino acids to keep left and right of the
         mutation. Default is to return whole mutated string.
+
+    original_protein : sequence, optional
+        Translation of the unmutated `transcript_seq`, if it's already
+        known (e.g. cached from an earlier variant in the same transcript)
     """
 
-    # turn any character sequence into a BioPython sequence
-    transcript_seq = Seq(str(transcript_seq))
+    # turn any character sequence (e.g. a BioPython Seq) into a string
+    transcript_seq = str(transcript_seq)
 
     transcript_ref_base = transcript_seq[position:position+len(dna_ref)]
 
@@ -170,12 +334,56 @@ def mutate_protein_from_transcript(
             "Transcript reference base %s at position %d != reference %s" % \
             (transcript_ref_base, position, dna_ref)
 
-    original_protein = transcript_seq.translate()
+    if original_protein is None:
+        original_protein = translate(transcript_seq)
+    else:
+        original_protein = str(original_protein)
+    return _mutate_protein(
+        transcript_seq,
+        position,
+        dna_ref,
+        dna_alt,
+        padding,
+        original_protein)
+
+def _mutate_protein(
+        transcript_seq,
+        position,
+        dna_ref,
+        dna_alt,
+        padding,
+        original_protein):
+    """
+    mutate_protein_from_transcript once the transcript's reference bases
+    have been checked and its translation is known
+    """
     n_original_protein = len(original_protein)
 
-    mutated_dna = mutate(transcript_seq, position, dna_ref, dna_alt)
-    mutated_protein = mutated_dna.translate()
-    n_mutated_protein = len(mutated_protein)
+    # substitutions and in-frame indels only change a few codons, and
+    # nothing after the first stop codon following a frameshift ends up
+    # in the result, so avoid translating the whole mutated transcript
+    mutated_protein = None
+    n_mutated_protein = None
+    if dna_ref != '.':
+        if (len(dna_ref) - len(dna_alt)) % 3 == 0:
+            mutated_protein = _splice_translation(
+                transcript_seq,
+                original_protein,
+                position,
+                dna_ref,
+                dna_alt)
+        else:
+            mutated_protein, n_mutated_protein = _frameshift_translation(
+                transcript_seq,
+                original_protein,
+                position,
+                dna_ref,
+                dna_alt)
+    if mutated_protein is None:
+        mutated_dna = mutate(transcript_seq, position, dna_ref, dna_alt)
+        mutated_protein = translate(mutated_dna)
+    if n_mutated_protein is None:
+        n_mutated_protein = len(mutated_protein)
 
     if str(original_protein) == str(mutated_protein):
         # if protein product is unmodified then
@@ -259,3 +467,82 @@ def mutate_protein_from_transcript(
         n_removed = n_aa_deleted,
         n_inserted = n_aa_inserted,
         annot = annot)
+
+MutatedProteins = \
+    namedtuple(
+        "MutatedProteins",
+        (
+            "seqs",  # list of mutated region sequences
+            "starts",  # array of region start positions in the protein
+            "stops",  # array of region stop positions in the protein
+            "mutation_starts",  # array of first mutated AA in each region
+            "n_removed",  # array of how many wildtype residues removed
+            "n_inserted",  # array of how many new residues in each seq
+            "annotations",  # list of mutation annotations i.e. "V600E"
+        ))
+
+def mutate_protein_many(
+        transcript_seq,
+        variants,
+        padding = None,
+        original_protein = None):
+    """
+    Apply each of many mutations to its own copy of a transcript and
+    translate them, checking all of the reference bases at once and
+    translating the unmutated transcript only once. Returns the fields of
+    the Mutation which mutate_protein_from_transcript would give for each
+    variant as a MutatedProteins of lists and arrays.
+
+    Parameters
+    ----------
+    transcript_seq :  sequence
+        Transcript sequence we're going to mutate
+
+    variants : list of tuples
+        (position, dna_ref, dna_alt) of each mutation
+
+    padding : int, optional
+        Number of wildtype amino acids to keep left and right of each
+        mutation. Default is to return whole mutated strings.
+
+    original_protein : sequence, optional
+        Translation of the unmutated `transcript_seq`, if it's already known
+    """
+    transcript_seq = str(transcript_seq)
+    if len(variants) > 0:
+        positions, dna_refs, dna_alts = zip(*variants)
+    else:
+        positions, dna_refs, dna_alts = (), (), ()
+    _check_refs(
+        transcript_seq,
+        positions,
+        dna_refs,
+        "Transcript reference base %s at position %d != reference %s")
+
+    if original_protein is None:
+        original_protein = translate(transcript_seq)
+    else:
+        original_protein = str(original_protein)
+    regions = [
+        _mutate_protein(
+            transcript_seq,
+            position,
+            dna_ref,
+            dna_alt,
+            padding,
+            original_protein)
+        for (position, dna_ref, dna_alt) in variants
+    ]
+    return MutatedProteins(
+        seqs = [region.seq for region in regions],
+        starts = np.array(
+            [region.start for region in regions], dtype=int),
+        stops = np.array(
+            [region.stop for region in regions], dtype=int),
+        mutation_starts = np.array(
+            [region.mutation_start for region in regions], dtype=int),
+        n_removed = np.array(
+            [region.n_removed for region in regions], dtype=int),
+        n_inserted = np.array(
+            [region.n_inserted for region in regions], dtype=int),
+        annotations = [region.annot for region in regions])
@@ -30,7 +30,7 @@ from epitope_scoring import (
 
 from group_epitopes import group_epitopes_dataframe
 from immunogenicity import (ImmunogenicityPredictor, THYMIC_DELETION_FIELD_NAME)
-from load_file import load_file
+from load_file import load_file, load_transcript_whitelist
 from mhc_common import normalize_hla_allele_name
 from mhc_iedb import IEDB_MHC1
 from mhc_netmhcpan import PanBindingPredictor
@@ -39,6 +39,7 @@ import mhc_random
 from peptide_binding_measure import IC50_FIELD_NAME, PERCENTILE_RANK_FIELD_NAME
 from strings import load_comma_string
 from vaccine_peptides import select_vaccine_peptides
+from worker_pool import PreloadedWorkerPool
 
 DEFAULT_ALLELE = 'HLA-A*02:01'
 
@@ -61,6 +62,26 @@ parser.add_argument("--quiet",
     help="Suppress verbose output"
 )
 
+parser.add_argument("--canonical-transcripts",
+    default=False,
+    action="store_true",
+    help="Only apply variants to the canonical transcript of each gene")
+
+parser.add_argument("--transcript-whitelist",
+    help="File with one Ensembl transcript ID per line, "
+         "only apply variants to these transcripts")
+
+parser.add_argument("--combine-codon-variants",
+    default=False,
+    action="store_true",
+    help="Apply variants which change the same codon of a transcript together "
+         "(e.g. a multi-nucleotide substitution split into several SNVs)")
+
+parser.add_argument("--workers",
+    default=1,
+    type=int,
+    help="Number of worker processes for applying variants to transcripts")
+
 parser.add_argument("--hla-file",
     help="File with one HLA allele per line")
 
@@ -165,6 +186,10 @@ def print_mutation_report(
     logging.info("FILE LOADING SUMMARY FOR %s", input_filename)
     logging.info("---")
     logging.info("# original mutations: %d", len(raw_genomic_mutation_df))
+    if 'in_coding_region' in raw_genomic_mutation_df.columns:
+        logging.info(
+            "# mutations outside of coding regions: %d",
+            (~raw_genomic_mutation_df['in_coding_region']).sum())
     logging.info(
         "# mutations with annotations: %d",
         len(transcripts_df.groupby(['chr', 'pos', 'ref', 'alt'])))
@@ -241,9 +266,26 @@ if __name__ == '__main__':
     # loop over all the input files and
     # load each one into a dataframe
 
+    if args.transcript_whitelist:
+        transcript_whitelist = load_transcript_whitelist(
+            args.transcript_whitelist)
+    else:
+        transcript_whitelist = None
+
+    if args.workers > 1 and len(args.input_file) > 0:
+        worker_pool = PreloadedWorkerPool(args.workers)
+    else:
+        worker_pool = None
+
     for input_filename in args.input_file:
         transcripts_df, raw_genomic_mutation_df, variant_report = \
-            load_file(input_filename, max_peptide_length = peptide_length)
+            load_file(
+                input_filename,
+                max_peptide_length = peptide_length,
+                canonical_only = args.canonical_transcripts,
+                transcript_whitelist = transcript_whitelist,
+                worker_pool = worker_pool,
+                combine_codon_variants = args.combine_codon_variants)
         mutated_region_dfs.append(transcripts_df)
 
         # print each genetic mutation applied to each possible transcript
@@ -255,6 +297,9 @@ if __name__ == '__main__':
                 raw_genomic_mutation_df,
                 transcripts_df)
 
+    if worker_pool is not None:
+        worker_pool.close()
+
     if len(mutated_region_dfs) == 0:
         parser.print_help()
         print "\nERROR: Must supply at least --string or --input-file"
@@ -0,0 +1,51 @@
+# Copyright (c) 2014. Mount Sinai School of Medicine
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from bisect import bisect_left, insort
+
+# sorts after any character of the strings in an index
+_LAST_CHARACTER = chr(255)
+
+class PrefixIndex(object):
+    """
+    Set of strings which can quickly find all the ones starting with a
+    given prefix. Strings are kept sorted, so the ones sharing a prefix
+    are next to each other and found with a pair of binary searches.
+    """
+
+    def __init__(self, strings = ()):
+        self._sorted = sorted(set(strings))
+
+    def __len__(self):
+        return len(self._sorted)
+
+    def __contains__(self, s):
+        i = bisect_left(self._sorted, s)
+        return i < len(self._sorted) and self._sorted[i] == s
+
+    def __iter__(self):
+        return iter(self._sorted)
+
+    def add(self, s):
+        if s not in self:
+            insort(self._sorted, s)
+
+    def starting_with(self, prefix):
+        """
+        Sorted list of the strings which start with `prefix`, including
+        `prefix` itself if it was added
+        """
+        start = bisect_left(self._sorted, prefix)
+        stop = bisect_left(self._sorted, prefix + _LAST_CHARACTER, lo = start)
+        return self._sorted[start:stop]
@@ -0,0 +1,251 @@
+#!/usr/bin/env python2
+
+# Copyright (c) 2014. Mount Sinai School of Medicine
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Download, decompress and index all of the reference data (Ensembl
+annotation dumps, transcript sequences and gene name tables) into the
+reference bundle directory ahead of time, so that later runs never wait on
+a cold cache. Downloads run concurrently in threads, and the tables and
+sequence indices are then built concurrently in separate processes.
+
+Files which were already downloaded can be copied from a local directory
+instead, either under their original (e.g. gene.txt.gz) or bundle names.
+With --verify, the hashes of everything already built are checked first
+and anything which doesn't match gets rebuilt.
+
+Example usage:
+  immuno-prepare-reference
+  immuno-prepare-reference --local-dir ~/ensembl-75/ --backend mmap
+  IMMUNO_ENSEMBL_RELEASE=77 immuno-prepare-reference --verify
+"""
+
+import argparse
+import gzip
+import logging
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+from os import remove, rename
+from os.path import basename, dirname, exists, join
+import shutil
+import time
+
+from common import init_logging
+from ensembl import gene_names, transcript_data, transcript_metadata
+from ensembl.manifest import (
+    forget_artifact, record_artifact, verify_artifact, verify_directory
+)
+from ensembl.reference_bundle import BUNDLE_NAME, bundle_path
+from ensembl.transcript_data import (
+    EnsemblReferenceData, SQLITE_BACKEND, MMAP_BACKEND, DEFAULT_BACKEND
+)
+
+REFERENCE_FILES = (
+    transcript_metadata.REFERENCE_FILES +
+    transcript_data.REFERENCE_FILES +
+    gene_names.REFERENCE_FILES
+)
+
+def install_local_file(source_path, dest_path, decompress):
+    """
+    Copy an already downloaded file to `dest_path`, decompressing it if
+    it's gzip'd and `decompress` is True. The copy is written under a
+    temporary name first so that an interrupted copy is never mistaken for
+    a complete file.
+    """
+    if decompress and source_path.endswith(".gz"):
+        source = gzip.open(source_path, 'rb')
+    else:
+        source = open(source_path, 'rb')
+    tmp_path = dest_path + ".tmp"
+    with source, open(tmp_path, 'wb') as dest:
+        shutil.copyfileobj(source, dest, 2 ** 20)
+    rename(tmp_path, dest_path)
+
+def fetch_reference_file(reference_file, local_dir = None):
+    """
+    Make sure `reference_file` is in the bundle, copying it from
+    `local_dir` if it's there and downloading it otherwise. Returns its
+    path in the bundle.
+
+    Fetched files are recorded in the bundle's manifest. A file which is
+    already in the bundle but doesn't match its manifest entry (e.g. one
+    left truncated by an interrupted download) is fetched again.
+    """
+    dest_path = reference_file.local_path()
+    params = {'source' : reference_file.url}
+    if verify_artifact(dest_path, params):
+        logging.info("Already have %s", dest_path)
+        return dest_path
+    if exists(dest_path):
+        logging.warning("Fetching %s again", dest_path)
+        remove(dest_path)
+    path = None
+    if local_dir:
+        for name in [reference_file.filename, basename(reference_file.url)]:
+            source_path = join(local_dir, name)
+            if exists(source_path):
+                logging.info("Copying %s to %s", source_path, dest_path)
+                install_local_file(
+                    source_path, dest_path, reference_file.decompress)
+                path = dest_path
+                break
+        else:
+            logging.warning(
+                "No copy of %s in %s, downloading %s",
+                reference_file.filename,
+                local_dir,
+                reference_file.url)
+    if path is None:
+        path = reference_file.fetch()
+    record_artifact(path, params)
+    return path
+
+def _build_transcript_metadata():
+    path = transcript_metadata.download_transcript_metadata()
+    transcript_metadata.transcript_metadata_columns_path(path)
+
+def _build_transcript_names():
+    gene_names.build_transcript_name_table()
+
+def _build_sequence_index(table_name, backend):
+    EnsemblReferenceData(backend = backend).preload([table_name])
+
+def _run_build_step(step):
+    fn, args = step
+    start_time = time.time()
+    fn(*args)
+    return time.time() - start_time
+
+def prepare_reference(
+        local_dir = None,
+        n_threads = 8,
+        n_processes = None,
+        backend = DEFAULT_BACKEND,
+        verify = False):
+    """
+    Parameters
+    ----------
+    local_dir : str, optional
+        Directory of already downloaded files to use instead of
+        downloading them
+
+    n_threads : int
+        Number of concurrent downloads
+
+    n_processes : int, optional
+        Number of processes building tables and indices, by default
+        the number of CPUs
+
+    backend : str
+        Which kind of reference sequence index to build
+        (see EnsemblReferenceData)
+
+    verify : bool
+        Check the hashes of all the tables and indices which were already
+        built, rebuilding the ones which don't match
+    """
+    start_time = time.time()
+    if verify:
+        bundle_dir = dirname(bundle_path(""))
+        for path in verify_directory(bundle_dir):
+            logging.warning("Rebuilding %s", path)
+            forget_artifact(path)
+        logging.info(
+            "Verified %s in %0.4f seconds",
+            bundle_dir,
+            time.time() - start_time)
+    pool = ThreadPool(n_threads)
+    try:
+        paths = pool.map(
+            lambda reference_file: fetch_reference_file(
+                reference_file, local_dir),
+            REFERENCE_FILES)
+    finally:
+        pool.close()
+        pool.join()
+    logging.info(
+        "Fetched %d reference files in %0.4f seconds",
+        len(paths),
+        time.time() - start_time)
+
+    steps = [
+        (_build_transcript_metadata, ()),
+        (_build_transcript_names, ()),
+    ] + [
+        (_build_sequence_index, (table_name, backend))
+        for table_name in ["CDNA", "CDS", "PROTEIN"]
+    ]
+    if n_processes is None:
+        n_processes = multiprocessing.cpu_count()
+    pool = multiprocessing.Pool(min(n_processes, len(steps)))
+    try:
+        step_times = pool.map(_run_build_step, steps)
+    finally:
+        pool.close()
+        pool.join()
+    for ((fn, args), step_time) in zip(steps, step_times):
+        logging.info(
+            "%s%s took %0.4f seconds", fn.__name__, args, step_time)
+    logging.info(
+        "Reference bundle %s ready in %s after %0.4f seconds",
+        BUNDLE_NAME,
+        dirname(paths[0]),
+        time.time() - start_time)
+
+parser = argparse.ArgumentParser(
+    description="Download and index all reference data ahead of time")
+
+parser.add_argument("--local-dir",
+    default=None,
+    help="Directory of already downloaded reference files")
+
+parser.add_argument("--threads",
+    default=8,
+    type=int,
+    help="Number of concurrent downloads")
+
+parser.add_argument("--processes",
+    default=None,
+    type=int,
+    help="Number of processes building indices (default: number of CPUs)")
+
+parser.add_argument("--backend",
+    default=DEFAULT_BACKEND,
+    choices=[SQLITE_BACKEND, MMAP_BACKEND],
+    help="Kind of reference sequence index to build")
+
+parser.add_argument("--verify",
+    default=False,
+    action="store_true",
+    help="Check the hashes of everything already built")
+
+parser.add_argument("--quiet",
+    default=False,
+    action="store_true",
+    help="Suppress INFO log messages")
+
+def main(args_list = None):
+    args = parser.parse_args(args_list)
+    init_logging(args.quiet)
+    prepare_reference(
+        local_dir = args.local_dir,
+        n_threads = args.threads,
+        n_processes = args.processes,
+        backend = args.backend,
+        verify = args.verify)
+
+if __name__ == '__main__':
+    main()
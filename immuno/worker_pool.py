@@ -0,0 +1,144 @@
+# Copyright (c) 2014. Mount Sinai School of Medicine
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Pool of worker processes which are forked after the parent has loaded the
+reference data, so the workers share those pages copy-on-write instead
+of each loading their own copy.
+"""
+
+import logging
+import multiprocessing
+import os
+from os.path import exists
+import time
+
+from ensembl import transcript_variant
+from load_file import preload_reference_data
+
+def _page_size():
+    return os.sysconf('SC_PAGE_SIZE')
+
+def process_rss():
+    """
+    Resident memory of this process in bytes (from /proc/self/statm),
+    or None if it's unavailable
+    """
+    if not exists("/proc/self/statm"):
+        return None
+    with open("/proc/self/statm") as f:
+        fields = f.read().split()
+    return int(fields[1]) * _page_size()
+
+def process_private_memory():
+    """
+    Resident memory of this process in bytes which isn't shared with any
+    other process, or None if it's unavailable. Unlike the RSS, this doesn't
+    count pages a forked process still shares with its parent.
+    """
+    if not exists("/proc/self/smaps_rollup"):
+        return None
+    total_kb = 0
+    with open("/proc/self/smaps_rollup") as f:
+        for line in f:
+            if line.startswith("Private_"):
+                total_kb += int(line.split()[1])
+    return total_kb * 1024
+
+def _megabytes(n_bytes):
+    return "?" if n_bytes is None else "%0.1fMB" % (n_bytes / 2.0 ** 20)
+
+def _peak(a, b):
+    if a is None:
+        return b
+    elif b is None:
+        return a
+    return max(a, b)
+
+def _init_worker():
+    # SQLite connections opened before the fork can't be used in the
+    # worker, so it opens its own
+    transcript_variant._ensembl.reset_connections()
+
+def _call_in_worker(fn_and_item):
+    fn, item = fn_and_item
+    result = fn(item)
+    return result, os.getpid(), process_rss(), process_private_memory()
+
+class PreloadedWorkerPool(object):
+    """
+    Calls `preload` in this process and then forks `n_workers` processes
+    which inherit whatever it loaded.
+    """
+
+    def __init__(self, n_workers = None, preload = None):
+        """
+        Parameters
+        ----------
+        n_workers : int, optional
+            Number of worker processes, by default the number of CPUs
+
+        preload : function, optional
+            Called with no arguments before forking the workers, by default
+            loads the Ensembl annotation tables and sequence databases
+        """
+        if preload is None:
+            preload = preload_reference_data
+        if n_workers is None:
+            n_workers = multiprocessing.cpu_count()
+        preload()
+        self.n_workers = n_workers
+        self.baseline_rss = process_rss()
+        self._worker_memory = {}
+        start_time = time.time()
+        self._pool = multiprocessing.Pool(n_workers, _init_worker)
+        logging.info(
+            "Forked %d workers in %0.4f seconds (parent RSS %s)",
+            n_workers,
+            time.time() - start_time,
+            _megabytes(self.baseline_rss))
+
+    def _record(self, pid, rss, private):
+        peak_rss, peak_private = self._worker_memory.get(pid, (None, None))
+        self._worker_memory[pid] = (
+            _peak(peak_rss, rss), _peak(peak_private, private))
+
+    def imap(self, fn, items):
+        """
+        Lazily apply `fn` to each item in the worker processes, yielding
+        results in the order of the items. The function and items must be
+        picklable, e.g. module-level functions.
+        """
+        for (result, pid, rss, private) in self._pool.imap(
+                _call_in_worker, [(fn, item) for item in items]):
+            self._record(pid, rss, private)
+            yield result
+
+    def map(self, fn, items):
+        return list(self.imap(fn, items))
+
+    def log_memory_usage(self):
+        logging.info(
+            "Parent RSS after preloading: %s", _megabytes(self.baseline_rss))
+        for pid, (rss, private) in sorted(self._worker_memory.items()):
+            logging.info(
+                "Worker %d: peak RSS %s, not shared with parent %s",
+                pid,
+                _megabytes(rss),
+                _megabytes(private))
+
+    def close(self):
+        self._pool.close()
+        self._pool.join()
+        self.log_memory_usage()
@@ -57,7 +57,12 @@ if __name__ == '__main__':
             'epitopes',
         ],
         long_description=readme,
-        packages=['immuno'],
+        packages=['immuno', 'immuno.ensembl'],
+        entry_points={
+            'console_scripts': [
+                'immuno-prepare-reference = immuno.prepare_reference:main',
+            ],
+        },
         package_data = {'immuno' : ['data/*txt']},
         include_package_data = True
     )
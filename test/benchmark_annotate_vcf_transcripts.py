@@ -0,0 +1,86 @@
+# Copyright (c) 2014. Mount Sinai School of Medicine
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compare the interval index lookup in annotate_vcf_transcripts against the
+original approach of merging every variant with every transcript on its
+chromosome and filtering by position afterward.
+
+Example usage:
+    python benchmark_annotate_vcf_transcripts.py 5000
+"""
+
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+import immuno.ensembl.annotation as ensembl
+
+def merge_annotate_vcf_transcripts(vcf_df):
+    transcripts_df = ensembl.data.transcripts_dataframe
+    all_possible_transcripts = vcf_df.merge(
+        transcripts_df, left_on='chr', right_on='name', how='left')
+    variant_position = all_possible_transcripts['pos']
+    transcript_start = all_possible_transcripts['seq_region_start_transcript']
+    transcript_stop = all_possible_transcripts['seq_region_end_transcript']
+    mask = (variant_position > transcript_start) & \
+        (variant_position < transcript_stop)
+    annotated = all_possible_transcripts[mask]
+    return annotated.drop_duplicates(), len(all_possible_transcripts)
+
+def random_variants(n_variants, seed = 0):
+    """
+    Sample positions uniformly from the span of each chromosome's
+    annotated transcripts, so most variants land outside of any exon
+    like they would in an exome or genome VCF.
+    """
+    rng = np.random.RandomState(seed)
+    transcripts_df = ensembl.data.transcripts_dataframe
+    spans = transcripts_df.groupby('name')['seq_region_end_transcript'].max()
+    contigs = rng.choice(spans.index.values, n_variants)
+    positions = [rng.randint(1, spans[contig]) for contig in contigs]
+    return pd.DataFrame({
+        'chr' : contigs,
+        'pos' : positions,
+        'ref' : ['A'] * n_variants,
+        'alt' : ['C'] * n_variants,
+    })
+
+def benchmark(n_variants):
+    vcf_df = random_variants(n_variants)
+    # build the annotation tables and index before timing anything
+    ensembl.data.transcript_interval_index
+
+    start_time = time.time()
+    merged, n_intermediate_rows = merge_annotate_vcf_transcripts(vcf_df)
+    merge_time = time.time() - start_time
+
+    start_time = time.time()
+    indexed = ensembl.annotate_vcf_transcripts(vcf_df)
+    index_time = time.time() - start_time
+
+    assert len(merged) == len(indexed), (len(merged), len(indexed))
+    assert list(merged.columns) == list(indexed.columns)
+
+    print "Variants: %d" % n_variants
+    print "Annotated rows: %d" % len(indexed)
+    print "Merge: %0.4fs (%d intermediate rows)" % (
+        merge_time, n_intermediate_rows)
+    print "Interval index: %0.4fs" % index_time
+
+if __name__ == '__main__':
+    n_variants = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    benchmark(n_variants)
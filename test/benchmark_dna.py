@@ -0,0 +1,130 @@
+# Copyright (c) 2014. Mount Sinai School of Medicine
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Apply a batch of random variants to random transcripts, reverse
+complementing and translating with immuno.dna, and compare against the
+same batch with a BioPython Seq created for every reverse complement and
+translation.
+
+Like in expand_transcripts, each transcript's reference sequence is only
+translated once, and the alleles of variants on reverse strand transcripts
+get reverse complemented.
+
+Example usage:
+    python benchmark_dna.py 10000
+"""
+
+import sys
+import time
+
+from Bio.Seq import Seq
+import numpy as np
+
+from immuno import dna, mutate
+
+SENSE_CODONS = [
+    codon for (codon, amino_acid) in sorted(dna.CODON_TABLE.items())
+    if amino_acid != '*'
+]
+
+def random_transcripts(n_transcripts, rng):
+    return [
+        "ATG" +
+        "".join(rng.choice(SENSE_CODONS, rng.randint(100, 1000))) +
+        "TAA"
+        for _ in xrange(n_transcripts)
+    ]
+
+def random_variants(transcripts, n_variants, rng):
+    """
+    Returns (transcript index, forward strand, CDS index, ref, alt) of
+    random substitutions, in-frame indels and frameshifts, with the
+    alleles of reverse strand variants given on the forward strand
+    """
+    variants = []
+    for _ in xrange(n_variants):
+        transcript_index = rng.randint(len(transcripts))
+        transcript = transcripts[transcript_index]
+        idx = rng.randint(3, len(transcript) - 6)
+        n_ref, n_alt = [(1, 1), (1, 1), (3, 0), (0, 3), (1, 0), (0, 2)][
+            rng.randint(6)]
+        ref = transcript[idx:idx + n_ref]
+        alt = "".join(rng.choice(list(dna.BASES), n_alt))
+        if ref == alt:
+            continue
+        forward = rng.rand() < 0.5
+        if not forward:
+            ref = dna.reverse_complement(ref)
+            alt = dna.reverse_complement(alt)
+        variants.append((transcript_index, forward, idx, ref, alt))
+    return variants
+
+def bio_reverse_complement(seq):
+    return str(Seq(seq).reverse_complement())
+
+def bio_translate(seq):
+    return str(Seq(seq[:3 * (len(seq) // 3)]).translate())
+
+def apply_variants(transcripts, variants, reverse_complement, translate):
+    translations = {}
+    regions = []
+    for (transcript_index, forward, idx, ref, alt) in variants:
+        if not forward:
+            ref = reverse_complement(ref)
+            alt = reverse_complement(alt)
+        if transcript_index not in translations:
+            translations[transcript_index] = translate(
+                transcripts[transcript_index])
+        regions.append(mutate.mutate_protein_from_transcript(
+            transcripts[transcript_index],
+            idx,
+            ref,
+            alt,
+            padding = 30,
+            original_protein = translations[transcript_index]))
+    return regions
+
+def apply_variants_biopython(transcripts, variants):
+    mutate_translate = mutate.translate
+    mutate.translate = bio_translate
+    try:
+        return apply_variants(
+            transcripts, variants, bio_reverse_complement, bio_translate)
+    finally:
+        mutate.translate = mutate_translate
+
+def apply_variants_dna(transcripts, variants):
+    return apply_variants(
+        transcripts, variants, dna.reverse_complement, dna.translate)
+
+def benchmark(n_variants, seed = 0):
+    rng = np.random.RandomState(seed)
+    transcripts = random_transcripts(max(1, n_variants // 5), rng)
+    variants = random_variants(transcripts, n_variants, rng)
+    results = []
+    for (name, fn) in [
+            ("BioPython Seq", apply_variants_biopython),
+            ("immuno.dna", apply_variants_dna)]:
+        start_time = time.time()
+        results.append(fn(transcripts, variants))
+        elapsed = time.time() - start_time
+        print "%s: %0.4fs (%0.1f us/variant)" % (
+            name, elapsed, 10.0 ** 6 * elapsed / len(variants))
+    assert results[0] == results[1]
+    print "Variants: %d on %d transcripts" % (len(variants), len(transcripts))
+
+if __name__ == '__main__':
+    n_variants = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    benchmark(n_variants)
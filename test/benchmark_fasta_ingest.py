@@ -0,0 +1,97 @@
+# Copyright (c) 2014. Mount Sinai School of Medicine
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compare build_sequence_db against the way datacache builds the sequence
+tables: parsing the decompressed FASTA file with BioPython and inserting
+each row into a table with a primary key, in SQLite's default journaling
+mode.
+
+Runs on a gzip'd FASTA file if one is given (e.g. the Ensembl cDNA file
+from the reference bundle), otherwise on randomly generated sequences.
+
+Example usage:
+    python benchmark_fasta_ingest.py 100000
+    python benchmark_fasta_ingest.py Homo_sapiens.GRCh37.75.cdna.all.fa.gz
+"""
+
+import gzip
+from os.path import join, exists
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+from Bio import SeqIO
+import numpy as np
+
+from immuno.ensembl.transcript_data import build_sequence_db
+
+def random_fasta(path, n_sequences, seed = 0):
+    rng = np.random.RandomState(seed)
+    with gzip.open(path, 'wb') as f:
+        for i in xrange(n_sequences):
+            length = rng.randint(100, 5000)
+            seq = "".join(rng.choice(list("ACGT"), length))
+            f.write(">ENST%011d cdna:known\n" % i)
+            for start in xrange(0, length, 60):
+                f.write(seq[start:start + 60] + "\n")
+
+def biopython_build_db(gzip_path, db_path, table_name):
+    fasta_path = db_path + ".fa"
+    with gzip.open(gzip_path, 'rb') as src, open(fasta_path, 'wb') as dst:
+        shutil.copyfileobj(src, dst)
+    db = sqlite3.connect(db_path)
+    db.execute(
+        "CREATE TABLE %s (id TEXT PRIMARY KEY, seq TEXT)" % table_name)
+    query = "INSERT INTO %s VALUES (?, ?)" % table_name
+    for (sequence_id, record) in SeqIO.index(fasta_path, 'fasta').items():
+        db.execute(query, (sequence_id, str(record.seq)))
+    db.commit()
+    db.close()
+
+def time_build(fn, gzip_path, db_path):
+    start_time = time.time()
+    fn(gzip_path, db_path, "CDNA")
+    elapsed = time.time() - start_time
+    db = sqlite3.connect(db_path)
+    n_rows = db.execute("SELECT COUNT(*) FROM CDNA").fetchone()[0]
+    db.close()
+    return n_rows, elapsed
+
+def benchmark(gzip_path, directory):
+    results = []
+    for (name, fn) in [
+            ("BioPython + row inserts", biopython_build_db),
+            ("build_sequence_db", build_sequence_db)]:
+        n_rows, elapsed = time_build(
+            fn, gzip_path, join(directory, name.split()[0] + ".db"))
+        results.append(n_rows)
+        print "%s: %d rows in %0.2fs (%d rows/sec)" % (
+            name, n_rows, elapsed, n_rows / elapsed)
+    assert results[0] == results[1], results
+
+if __name__ == '__main__':
+    arg = sys.argv[1] if len(sys.argv) > 1 else "20000"
+    directory = tempfile.mkdtemp()
+    try:
+        if exists(arg):
+            gzip_path = arg
+        else:
+            gzip_path = join(directory, "random.fa.gz")
+            random_fasta(gzip_path, int(arg))
+        benchmark(gzip_path, directory)
+    finally:
+        shutil.rmtree(directory)
@@ -0,0 +1,118 @@
+# Copyright (c) 2014. Mount Sinai School of Medicine
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+"""
+Compare mutate_protein_from_transcript, which only translates the codons
+changed by a substitution or in-frame indel and stops translating
+frameshifts at their first stop codon, against translating the whole
+mutated transcript. Runs on the variants of the dbNSFP validation set and
+on frameshifts made by deleting their reference bases instead.
+
+Example usage:
+    python benchmark_mutate_protein.py
+    python benchmark_mutate_protein.py dbnsfp_validation_set.csv 50
+"""
+
+import sys
+import time
+
+import pandas as pd
+
+from immuno import mutate
+from immuno.ensembl import annotation, transcript_variant
+
+PADDING = 30
+
+def load_cds_variants(path):
+    """
+    Returns (transcript, CDS index, ref, alt, reference protein) of each
+    variant in the validation set
+    """
+    ensembl = transcript_variant._ensembl
+    validation_set = pd.read_csv(path)
+    cds_variants = []
+    for (_, row) in validation_set.iterrows():
+        transcript_id = row['ensembl_transcript']
+        transcript = ensembl.get_cds(transcript_id)
+        cds_variant, error = transcript_variant._cds_variant(
+            transcript_id,
+            transcript,
+            annotation.is_forward_strand(transcript_id),
+            row['position'],
+            row['ref'],
+            row['alt'],
+            None)
+        if error is None:
+            cds_variants.append(
+                (transcript,) + cds_variant +
+                (ensembl.get_cds_translation(transcript_id),))
+    return cds_variants
+
+def frameshift_variants(cds_variants):
+    return [
+        (transcript, idx, ref, "", original_protein)
+        for (transcript, idx, ref, _, original_protein) in cds_variants
+    ]
+
+def mutate_all(cds_variants):
+    return [
+        mutate.mutate_protein_from_transcript(
+            transcript,
+            idx,
+            ref,
+            alt,
+            padding = PADDING,
+            original_protein = original_protein)
+        for (transcript, idx, ref, alt, original_protein) in cds_variants
+    ]
+
+def mutate_all_full_translation(cds_variants):
+    # make every mutation fall back on translating the whole transcript
+    splice_translation = mutate._splice_translation
+    frameshift_translation = mutate._frameshift_translation
+    mutate._splice_translation = lambda *args: None
+    mutate._frameshift_translation = lambda *args: (None, None)
+    try:
+        return mutate_all(cds_variants)
+    finally:
+        mutate._splice_translation = splice_translation
+        mutate._frameshift_translation = frameshift_translation
+
+def time_variants(cds_variants, n_repeats):
+    results = []
+    for (name, fn) in [
+            ("Full translation", mutate_all_full_translation),
+            ("Local translation", mutate_all)]:
+        start_time = time.time()
+        for _ in xrange(n_repeats):
+            regions = fn(cds_variants)
+        elapsed = time.time() - start_time
+        results.append(regions)
+        print "  %s: %0.4fs (%0.1f us/variant)" % (
+            name,
+            elapsed,
+            10.0 ** 6 * elapsed / (n_repeats * len(cds_variants)))
+    assert results[0] == results[1]
+
+def benchmark(path, n_repeats):
+    cds_variants = load_cds_variants(path)
+    print "Variants: %d" % len(cds_variants)
+    time_variants(cds_variants, n_repeats)
+    print "Frameshifts:"
+    time_variants(frameshift_variants(cds_variants), n_repeats)
+
+if __name__ == '__main__':
+    path = sys.argv[1] if len(sys.argv) > 1 else "dbnsfp_validation_set.csv"
+    n_repeats = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    benchmark(path, n_repeats)
@@ -0,0 +1,138 @@
+# Copyright (c) 2014. Mount Sinai School of Medicine
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from os.path import join
+import shutil
+import tempfile
+
+import pandas as pd
+
+from immuno import load_file
+from immuno.ensembl import annotation
+from immuno.ensembl.annotation_data import (
+    coding_exon_intervals,
+    EnsemblAnnotationData,
+)
+from immuno.ensembl.columnar import write_columns, ColumnStore
+
+def test_coding_exon_intervals():
+    # ENST1 is on the forward strand, ENST2 on the reverse strand (with its
+    # exons in transcript order) and ENST3's start exon is missing
+    df = pd.DataFrame({
+        'name' : ['1', '1', '1', '2', '2', '3'],
+        'stable_id_transcript' :
+            ['ENST1', 'ENST1', 'ENST1', 'ENST2', 'ENST2', 'ENST3'],
+        'seq_region_strand_gene' : [1, 1, 1, -1, -1, 1],
+        'exon_id' : [1, 2, 3, 5, 4, 6],
+        'seq_region_start_exon' : [100, 300, 500, 900, 700, 100],
+        'seq_region_end_exon' : [200, 400, 600, 1000, 800, 200],
+        'start_exon_id' : [1, 1, 1, 5, 5, 7],
+        'seq_start' : [51, 51, 51, 11, 11, 1],
+        'end_exon_id' : [3, 3, 3, 4, 4, 6],
+        'seq_end' : [20, 20, 20, 51, 51, 50],
+    })
+    directory = tempfile.mkdtemp()
+    try:
+        path = join(directory, "table.columns")
+        write_columns(df, path)
+        names, starts, ends = coding_exon_intervals(ColumnStore(path))
+        assert list(names) == ['1', '1', '1', '2', '2'], names
+        assert list(starts) == [150, 300, 500, 900, 750], starts
+        assert list(ends) == [200, 400, 519, 990, 800], ends
+    finally:
+        shutil.rmtree(directory)
+
+def make_transcript_metadata():
+    """
+    Transcript metadata table of a forward strand transcript on chr1 and a
+    reverse strand one on chr2, whose CDS both start ten bases before the
+    variants in VARIANTS
+    """
+    return pd.DataFrame({
+        'name' : ['1', '1', '1', '2', '2'],
+        'stable_id_gene' : ['ENSG1', 'ENSG1', 'ENSG1', 'ENSG2', 'ENSG2'],
+        'description_gene' : ['', '', '', '', ''],
+        'seq_region_start_gene' : [100, 100, 100, 700, 700],
+        'seq_region_end_gene' : [600, 600, 600, 1000, 1000],
+        'seq_region_strand_gene' : [1, 1, 1, -1, -1],
+        'stable_id_transcript' :
+            ['ENST1', 'ENST1', 'ENST1', 'ENST2', 'ENST2'],
+        'seq_region_start_transcript' : [100, 100, 100, 700, 700],
+        'seq_region_end_transcript' : [600, 600, 600, 1000, 1000],
+        'biotype' : ['protein_coding'] * 5,
+        'is_canonical' : [1, 1, 1, 1, 1],
+        'seq_start' : [51, 51, 51, 11, 11],
+        'start_exon_id' : [1, 1, 1, 5, 5],
+        'seq_end' : [20, 20, 20, 51, 51],
+        'end_exon_id' : [3, 3, 3, 4, 4],
+        'stable_id_translation' : ['ENSP1'] * 3 + ['ENSP2'] * 2,
+        'stable_id_exon' : ['ENSE1', 'ENSE2', 'ENSE3', 'ENSE5', 'ENSE4'],
+        'exon_id' : [1, 2, 3, 5, 4],
+        'rank' : [1, 2, 3, 1, 2],
+        'phase' : [0, 0, 0, -1, 0],
+        'seq_region_start_exon' : [100, 300, 500, 900, 700],
+        'seq_region_end_exon' : [200, 400, 600, 1000, 800],
+    })
+
+VARIANTS = pd.DataFrame({
+    'chr' : ['1', '2', '1'],
+    'pos' : [160, 980, 250],
+    'ref' : ['A', 'C', 'G'],
+    'alt' : ['T', 'G', 'T'],
+})
+
+def test_annotation_without_whole_table():
+    def to_dataframe(self, columns = None):
+        raise AssertionError("Loaded a DataFrame of %s" % self.directory)
+    original_to_dataframe = ColumnStore.to_dataframe
+    original_data = annotation.data
+    load_transcript_name_table = \
+        load_file.gene_names.load_transcript_name_table
+    preload_sequences = load_file.transcript_variant._ensembl.preload
+    directory = tempfile.mkdtemp()
+    try:
+        path = join(directory, "transcript_metadata.columns")
+        write_columns(make_transcript_metadata(), path)
+        data = EnsemblAnnotationData()
+        data._cached_transcript_metadata_columns = ColumnStore(path)
+        annotation.data = data
+        annotation.clear_transcript_model_cache()
+        ColumnStore.to_dataframe = to_dataframe
+        # gene names and reference sequences aren't in this fixture
+        load_file.gene_names.load_transcript_name_table = lambda: None
+        load_file.transcript_variant._ensembl.preload = lambda: None
+
+        load_file.preload_reference_data()
+        coding = annotation.variants_in_coding_regions(VARIANTS)
+        assert list(coding) == [True, True, False], coding
+        transcripts_df = annotation.annotate_vcf_transcripts(VARIANTS[coding])
+        assert list(transcripts_df['stable_id_transcript']) == \
+            ['ENST1', 'ENST2']
+        indices = annotation.get_transcript_indices_from_positions(
+            transcripts_df)
+        assert list(indices['transcript_index']) == [10, 10], indices
+        assert list(indices['forward']) == [True, False]
+        assert annotation.get_cds_start_phase('ENST2') == 0
+    finally:
+        ColumnStore.to_dataframe = original_to_dataframe
+        annotation.data = original_data
+        annotation.clear_transcript_model_cache()
+        load_file.gene_names.load_transcript_name_table = \
+            load_transcript_name_table
+        load_file.transcript_variant._ensembl.preload = preload_sequences
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+  from dsltools import testing_helpers
+  testing_helpers.run_local_tests()
@@ -0,0 +1,94 @@
+# Copyright (c) 2014. Mount Sinai School of Medicine
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import os
+from os.path import join, exists
+import shutil
+import socket
+import tempfile
+import threading
+
+from nose.tools import assert_raises
+
+from immuno.annotation_client import (
+    AnnotationClient, AnnotationServerError, send_message, recv_message
+)
+from immuno.annotation_server import AnnotationServer, AnnotationRequestHandler
+
+def test_message_round_trip():
+    a, b = socket.socketpair()
+    try:
+        # larger than a single recv
+        message = ("expand_transcripts", ("A" * 3000000,), {'x' : [1, 2]})
+        sender = threading.Thread(target = send_message, args = (a, message))
+        sender.start()
+        assert recv_message(b) == message
+        sender.join()
+    finally:
+        a.close()
+        b.close()
+
+def test_client_without_server():
+    dirname = tempfile.mkdtemp()
+    try:
+        client = AnnotationClient(join(dirname, "missing.sock"))
+        assert not client.is_available()
+        assert_raises(socket.error, client.call, "ping")
+    finally:
+        shutil.rmtree(dirname)
+
+def test_server_commands():
+    dirname = tempfile.mkdtemp()
+    socket_path = join(dirname, "annotation.sock")
+    server = AnnotationServer(socket_path, AnnotationRequestHandler)
+    thread = threading.Thread(target = server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    try:
+        client = AnnotationClient(socket_path)
+        assert client.is_available()
+        assert client.call("ping") == "pong"
+        assert_raises(AnnotationServerError, client.call, "no_such_command")
+    finally:
+        server.shutdown()
+        server.server_close()
+        assert not exists(socket_path)
+        shutil.rmtree(dirname)
+
+def test_server_socket_permissions():
+    dirname = tempfile.mkdtemp()
+    socket_path = join(dirname, "annotation.sock")
+    # even if the process would create files anyone can write, the socket
+    # has to be created private rather than changed afterward
+    umask = os.umask(0)
+    chmod = os.chmod
+    os.chmod = lambda path, mode: None
+    try:
+        try:
+            server = AnnotationServer(socket_path, AnnotationRequestHandler)
+        finally:
+            os.chmod = chmod
+        try:
+            assert os.stat(socket_path).st_mode & 0077 == 0
+            # and the process's umask is left as it was
+            assert os.umask(0) == 0
+        finally:
+            server.server_close()
+    finally:
+        os.umask(umask)
+        shutil.rmtree(dirname)
+
+if __name__ == '__main__':
+  from dsltools import testing_helpers
+  testing_helpers.run_local_tests()
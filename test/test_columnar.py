@@ -0,0 +1,79 @@
+# Copyright (c) 2014. Mount Sinai School of Medicine
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from os.path import join
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from immuno.ensembl.columnar import write_columns, ColumnStore
+
+def make_column_store():
+    df = pd.DataFrame({
+        'name' : ['1', '1', 'X'],
+        'stable_id_transcript' : ['ENST1', None, 'ENST2'],
+        'seq_region_start_exon' : [100, 200, 300],
+        'seq_start' : [1.0, np.nan, 3.0],
+    }, columns = [
+        'name', 'stable_id_transcript', 'seq_region_start_exon', 'seq_start'
+    ])
+    directory = tempfile.mkdtemp()
+    path = join(directory, "table.columns")
+    write_columns(df, path)
+    return df, directory, ColumnStore(path)
+
+def test_column_store_roundtrip():
+    df, directory, store = make_column_store()
+    try:
+        assert store.columns == list(df.columns)
+        assert len(store) == 3
+        loaded = store.to_dataframe()
+        assert list(loaded['name']) == ['1', '1', 'X']
+        assert list(loaded['seq_region_start_exon']) == [100, 200, 300]
+        assert loaded['seq_region_start_exon'].dtype == np.int32
+        assert np.isnan(loaded['seq_start'][1])
+        assert loaded['stable_id_transcript'][0] == 'ENST1'
+        assert pd.isnull(loaded['stable_id_transcript'][1])
+    finally:
+        shutil.rmtree(directory)
+
+def test_column_store_subset():
+    df, directory, store = make_column_store()
+    try:
+        loaded = store.to_dataframe(['seq_start'])
+        assert list(loaded.columns) == ['seq_start']
+        assert list(store.codes('name')) == [0, 0, 1]
+    finally:
+        shutil.rmtree(directory)
+
+def test_column_store_take():
+    df, directory, store = make_column_store()
+    try:
+        rows = np.array([False, True, True])
+        transcript_ids = store.take('stable_id_transcript', rows)
+        assert pd.isnull(transcript_ids[0])
+        assert transcript_ids[1] == 'ENST2'
+        assert list(store.take('name', [2, 0])) == ['X', '1']
+        assert list(store.take('seq_region_start_exon', rows)) == [200, 300]
+        # string columns which were already decoded aren't decoded again
+        assert list(store.take('name', rows)) == \
+            list(store['name'][rows])
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+  from dsltools import testing_helpers
+  testing_helpers.run_local_tests()
@@ -0,0 +1,52 @@
+# Copyright (c) 2014. Mount Sinai School of Medicine
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from Bio.Seq import Seq
+import numpy as np
+
+from immuno import dna
+
+def random_dna(n_bases, seed = 0):
+    rng = np.random.RandomState(seed)
+    return "".join(rng.choice(list(dna.BASES), n_bases))
+
+def test_encode():
+    codes = dna.encode("ACGTNa")
+    assert list(codes) == [0, 1, 2, 3, dna.UNKNOWN_BASE, dna.UNKNOWN_BASE]
+
+def test_reverse_complement():
+    for seq in ["", "A", "ACCGTT", "acgtNnRY-", random_dna(1000)]:
+        assert dna.reverse_complement(seq) == \
+            str(Seq(seq).reverse_complement()), seq
+
+def test_translate_codons():
+    assert dna.translate_codons("ATGGCCTAA") == "MA*"
+    assert dna.translate_codons("ATGNCC") is None
+
+def test_translate():
+    # short sequences are translated from the codon dictionary and long
+    # ones with arrays, all of them like BioPython does
+    for n_bases in [0, 2, 3, 31, 299, 300, 3001]:
+        seq = random_dna(n_bases)
+        n_codon_bases = 3 * (n_bases // 3)
+        assert dna.translate(seq) == \
+            str(Seq(seq[:n_codon_bases]).translate()), n_bases
+
+def test_translate_ambiguous_bases():
+    for seq in ["ATGNNNCTN", "ATG" * 200 + "NNN" + "acg" * 200]:
+        assert dna.translate(seq) == str(Seq(seq).translate()), seq
+
+if __name__ == '__main__':
+  from dsltools import testing_helpers
+  testing_helpers.run_local_tests()
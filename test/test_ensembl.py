@@ -84,6 +84,15 @@ def test_load_SMAD4_cdna_transcript():
     assert transcript[0] == 'A', transcript[0]
     assert transcript[-1] == 'T', transcript[-1]
 
+def test_load_cdna_many():
+    transcript_ids = ["ENST00000453024", "ENST00000342988", "ENST_MISSING"]
+    transcripts = ref_data.get_cdna_many(transcript_ids)
+    assert len(transcripts["ENST00000453024"]) == 2841
+    assert len(transcripts["ENST00000342988"]) == 8769
+    assert transcripts["ENST_MISSING"] is None
+    assert ref_data.get_cdna("ENST00000342988") == \
+        transcripts["ENST00000342988"]
+
 def test_get_gene_from_pos():
     variant = {
         'chr' : '3',
@@ -122,6 +131,48 @@ def test_get_all_transcript_from_pos():
     assert( "ENST00000453024" in transcript_ids)
     assert( "ENST00000396185" in transcript_ids)
 
+def test_get_canonical_transcript_from_pos():
+    variant = {
+        'chr' : '3',
+        'pos' : 41275636,
+        'ref' : 'G',
+        'alt' : 'A'
+    }
+    vcf = pd.DataFrame.from_records([variant])
+    transcripts_df = ensembl.annotate_vcf_transcripts(
+        vcf, canonical_only = True)
+    # CTNNB1 has one canonical transcript
+    assert len(transcripts_df) == 1, transcripts_df
+    assert transcripts_df['is_canonical'].all()
+    assert "ENSG00000168036" in set(transcripts_df['stable_id_gene'])
+
+def test_get_whitelisted_transcripts_from_pos():
+    variant = {
+        'chr' : '3',
+        'pos' : 41275636,
+        'ref' : 'G',
+        'alt' : 'A'
+    }
+    vcf = pd.DataFrame.from_records([variant])
+    whitelist = ["ENST00000405570", "ENST00000453024", "ENST00000000000"]
+    transcripts_df = ensembl.annotate_vcf_transcripts(
+        vcf, transcript_whitelist = whitelist)
+    transcript_ids = set(transcripts_df['stable_id_transcript'])
+    assert transcript_ids == set(["ENST00000405570", "ENST00000453024"])
+
+def test_skip_non_coding_transcripts():
+    variant = {
+        'chr' : '3',
+        'pos' : 41275636,
+        'ref' : 'G',
+        'alt' : 'A'
+    }
+    vcf = pd.DataFrame.from_records([variant])
+    coding = ensembl.annotate_vcf_transcripts(vcf)
+    assert set(coding['biotype']) <= ensembl.PROTEIN_CODING_BIOTYPES
+    all_transcripts = ensembl.annotate_vcf_transcripts(vcf, biotypes = None)
+    assert len(all_transcripts) >= len(coding)
+
 def test_get_transcript_index_from_pos():
     variant = {
         'chr' : '3',
@@ -137,6 +188,29 @@ def test_get_transcript_index_from_pos():
     transcript = ref_data.get_cdna(transcript_id)
     assert(transcript[idx] == variant['ref'])
 
+def test_get_transcript_indices_from_positions():
+    transcripts_df = pd.DataFrame({
+        'pos' : [41275636, 41275636, 41240000],
+        'stable_id_transcript' : [
+            'ENST00000405570', 'ENST00000453024', 'ENST00000405570'
+        ],
+    })
+    indices = ensembl.get_transcript_indices_from_positions(
+        transcripts_df, skip_untranslated_region = False)
+    assert list(indices['error']) == [
+        ensembl.TRANSCRIPT_INDEX_OK,
+        ensembl.TRANSCRIPT_INDEX_OK,
+        ensembl.TRANSCRIPT_INDEX_NOT_IN_EXON,
+    ], indices
+    assert indices['transcript_index'][0] == 1686, indices
+    assert indices['forward'].all()
+    for i in xrange(2):
+        idx = ensembl.get_transcript_index_from_pos(
+            transcripts_df['pos'][i],
+            transcripts_df['stable_id_transcript'][i],
+            skip_untranslated_region = False)
+        assert indices['transcript_index'][i] == idx, (indices, idx)
+
 def test_get_5prime_utr_length_RET():
 
     transcript_id = "ENST00000355710"
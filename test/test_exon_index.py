@@ -0,0 +1,56 @@
+# Copyright (c) 2014. Mount Sinai School of Medicine
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from nose.tools import assert_raises
+
+from immuno.ensembl.exon_index import TranscriptExonIndex
+
+# the transcript of each exon, as a position in transcript_ids
+# (-1 for an exon without a transcript)
+transcript_codes = [1, 0, 1, -1, 1, 0]
+transcript_ids = ['ENST1', 'ENST2', 'ENST3']
+exon_ids = [20, 10, 21, 99, 22, 11]
+starts = [200, 100, 210, 990, 220, 110]
+
+index = TranscriptExonIndex(
+    transcript_codes,
+    transcript_ids,
+    {'exon_id' : exon_ids, 'seq_region_start_exon' : starts})
+
+def test_exon_index_length():
+    # ENST3 doesn't have any exons
+    assert len(index) == 2
+
+def test_exon_index_contains():
+    assert 'ENST1' in index
+    assert 'ENST2' in index
+    assert 'ENST3' not in index
+    assert 'ENST4' not in index
+
+def test_exon_index_keeps_exon_order():
+    assert list(index.get('ENST1', 'exon_id')) == [10, 11]
+    assert list(index.get('ENST2', 'exon_id')) == [20, 21, 22]
+
+def test_exon_index_dataframe():
+    df = index.to_dataframe('ENST2', ['seq_region_start_exon', 'exon_id'])
+    assert list(df.columns) == ['seq_region_start_exon', 'exon_id']
+    assert list(df['seq_region_start_exon']) == [200, 210, 220]
+
+def test_exon_index_missing_transcript():
+    assert_raises(KeyError, index.get, 'ENST3', 'exon_id')
+    assert_raises(KeyError, index.to_dataframe, 'ENST4', ['exon_id'])
+
+if __name__ == '__main__':
+  from dsltools import testing_helpers
+  testing_helpers.run_local_tests()
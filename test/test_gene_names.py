@@ -0,0 +1,45 @@
+# Copyright (c) 2014. Mount Sinai School of Medicine
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pandas as pd
+
+from immuno.ensembl import gene_names
+
+# CTNNB1 transcripts
+transcript_ids = ['ENST00000405570', 'ENST00000453024']
+
+def test_map_transcript_ids_to_gene_names():
+    names = gene_names.map_transcript_ids_to_gene_names(transcript_ids)
+    assert list(names) == ['CTNNB1', 'CTNNB1'], names
+
+def test_map_transcript_ids_to_gene_ids():
+    gene_ids = gene_names.map_transcript_ids_to_gene_ids(
+        pd.Series(transcript_ids, index = [10, 20]))
+    assert list(gene_ids.index) == [10, 20]
+    assert list(gene_ids) == ['ENSG00000168036', 'ENSG00000168036'], gene_ids
+
+def test_map_gene_ids_to_names():
+    names = gene_names.map_gene_ids_to_names(['ENSG00000168036', 'ENSG0'])
+    assert names[0] == 'CTNNB1', names
+    assert pd.isnull(names[1]), names
+
+def test_map_matches_single_lookup():
+    names = gene_names.map_transcript_ids_to_transcript_names(transcript_ids)
+    for transcript_id, name in zip(transcript_ids, names):
+        assert name == \
+            gene_names.transcript_id_to_transcript_name(transcript_id)
+
+if __name__ == '__main__':
+  from dsltools import testing_helpers
+  testing_helpers.run_local_tests()
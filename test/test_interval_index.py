@@ -0,0 +1,72 @@
+# Copyright (c) 2014. Mount Sinai School of Medicine
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from immuno.ensembl.interval_index import (
+    MergedIntervals, TranscriptIntervalIndex
+)
+
+contigs = ['1', '1', '1', '2', '1']
+starts = [100, 150, 1000, 100, 120]
+ends = [5000, 200, 1100, 300, 130]
+
+index = TranscriptIntervalIndex(contigs, starts, ends)
+
+def test_interval_index_length():
+    assert len(index) == 5
+
+def test_interval_index_nested():
+    hits = list(index.find('1', 125))
+    assert hits == [0, 4], hits
+
+def test_interval_index_excludes_endpoints():
+    hits = list(index.find('1', 150))
+    assert hits == [0], hits
+    hits = list(index.find('1', 200))
+    assert hits == [0], hits
+
+def test_interval_index_long_interval_spans_later_ones():
+    hits = list(index.find('1', 1050))
+    assert hits == [0, 2], hits
+
+def test_interval_index_other_contig():
+    hits = list(index.find('2', 150))
+    assert hits == [3], hits
+
+def test_interval_index_no_hits():
+    assert len(index.find('1', 6000)) == 0
+    assert len(index.find('1', 50)) == 0
+    assert len(index.find('X', 150)) == 0
+
+merged = MergedIntervals(
+    ['1', '1', '1', '1', '2'],
+    [100, 150, 301, 500, 100],
+    [200, 300, 310, 600, 200])
+
+def test_merged_intervals_length():
+    # 100-200, 150-300 and 301-310 merge into one interval
+    assert len(merged) == 3
+
+def test_merged_intervals_contains():
+    contains = merged.contains(
+        ['1', '1', '1', '1', '1', '1', '2', 'X'],
+        [100, 250, 310, 311, 450, 600, 150, 150])
+    assert list(contains) == \
+        [True, True, True, False, False, True, True, False], contains
+
+def test_merged_intervals_before_first():
+    assert list(merged.contains(['1', '2'], [99, 1])) == [False, False]
+
+if __name__ == '__main__':
+  from dsltools import testing_helpers
+  testing_helpers.run_local_tests()
@@ -0,0 +1,46 @@
+# Copyright (c) 2014. Mount Sinai School of Medicine
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from immuno.lru_cache import LRUCache
+
+def test_lru_cache_evicts_least_recently_used():
+    cache = LRUCache(2)
+    cache['a'] = 1
+    cache['b'] = 2
+    # touch 'a' so that 'b' is the oldest entry
+    assert cache['a'] == 1
+    cache['c'] = 3
+    assert len(cache) == 2
+    assert 'a' in cache
+    assert 'b' not in cache
+    assert 'c' in cache
+
+def test_lru_cache_get_default():
+    cache = LRUCache(1)
+    assert cache.get('a') is None
+    assert cache.get('a', 0) == 0
+    cache['a'] = None
+    assert 'a' in cache
+    assert cache.get('a', 0) is None
+
+def test_lru_cache_overwrite():
+    cache = LRUCache(2)
+    cache['a'] = 1
+    cache['a'] = 2
+    assert len(cache) == 1
+    assert cache['a'] == 2
+
+if __name__ == '__main__':
+  from dsltools import testing_helpers
+  testing_helpers.run_local_tests()
@@ -0,0 +1,100 @@
+# Copyright (c) 2014. Mount Sinai School of Medicine
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from os import makedirs
+from os.path import join
+import shutil
+import tempfile
+
+from immuno.ensembl.manifest import (
+    record_artifact,
+    verify_artifact,
+    verify_directory,
+    forget_artifact,
+)
+
+PARAMS = {'source' : 'gene.txt.gz', 'contigs' : ['1', '2']}
+
+def write(path, contents):
+    with open(path, 'w') as f:
+        f.write(contents)
+
+def test_unrecorded_artifact():
+    directory = tempfile.mkdtemp()
+    try:
+        path = join(directory, "table.tsv")
+        # a file left behind by a crashed build isn't trusted
+        write(path, "a\tb\n")
+        assert not verify_artifact(path, PARAMS)
+        record_artifact(path, PARAMS)
+        assert verify_artifact(path, PARAMS)
+        assert verify_artifact(path, PARAMS, full = True)
+        forget_artifact(path)
+        assert not verify_artifact(path, PARAMS)
+    finally:
+        shutil.rmtree(directory)
+
+def test_changed_params():
+    directory = tempfile.mkdtemp()
+    try:
+        path = join(directory, "table.tsv")
+        write(path, "a\tb\n")
+        record_artifact(path, PARAMS)
+        assert not verify_artifact(path, dict(PARAMS, contigs = ['1']))
+    finally:
+        shutil.rmtree(directory)
+
+def test_changed_size():
+    directory = tempfile.mkdtemp()
+    try:
+        path = join(directory, "table.tsv")
+        write(path, "a\tb\n")
+        record_artifact(path, PARAMS)
+        write(path, "a\t")
+        assert not verify_artifact(path, PARAMS)
+    finally:
+        shutil.rmtree(directory)
+
+def test_changed_contents():
+    directory = tempfile.mkdtemp()
+    try:
+        path = join(directory, "table.tsv")
+        write(path, "a\tb\n")
+        record_artifact(path, PARAMS)
+        write(path, "a\tc\n")
+        # only the full check looks at the contents
+        assert verify_artifact(path, PARAMS)
+        assert not verify_artifact(path, PARAMS, full = True)
+        assert verify_directory(directory) == [path]
+    finally:
+        shutil.rmtree(directory)
+
+def test_directory_artifact():
+    directory = tempfile.mkdtemp()
+    try:
+        path = join(directory, "table.columns")
+        makedirs(path)
+        write(join(path, "a.npy"), "1234")
+        write(join(path, "b.npy"), "5678")
+        record_artifact(path, PARAMS)
+        assert verify_artifact(path, PARAMS)
+        assert verify_directory(directory) == []
+        write(join(path, "b.npy"), "5679")
+        assert verify_directory(directory) == [path]
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+  from dsltools import testing_helpers
+  testing_helpers.run_local_tests()
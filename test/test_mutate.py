@@ -180,3 +180,74 @@ def test_stop_codon_after_subst_annotation():
     assert region.annot == 'A2P*', region
 
 
+
+def test_mutate_protein_from_transcript_given_original_protein():
+    seq = Seq("ACTGCTATTCGTAGT")
+    for (position, ref, alt) in [(1, 'C', 'A'), (1, 'C', 'AA'), (3, "GCT", "")]:
+        region = mutate.mutate_protein_from_transcript(
+            seq, position, ref, alt, padding = 8)
+        region_given_protein = mutate.mutate_protein_from_transcript(
+            seq, position, ref, alt, padding = 8, original_protein = "TAIRS")
+        assert region == region_given_protein, (region, region_given_protein)
+
+def test_splice_translation():
+    seq = "ACTGCTATTCGTAGTA"
+    prot_seq = str(Seq(seq[:15]).translate())
+    for (position, ref, alt) in [
+            (1, 'C', 'A'),
+            (4, 'CTATTC', 'AAA'),
+            (3, '', 'TAG'),
+            (8, 'T', 'TGGG'),
+            (12, 'AGT', '')]:
+        spliced = mutate._splice_translation(seq, prot_seq, position, ref, alt)
+        mutated = mutate.mutate(seq, position, ref, alt)
+        n_codons = len(mutated) // 3
+        assert spliced == str(Seq(mutated[:3 * n_codons]).translate()), \
+            (position, ref, alt, spliced)
+    # frameshifts and changes to the incomplete last codon are translated
+    # in full
+    assert mutate._splice_translation(seq, prot_seq, 1, 'C', 'AA') is None
+    assert mutate._splice_translation(seq, prot_seq, 15, 'A', 'G') is None
+
+def test_frameshift_translation():
+    # deleting the G of the second codon reads TAA as a stop codon two
+    # residues later, the mutated protein is only translated up to there
+    seq = "ATGGCCAAAGTAAACCCGGGA"
+    original_protein = str(Seq(seq).translate())
+    assert original_protein == "MAKVNPG"
+    mutated_protein, n_mutated_protein = mutate._frameshift_translation(
+        seq, original_protein, 3, 'G', '')
+    assert mutated_protein == "MPK*", mutated_protein
+    assert n_mutated_protein == 6
+
+def test_mutate_many():
+    seq = "ACCTGG"
+    mutated = mutate.mutate_many(
+        seq, [1, 3, 0], ["C", "TG", ""], ["T", "", "G"])
+    assert mutated.seqs == ["ATCTGG", "ACCG", "GACCTGG"], mutated.seqs
+    assert list(mutated.starts) == [1, 3, 0]
+    assert list(mutated.stops) == [2, 3, 1]
+    assert mutated.annotations[0] == "C2T"
+
+def test_mutate_many_wrong_ref():
+    try:
+        mutate.mutate_many("ACCTGG", [1, 5], ["C", "GA"], ["T", ""])
+    except AssertionError as e:
+        assert "position 5" in str(e), str(e)
+    else:
+        assert False, "Expected the ref GA past the end to be rejected"
+
+def test_mutate_protein_many():
+    seq = "ATGGCCAAAGTAAACCCGGGA"
+    variants = [(4, "C", "T"), (3, "G", ""), (6, "AAA", ""), (9, "", "TGG")]
+    regions = mutate.mutate_protein_many(seq, variants, padding = 2)
+    for (i, (position, ref, alt)) in enumerate(variants):
+        region = mutate.mutate_protein_from_transcript(
+            seq, position, ref, alt, padding = 2)
+        assert regions.seqs[i] == region.seq
+        assert regions.starts[i] == region.start
+        assert regions.stops[i] == region.stop
+        assert regions.mutation_starts[i] == region.mutation_start
+        assert regions.n_removed[i] == region.n_removed
+        assert regions.n_inserted[i] == region.n_inserted
+        assert regions.annotations[i] == region.annot
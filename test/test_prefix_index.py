@@ -0,0 +1,40 @@
+# Copyright (c) 2014. Mount Sinai School of Medicine
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from immuno.prefix_index import PrefixIndex
+
+def test_prefix_index_starting_with():
+    index = PrefixIndex(["SIINFEKL", "SIINF", "SLYNTVATL", "ASIINFEKL"])
+    assert index.starting_with("SIINF") == ["SIINF", "SIINFEKL"]
+    assert index.starting_with("SIINFEKL") == ["SIINFEKL"]
+    assert index.starting_with("S") == ["SIINF", "SIINFEKL", "SLYNTVATL"]
+    assert index.starting_with("SIINFEKLX") == []
+    assert index.starting_with("Q") == []
+    assert len(index.starting_with("")) == 4
+
+def test_prefix_index_add():
+    index = PrefixIndex()
+    assert len(index) == 0
+    index.add("KLK")
+    index.add("K")
+    index.add("KLK")
+    assert len(index) == 2
+    assert "K" in index
+    assert "KL" not in index
+    assert list(index) == ["K", "KLK"]
+    assert index.starting_with("KL") == ["KLK"]
+
+if __name__ == '__main__':
+  from dsltools import testing_helpers
+  testing_helpers.run_local_tests()
@@ -0,0 +1,182 @@
+# Copyright (c) 2014. Mount Sinai School of Medicine
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import gzip
+from os import environ, listdir
+from os.path import join, exists, getsize, splitext
+import shutil
+import tempfile
+
+import datacache.download
+
+from immuno.ensembl import gene_names, transcript_data
+from immuno.ensembl.manifest import read_manifest, verify_directory
+from immuno.ensembl.reference_bundle import ReferenceFile, bundle_path
+from immuno.prepare_reference import (
+    REFERENCE_FILES, install_local_file, fetch_reference_file, main
+)
+
+CONTENTS = "ENSG00000139618\tBRCA2\n" * 1000
+
+def test_install_gzip_file():
+    dirname = tempfile.mkdtemp()
+    try:
+        source_path = join(dirname, "gene.txt.gz")
+        f = gzip.open(source_path, 'wb')
+        f.write(CONTENTS)
+        f.close()
+        dest_path = join(dirname, "gene.txt")
+        install_local_file(source_path, dest_path, decompress = True)
+        assert open(dest_path).read() == CONTENTS
+        assert not exists(dest_path + ".tmp")
+    finally:
+        shutil.rmtree(dirname)
+
+def test_install_plain_file():
+    dirname = tempfile.mkdtemp()
+    try:
+        source_path = join(dirname, "hugo.txt")
+        with open(source_path, 'w') as f:
+            f.write(CONTENTS)
+        dest_path = join(dirname, "hugo_genes.tsv")
+        install_local_file(source_path, dest_path, decompress = True)
+        assert open(dest_path).read() == CONTENTS
+    finally:
+        shutil.rmtree(dirname)
+
+def write_dump(directory, table_name, rows):
+    with gzip.open(join(directory, "%s.txt.gz" % table_name), 'wb') as f:
+        for row in rows:
+            f.write("\t".join(
+                "\\N" if x is None else str(x) for x in row) + "\n")
+
+def write_reference_files(directory):
+    """
+    Ensembl dumps, FASTA files and gene name tables of a single transcript
+    with two exons on chromosome 1
+    """
+    write_dump(directory, "seq_region", [(101, "1", 4)])
+    write_dump(directory, "gene", [
+        (1, "protein_coding", 1, 101, 1000, 2000, 1, 0, "ensembl", "KNOWN",
+            "BRCA2", 1, 1, "ENSG00000139618", 1, "2010", "2010")])
+    write_dump(directory, "transcript", [
+        (1, 1, 1, 101, 1000, 2000, 1, 0, "ensembl", "protein_coding",
+            "KNOWN", None, 1, 1, "ENST00000380152", 1, "2010", "2010")])
+    write_dump(directory, "translation", [
+        (1, 1, 11, 1, 20, 2, "ENSP00000369497", 1, "2010", "2010")])
+    write_dump(directory, "exon", [
+        (1, 101, 1000, 1100, 1, 0, -1, 1, 0, "ENSE00001184784", 1,
+            "2010", "2010"),
+        (2, 101, 1900, 2000, 1, 0, -1, 1, 0, "ENSE00001484009", 1,
+            "2010", "2010")])
+    write_dump(directory, "exon_transcript", [(1, 1, 1), (2, 1, 2)])
+    for reference_file in transcript_data.REFERENCE_FILES:
+        with gzip.open(join(directory, reference_file.filename), 'wb') as f:
+            f.write(">ENST00000380152 cds:known\nATGCCTATTGGATCC\n")
+    tables = {
+        "hugo_genes.tsv" : [
+            "Approved Symbol\tApproved Name\tEnsembl ID(supplied by Ensembl)",
+            "BRCA2\tbreast cancer 2\tENSG00000139618"],
+        "biomart_transcript_gene.tsv" : [
+            "Ensembl Gene ID\tEnsembl Transcript ID",
+            "ENSG00000139618\tENST00000380152"],
+        "biomart_transcript_name.tsv" : [
+            "Ensembl Transcript ID\tAssociated Transcript Name",
+            "ENST00000380152\tBRCA2-001"],
+    }
+    for reference_file in gene_names.REFERENCE_FILES:
+        with open(join(directory, reference_file.filename), 'w') as f:
+            f.write("\n".join(tables[reference_file.filename]) + "\n")
+
+def no_download(filename, full_path, download_url):
+    raise AssertionError("Tried to download %s" % download_url)
+
+def run_offline(fn):
+    """
+    Call `fn` with a directory of local reference files, with the bundle in
+    a temporary cache directory and every download failing
+    """
+    cache_dir = tempfile.mkdtemp()
+    local_dir = tempfile.mkdtemp()
+    xdg_cache_home = environ.get("XDG_CACHE_HOME")
+    download = datacache.download._download
+    environ["XDG_CACHE_HOME"] = cache_dir
+    datacache.download._download = no_download
+    try:
+        fn(local_dir)
+    finally:
+        datacache.download._download = download
+        if xdg_cache_home is None:
+            del environ["XDG_CACHE_HOME"]
+        else:
+            environ["XDG_CACHE_HOME"] = xdg_cache_home
+        shutil.rmtree(cache_dir)
+        shutil.rmtree(local_dir)
+
+def test_prepare_reference_from_local_dir():
+    def prepare(local_dir):
+        write_reference_files(local_dir)
+        main([
+            "--local-dir", local_dir,
+            "--backend", "mmap",
+            "--processes", "1",
+            "--quiet"])
+        bundle_dir = bundle_path("")
+        manifest = read_manifest(bundle_dir)
+        names = listdir(bundle_dir)
+        # every download was copied from the local directory
+        for reference_file in REFERENCE_FILES:
+            assert reference_file.filename in manifest, reference_file
+        # the transcript metadata table and its column store
+        tables = [name for name in names
+            if name.startswith("transcript_metadata")]
+        assert len(tables) == 2, tables
+        for name in tables:
+            assert name in manifest, name
+        # the sequence stores and the gene name table
+        for reference_file in transcript_data.REFERENCE_FILES:
+            store_name = splitext(reference_file.filename)[0]
+            assert store_name in manifest, store_name
+        assert gene_names.TRANSCRIPT_NAME_TABLE_FILENAME in manifest
+        # building the SQLite sequence databases reuses the downloads
+        main([
+            "--backend", "sqlite",
+            "--processes", "1",
+            "--verify",
+            "--quiet"])
+        manifest = read_manifest(bundle_dir)
+        for reference_file in transcript_data.REFERENCE_FILES:
+            db_name = splitext(reference_file.filename)[0] + ".db"
+            assert db_name in manifest, db_name
+        assert verify_directory(bundle_dir) == []
+    run_offline(prepare)
+
+def test_fetch_truncated_file():
+    def fetch(local_dir):
+        reference_file = ReferenceFile(
+            "ftp://localhost/hugo.txt", "hugo_genes.tsv", False)
+        with open(join(local_dir, "hugo_genes.tsv"), 'w') as f:
+            f.write(CONTENTS)
+        path = fetch_reference_file(reference_file, local_dir)
+        assert open(path).read() == CONTENTS
+        # an interrupted download or copy leaves part of the file behind
+        with open(path, 'w') as f:
+            f.write(CONTENTS[:100])
+        assert fetch_reference_file(reference_file, local_dir) == path
+        assert getsize(path) == len(CONTENTS)
+    run_offline(fetch)
+
+if __name__ == '__main__':
+  from dsltools import testing_helpers
+  testing_helpers.run_local_tests()
@@ -0,0 +1,114 @@
+# Copyright (c) 2014. Mount Sinai School of Medicine
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import gzip
+from os.path import join, exists
+import shutil
+import sqlite3
+import tempfile
+
+from immuno.ensembl.sequence_store import (
+    SequenceStore, build_sequence_store, sequence_store_exists, read_fasta
+)
+from immuno.ensembl.transcript_data import build_sequence_db
+
+FASTA = """>ENST0003 cds:known chromosome:GRCh37:3:1:10:1
+ATGAAA
+CCCTAG
+>ENST0001 cds:known
+ATG
+>ENST0002
+GGGTTT
+>ENST0001 repeated
+CCC
+"""
+
+def make_store(compress):
+    directory = tempfile.mkdtemp()
+    fasta_path = join(directory, "test.fa.gz" if compress else "test.fa")
+    with (gzip.open if compress else open)(fasta_path, 'wb') as f:
+        f.write(FASTA)
+    path = join(directory, "test")
+    assert not sequence_store_exists(path)
+    build_sequence_store(fasta_path, path)
+    assert sequence_store_exists(path)
+    return directory, SequenceStore(path)
+
+def check_store(store):
+    assert len(store) == 3
+    assert store.get("ENST0003") == "ATGAAACCCTAG"
+    assert store.get("ENST0001") == "ATG"
+    assert store.get("ENST0002") == "GGGTTT"
+    assert store.get("ENST0004") is None
+    assert "ENST0002" in store
+    assert "ENST" not in store
+    assert store.get_many(["ENST0001", "ENST0000"]) == \
+        {"ENST0001" : "ATG", "ENST0000" : None}
+
+def test_sequence_store():
+    directory, store = make_store(compress = False)
+    try:
+        check_store(store)
+    finally:
+        shutil.rmtree(directory)
+
+def test_sequence_store_gzip():
+    directory, store = make_store(compress = True)
+    try:
+        check_store(store)
+    finally:
+        shutil.rmtree(directory)
+
+def test_read_fasta():
+    directory = tempfile.mkdtemp()
+    try:
+        fasta_path = join(directory, "test.fa.gz")
+        with gzip.open(fasta_path, 'wb') as f:
+            f.write(FASTA)
+        assert list(read_fasta(fasta_path)) == [
+            ("ENST0003", "ATGAAACCCTAG"),
+            ("ENST0001", "ATG"),
+            ("ENST0002", "GGGTTT"),
+            ("ENST0001", "CCC"),
+        ]
+    finally:
+        shutil.rmtree(directory)
+
+def test_sequence_db():
+    directory = tempfile.mkdtemp()
+    try:
+        fasta_path = join(directory, "test.fa")
+        with open(fasta_path, 'w') as f:
+            f.write(FASTA)
+        db_path = join(directory, "test.db")
+        build_sequence_db(fasta_path, db_path, "CDS")
+        assert not exists(db_path + ".tmp")
+        db = sqlite3.connect(db_path)
+        rows = db.execute("select id, seq from CDS order by id").fetchall()
+        assert rows == [
+            ("ENST0001", "ATG"),
+            ("ENST0002", "GGGTTT"),
+            ("ENST0003", "ATGAAACCCTAG"),
+        ]
+        plan = db.execute(
+            "explain query plan select seq from CDS where id = ?",
+            ("ENST0002",)).fetchall()
+        assert "CDS_id" in str(plan)
+        db.close()
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+  from dsltools import testing_helpers
+  testing_helpers.run_local_tests()
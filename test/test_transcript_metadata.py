@@ -0,0 +1,102 @@
+# Copyright (c) 2014. Mount Sinai School of Medicine
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from os.path import join
+import shutil
+import tempfile
+
+from immuno.ensembl.transcript_metadata import (
+    _build_transcript_metadata,
+    STANDARD_CONTIGS,
+    GENE_HEADER,
+    SEQ_REGION_HEADER,
+    EXON_HEADER,
+    TRANSCRIPT_HEADER,
+    TRANSLATION_HEADER,
+)
+
+def write_dump(directory, name, header, rows):
+    """
+    Write rows given as dictionaries to a MySQL-style dump, filling in
+    every column which isn't given
+    """
+    path = join(directory, name + ".txt")
+    with open(path, 'w') as f:
+        for row in rows:
+            f.write("\t".join(
+                str(row.get(column, 1)) for column in header) + "\n")
+    return path
+
+def make_dumps(directory):
+    seq_region = write_dump(directory, "seq_region", SEQ_REGION_HEADER, [
+        {'seq_region_id' : 1, 'name' : '1'},
+        {'seq_region_id' : 2, 'name' : 'HSCHR6_MHC_COX'},
+    ])
+    gene = write_dump(directory, "gene", GENE_HEADER, [
+        {'gene_id' : 2, 'seq_region_id' : 2, 'canonical_transcript_id' : 20,
+            'stable_id' : 'ENSG2'},
+        {'gene_id' : 1, 'seq_region_id' : 1, 'canonical_transcript_id' : 11,
+            'stable_id' : 'ENSG1', 'description' : 'first gene'},
+    ])
+    transcript = write_dump(directory, "transcript", TRANSCRIPT_HEADER, [
+        {'transcript_id' : transcript_id, 'gene_id' : gene_id,
+            'biotype' : 'protein_coding', 'stable_id' : 'ENST%d' % transcript_id}
+        for (transcript_id, gene_id) in [(10, 1), (12, 1), (11, 1), (20, 2)]
+    ])
+    # transcript 10 doesn't have a translation
+    translation = write_dump(directory, "translation", TRANSLATION_HEADER, [
+        {'transcript_id' : transcript_id, 'stable_id' : 'ENSP%d' % transcript_id}
+        for transcript_id in [11, 12, 20]
+    ])
+    exon = write_dump(directory, "exon", EXON_HEADER, [
+        {'exon_id' : exon_id, 'seq_region_id' : 1,
+            'seq_region_start' : exon_id * 10, 'stable_id' : 'ENSE%d' % exon_id}
+        for exon_id in [102, 101, 103, 201]
+    ])
+    exon_transcript = write_dump(
+        directory, "exon_transcript", ['exon_id', 'transcript_id', 'rank'], [
+            {'exon_id' : 103, 'transcript_id' : 12, 'rank' : 2},
+            {'exon_id' : 101, 'transcript_id' : 12, 'rank' : 1},
+            {'exon_id' : 101, 'transcript_id' : 11, 'rank' : 1},
+            {'exon_id' : 102, 'transcript_id' : 11, 'rank' : 2},
+            {'exon_id' : 101, 'transcript_id' : 10, 'rank' : 1},
+            {'exon_id' : 201, 'transcript_id' : 20, 'rank' : 1},
+        ])
+    return [gene, seq_region, exon, transcript, translation, exon_transcript]
+
+def test_build_transcript_metadata():
+    directory = tempfile.mkdtemp()
+    try:
+        n_rows, get_column = _build_transcript_metadata(
+            make_dumps(directory), STANDARD_CONTIGS)
+        assert n_rows == 4
+        # transcripts in order of their first exon in the exon dump,
+        # then each transcript's exons in the same order
+        assert list(get_column('stable_id_transcript')) == \
+            ['ENST11', 'ENST11', 'ENST12', 'ENST12']
+        assert list(get_column('exon_id')) == [102, 101, 101, 103]
+        assert list(get_column('rank')) == [2, 1, 1, 2]
+        assert list(get_column('seq_region_start_exon')) == \
+            [1020, 1010, 1010, 1030]
+        assert list(get_column('is_canonical')) == [True, True, False, False]
+        assert list(get_column('stable_id_translation', 2, 4)) == \
+            ['ENSP12', 'ENSP12']
+        assert set(get_column('name')) == set(['1'])
+        assert set(get_column('description_gene')) == set(['first gene'])
+    finally:
+        shutil.rmtree(directory)
+
+if __name__ == '__main__':
+  from dsltools import testing_helpers
+  testing_helpers.run_local_tests()
@@ -0,0 +1,54 @@
+# Copyright (c) 2014. Mount Sinai School of Medicine
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+import pandas as pd
+
+from immuno.ensembl.transcript_model import TranscriptModel
+
+intervals = [(7,13), (17,19), (21, 24), (35, 45), (47, 50), (60, 70)]
+
+def make_model(forward = True):
+    return TranscriptModel(
+        "ENST0",
+        [start for (start, _) in intervals],
+        [end for (_, end) in intervals],
+        forward = forward,
+        five_prime_utr_length = 3,
+        cds_start_phase = 0)
+
+def test_transcript_model_length():
+    model = make_model()
+    assert model.length == 7 + 3 + 4 + 11 + 4 + 11, model.length
+
+def test_transcript_model_exon_offsets():
+    model = make_model()
+    assert model.exon_offsets == [0, 7, 10, 14, 25, 29], model.exon_offsets
+
+def test_transcript_model_from_exons():
+    exons = pd.DataFrame({
+        'exon_id' : [3, 1, 2],
+        'seq_region_start_exon' : [60, 7, 35],
+        'seq_region_end_exon' : [70, 13, 45],
+        'start_exon_id' : [2, 2, 2],
+        'seq_start' : [4, 4, 4],
+    })
+    forward = TranscriptModel.from_exons("ENST0", exons, True, 0)
+    assert forward.exon_starts == [7, 35, 60]
+    assert forward.five_prime_utr_length == 7 + 3
+    reverse = TranscriptModel.from_exons("ENST0", exons, False, 0)
+    assert reverse.five_prime_utr_length == 11 + 3
+
+if __name__ == '__main__':
+  from dsltools import testing_helpers
+  testing_helpers.run_local_tests()
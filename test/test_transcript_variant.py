@@ -115,6 +115,75 @@ def test_peptide_from_transcript_variant_PAR():
             max_length = None)
     assert peptide is not None
 
+def test_peptides_from_transcript_variants_BRAF_V600K():
+    """
+    BRAF V600K (c.1798_1799GT>AA) reported as two separate SNVs, which
+    are V600M and V600E on their own
+    """
+    transcript_id = 'ENST00000288602'
+    variants = [(140453136, 'A', 'T', None), (140453137, 'C', 'T', None)]
+    separate = transcript_variant.peptides_from_transcript_variants(
+        transcript_id, variants, padding = 10)
+    assert [annot for (_, _, _, annot) in separate] == ['V600E', 'V600M']
+    combined = transcript_variant.peptides_from_transcript_variants(
+        transcript_id, variants, padding = 10, combine_codon_variants = True)
+    assert [annot for (_, _, _, annot) in combined] == ['V600K', 'V600K']
+    peptide, start, stop, _ = combined[0]
+    assert peptide[start:stop] == 'K'
+
+def test_peptides_from_transcript_variants_errors():
+    """
+    A transcript without a CDS is reported as missing even when the
+    positions of its variants couldn't be translated into transcript
+    indices, and a negative transcript index is reported as untranslatable
+    """
+    cds = {'ENST1' : 'ATGAAATAA'}
+    is_forward_strand = transcript_variant.annotation.is_forward_strand
+    get_cds = transcript_variant._ensembl.get_cds
+    try:
+        transcript_variant.annotation.is_forward_strand = lambda _: True
+        transcript_variant._ensembl.get_cds = cds.get
+        variants = [(10, 'A', 'C', -1), (11, 'A', 'C', None)]
+        missing = transcript_variant.peptides_from_transcript_variants(
+            'ENST2', variants)
+        assert [annot for (_, _, _, annot) in missing] == [
+            "Couldn't find transcript for ID ENST2",
+        ] * 2, missing
+        found = transcript_variant.peptides_from_transcript_variants(
+            'ENST1', [(10, 'A', 'C', -1), (13, 'A', 'C', 3)])
+        assert found[0][-1] == \
+            "Couldn't translate gene position 10 into transcript index " \
+            "for ENST1", found
+        assert found[1][-1] == 'K2Q', found
+    finally:
+        transcript_variant.annotation.is_forward_strand = is_forward_strand
+        transcript_variant._ensembl.get_cds = get_cds
+
+def test_codon_clusters():
+    variants = [
+        (0, 'A', 'C'),
+        (2, 'G', 'T'),
+        # shares a codon with the next one, but their bases overlap
+        (6, 'AAA', ''),
+        (7, 'A', 'G'),
+        (9, 'C', 'CA'),
+        (13, '', 'T'),
+    ]
+    clusters = transcript_variant._codon_clusters(variants)
+    assert clusters == [
+        [(0, 'A', 'C'), (2, 'G', 'T')],
+        [(6, 'AAA', '')],
+        [(7, 'A', 'G')],
+        [(9, 'C', 'CA')],
+        [(13, '', 'T')],
+    ], clusters
+
+def test_merge_variants():
+    transcript = "ATGGCCTAA"
+    merged = transcript_variant._merge_variants(
+        transcript, [(3, 'G', 'A'), (5, 'C', 'TT')])
+    assert merged == (3, 'GCC', 'ACTT'), merged
+
 
 if __name__ == '__main__':
   from dsltools import testing_helpers
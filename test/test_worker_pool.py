@@ -0,0 +1,41 @@
+# Copyright (c) 2014. Mount Sinai School of Medicine
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#       http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from immuno.worker_pool import PreloadedWorkerPool, process_rss
+
+# filled in by the parent before forking, so it's only visible
+# to the workers if they were forked afterward
+_preloaded = []
+
+def _preload():
+    _preloaded.append(10)
+
+def _add_preloaded(x):
+    return x + sum(_preloaded)
+
+def test_workers_see_preloaded_data():
+    pool = PreloadedWorkerPool(2, preload = _preload)
+    try:
+        assert pool.map(_add_preloaded, range(20)) == range(10, 30)
+    finally:
+        pool.close()
+        del _preloaded[:]
+
+def test_process_rss():
+    rss = process_rss()
+    assert rss is None or rss > 0
+
+if __name__ == '__main__':
+  from dsltools import testing_helpers
+  testing_helpers.run_local_tests()